@@ -0,0 +1,187 @@
+"""Bitmaps
+
+Compact sets of a survey's items, one bit per `Item.ordinal`, least significant
+bit first within each byte. That is the order of Postgres' get_bit and set_bit,
+so the same bytes can be tested and changed in SQL and unpacked with NumPy.
+Annotators keep their viewed and ignored items as bitmaps, which replaces
+anti-joins with the M2M tables by a bit test per item, and counting them by a
+popcount.
+
+The bitmaps are what votes read and write. The viewed and ignored relations are
+only written by `rebuild_bitmaps`, which brings them up to date with them.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Union
+import numpy as np
+from django.db.models import BinaryField, Case, F, Func, IntegerField, Value, When
+from backend.custom_types.models import QueryType
+
+Bits = Union[bytes, memoryview]
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def to_mask(bits: Bits) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(bits, dtype=np.uint8), bitorder="little").astype(
+        bool
+    )
+
+
+def from_mask(mask: np.ndarray) -> bytes:
+    return np.packbits(mask, bitorder="little").tobytes()
+
+
+def add(bits: Bits, ordinals: Iterable[int]) -> bytes:
+    """Add
+
+    Bitmap with the given ordinals set too
+    """
+    ordinals = np.fromiter(ordinals, dtype=np.int64)
+    mask = to_mask(bits)
+    if len(ordinals) and ordinals.max() >= len(mask):
+        mask = np.concatenate([mask, np.zeros(ordinals.max() + 1 - len(mask), bool)])
+    mask[ordinals] = True
+    return from_mask(mask)
+
+
+def union(*bitmaps: Bits) -> bytes:
+    size = max((len(bits) for bits in bitmaps), default=0)
+    result = np.zeros(size, dtype=np.uint8)
+    for bits in bitmaps:
+        result[: len(bits)] |= np.frombuffer(bits, dtype=np.uint8)
+    return result.tobytes()
+
+
+def contains(bits: Bits, ordinals: np.ndarray) -> np.ndarray:
+    """Contains
+
+    Boolean array of whether each ordinal is set
+    """
+    mask = to_mask(bits)
+    inside = ordinals < len(mask)
+    result = np.zeros(len(ordinals), dtype=bool)
+    result[inside] = mask[ordinals[inside]]
+    return result
+
+
+def popcount(bits: Bits) -> int:
+    return int(np.unpackbits(np.frombuffer(bits, dtype=np.uint8)).sum())
+
+
+class GetBit(Func):  # pylint: disable=abstract-method
+    function = "get_bit"
+    output_field = IntegerField()
+
+
+def exclude_set(queryset: QueryType, bits: Bits, field: str = "ordinal") -> QueryType:
+    """Exclude set
+
+    Filters out the items whose ordinal (`field`) is set in the bitmap, in SQL
+    """
+    bits = bytes(bits)
+    if not any(bits):
+        return queryset
+    return queryset.annotate(
+        excluded_bit=Case(
+            When(
+                **{f"{field}__lt": len(bits) * 8},
+                then=GetBit(Value(bits, output_field=BinaryField()), F(field)),
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    ).filter(excluded_bit=0)
+
+
+class ClearBit(Func):  # pylint: disable=abstract-method
+    template = (
+        "CASE WHEN length(%(expressions)s) > %(byte)s "
+        "THEN set_bit(%(expressions)s, %(ordinal)s, 0) ELSE %(expressions)s END"
+    )
+    output_field = BinaryField()
+
+
+def discard(annotators: QueryType, ordinal: int) -> int:
+    """Discard
+
+    Clears the ordinal in the viewed and ignored bitmaps of the annotators, in a
+    single query. Returns how many annotators were updated
+    """
+    ordinal = int(ordinal)
+    cleared: int = annotators.update(
+        **{
+            field: ClearBit(F(field), byte=ordinal // 8, ordinal=ordinal)
+            for field in ("viewed_bits", "ignored_bits")
+        }
+    )
+    return cleared
+
+
+def rebuild_bitmaps(annotators: QueryType, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """Rebuild bitmaps
+
+    Adds the viewed and ignored M2M relations of the annotators to their bitmaps,
+    then writes the relations missing from the bitmaps, which votes no longer
+    write, a batch of annotators at a time. Returns how many were rebuilt
+    """
+    model = annotators.model
+    items = model._meta.get_field("viewed").remote_field.model
+    rows = list(
+        annotators.order_by("id").values_list(
+            "id", "survey_id", "viewed_bits", "ignored_bits"
+        )
+    )
+    # Item id of each ordinal, by survey
+    item_ids: Dict[int, Dict[int, int]] = {}
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        ids = [row[0] for row in batch]
+        fields: Dict[int, Dict[str, bytes]] = {
+            annotator_id: {"viewed_bits": viewed, "ignored_bits": ignored}
+            for annotator_id, _, viewed, ignored in batch
+        }
+        related: Dict[str, Dict[int, Set[int]]] = {}
+        for relation in ("viewed", "ignored"):
+            through = model._meta.get_field(relation).remote_field.through
+            ordinals: Dict[int, Set[int]] = defaultdict(set)
+            for annotator_id, ordinal in through.objects.filter(
+                annotator_id__in=ids
+            ).values_list("annotator_id", "item__ordinal"):
+                ordinals[annotator_id].add(ordinal)
+            for annotator_id in ids:
+                field = f"{relation}_bits"
+                fields[annotator_id][field] = add(
+                    fields[annotator_id][field], ordinals[annotator_id]
+                )
+            related[relation] = ordinals
+        model.objects.bulk_update(
+            [
+                model(id=annotator_id, **values)
+                for annotator_id, values in fields.items()
+            ],
+            ["viewed_bits", "ignored_bits"],
+        )
+
+        for annotator_id, survey_id, _, _ in batch:
+            if survey_id not in item_ids:
+                item_ids[survey_id] = dict(
+                    items.objects.filter(survey_id=survey_id).values_list(
+                        "ordinal", "id"
+                    )
+                )
+        for relation in ("viewed", "ignored"):
+            through = model._meta.get_field(relation).remote_field.through
+            missing = [
+                through(annotator_id=annotator_id, item_id=item_ids[survey_id][ordinal])
+                for annotator_id, survey_id, _, _ in batch
+                for ordinal in np.flatnonzero(
+                    to_mask(fields[annotator_id][f"{relation}_bits"])
+                ).tolist()
+                # Bits of deleted items have no item, see `discard`
+                if ordinal not in related[relation][annotator_id]
+                and ordinal in item_ids[survey_id]
+            ]
+            through.objects.bulk_create(
+                missing, batch_size=batch_size, ignore_conflicts=True
+            )
+    return len(rows)
@@ -0,0 +1,105 @@
+"""Candidate selection
+
+Bounds how many items `Annotator.choose_next` has to score. Instead of every
+available item, only a shortlist is evaluated:
+- Items whose μ is closest to the current item's μ, which are the most informative
+comparisons when scores are confident
+- Items with the highest σ², which are the most informative when they are not
+- A random slice, which keeps the exploration unbiased: the items whose uuid
+follows a random one, wrapping around past the last uuid
+
+Each part is an index range scan over (survey, mu), (survey, sigma_squared) and
+(survey, uuid) respectively, and all of them are fetched in a single query
+"""
+from typing import Dict, List, Sequence, Tuple
+from django.db.models import IntegerField, Value
+from apps.crowd_bt.types import RelevanceScore
+from backend.custom_types.models import QueryType
+from backend.fields import default_gen
+from apps.items.models import Item
+
+Candidate = Tuple[int, float, float]
+
+CANDIDATE_FIELDS = ("id", "mu", "sigma_squared")
+
+# Parts a candidate can come from, see `shortlist` and `random_parts`
+ABOVE, BELOW, UNCERTAIN, AFTER, WRAPPED = range(5)
+
+
+def tagged(options: QueryType[Item], part: int) -> QueryType[Item]:
+    """Tagged
+
+    (id, μ, σ², part) of the options, so the parts fetched in a single union can
+    be told apart
+    """
+    return options.annotate(part=Value(part, IntegerField())).values_list(
+        *CANDIDATE_FIELDS, "part"
+    )
+
+
+def random_parts(options: QueryType[Item], size: int) -> List[QueryType[Item]]:
+    """Random parts
+
+    The `size` options whose uuid follows a random one, wrapping around past the
+    last uuid: those AFTER it, and the first ones, WRAPPED around, for when there
+    are less than `size` of them after it
+    """
+    # uuids are random, so the items around a random uuid are a random slice
+    pivot = default_gen()
+    return [
+        tagged(options.filter(uuid__gte=pivot), AFTER).order_by("uuid")[:size],
+        tagged(options.filter(uuid__lt=pivot), WRAPPED).order_by("uuid")[:size],
+    ]
+
+
+def fetch(parts: Sequence[QueryType[Item]], random_size: int) -> List[Candidate]:
+    """Fetch
+
+    Candidates of every part, in a single query. Wrapped candidates only fill the
+    share of the `random_size` ones that those after the pivot leave
+    """
+    rows = list(parts[0].union(*parts[1:], all=True))
+    wrapped = random_size - sum(row[-1] == AFTER for row in rows)
+    candidates: Dict[int, Candidate] = {}
+    for row in rows:
+        if row[-1] == WRAPPED:
+            if wrapped <= 0:
+                continue
+            wrapped -= 1
+        candidates[row[0]] = row[:-1]
+    return list(candidates.values())
+
+
+def random_candidates(options: QueryType[Item], size: int) -> List[Candidate]:
+    """Random candidates
+
+    Returns (id, μ, σ²) of at most `size` random items from `options`. A size of 0
+    returns every option
+    """
+    if size <= 0:
+        return list(options.values_list(*CANDIDATE_FIELDS))
+    return fetch(random_parts(options, size), size)
+
+
+def shortlist(
+    options: QueryType[Item], current: RelevanceScore, size: int
+) -> List[Candidate]:
+    """Shortlist
+
+    Returns (id, μ, σ²) of at most `size` items from `options`, split between the
+    closest to the `current` score, the most uncertain and random ones. A size of 0 returns
+    every option
+    """
+    if size <= 0:
+        return list(options.values_list(*CANDIDATE_FIELDS))
+
+    share = size // 3
+    near = share // 2
+    parts = [
+        tagged(options.filter(mu__gte=current.mu), ABOVE).order_by("mu")[
+            : share - near
+        ],
+        tagged(options.filter(mu__lt=current.mu), BELOW).order_by("-mu")[:near],
+        tagged(options, UNCERTAIN).order_by("-sigma_squared")[:share],
+    ] + random_parts(options, size - 2 * share)
+    return fetch(parts, size - 2 * share)
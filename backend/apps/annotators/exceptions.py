@@ -9,3 +9,13 @@ class InactiveAnnotatorError(ValidationError):
 class AnnotatorsQuotaError(ValidationError):
     default_detail = "Operation not allowed: You have reached your quota of annotators"
     default_code = "annotators_quota"
+
+
+class LeaseError(ValidationError):
+    default_detail = "Operation not allowed: The votes do not match the leased items"
+    default_code = "lease_mismatch"
+
+
+class LeaseExpiredError(ValidationError):
+    default_detail = "Operation not allowed: The leased items have expired"
+    default_code = "lease_expired"
@@ -0,0 +1,302 @@
+"""Leases
+
+Lets annotators on slow links take several comparisons per round trip. The items
+an annotator will be shown next are leased at once: they are chosen in a single
+pass over a SurveyState of the annotator's shortlist of candidates, each one the
+way `choose_next` would choose it after the previous one (with the current
+scores, as the votes are not known yet), and they are activated so no other annotator gets them unless the survey allows
+concurrent annotators.
+
+A batch of ordered votes is then applied in one transaction. The first vote is on
+the annotator's current pair and every vote moves on to the next leased item,
+just like consecutive calls to `Annotator.vote`, but all of the labels are scored
+at once with the batched Crowd-BT replay.
+
+Leases expire after the survey's max_time per leased item. The leased items are
+active until then, so the expired items sweep releases those of abandoned batches.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from apps.crowd_bt.replay import replay
+from apps.crowd_bt.types import AnnotatorConfidences, RelevanceScores
+from apps.items import leaderboard
+from apps.items.models import Item
+from apps.surveys.exceptions import MaxBudgetReachedError
+from apps.surveys.models import Survey
+from apps.surveys.state import SurveyState
+from apps.surveys.versions import bump_score_version
+from backend.custom_types.models import QueryType
+from . import bitmaps
+from .candidates import shortlist
+from .exceptions import LeaseError, LeaseExpiredError
+from .models import Annotator, Lease
+
+MAX_LEASE_SIZE = 50
+
+
+def lease_expiry(survey: Survey, size: int) -> Optional[datetime]:
+    if survey.max_time <= 0:
+        return None
+    return timezone.now() + timedelta(seconds=survey.max_time * size)
+
+
+def release_leases(
+    annotator: Annotator, leases: Optional[QueryType[Lease]] = None
+) -> int:
+    """Release leases
+
+    Deletes the given leases of the annotator (all of them by default) and
+    deactivates their items. Returns how many were released
+    """
+    if leases is None:
+        leases = annotator.leases.all()
+    item_ids = list(leases.values_list("item_id", flat=True))
+    if not item_ids:
+        return 0
+    if not annotator.survey.allow_concurrent:
+        Item.objects.filter(id__in=item_ids).update(active=False, active_until=None)
+    Lease.objects.filter(annotator=annotator, item_id__in=item_ids).delete()
+    return len(item_ids)
+
+
+def lease_items(annotator: Annotator, size: int) -> List[Lease]:
+    """Lease items
+
+    Replaces the annotator's leases with its next `size` items, or as many as
+    there are options for. Returns the new leases
+    """
+    survey = annotator.survey
+    if annotator.current is None:
+        # The first leased item needs an item to be compared to
+        annotator.update_items()
+    with transaction.atomic():
+        release_leases(annotator)
+        if annotator.current is None:
+            return []
+
+        # Every step chooses among the same shortlist, taken once around the
+        # current item, so no step reads or scores every item of the survey. Its
+        # random part alone has room for the whole lease
+        candidates = shortlist(
+            annotator.options(),
+            annotator.current.score,
+            survey.max_candidates and max(survey.max_candidates, 3 * size),
+        )
+        state = SurveyState.load(
+            survey,
+            survey.items.filter(
+                id__in=[annotator.current_id]
+                + [item_id for item_id, _, _ in candidates]
+            ),
+        )
+        excluded = state.bitmap_mask(annotator.seen_bits)
+        current = int(state.index([annotator.current_id])[0])
+        chosen: List[int] = []
+        for _ in range(size):
+            choice = state.choose_next(
+                current if current >= 0 else None, annotator.confidence, excluded
+            )
+            if choice is None:
+                break
+            chosen.append(choice)
+            excluded[choice] = True
+            state.view(choice)
+            current = choice
+
+        item_ids = state.ids[chosen].tolist()
+        expires = lease_expiry(survey, len(item_ids))
+        Lease.objects.bulk_create(
+            Lease(
+                annotator=annotator,
+                item_id=item_id,
+                after_id=annotator.current_id,
+                position=position,
+                expires=expires,
+            )
+            for position, item_id in enumerate(item_ids)
+        )
+        if not survey.allow_concurrent:
+            # Abandoned leased items are deactivated by the expired items sweep
+            Item.objects.filter(id__in=item_ids).update(
+                active=True, active_until=expires
+            )
+    return list(annotator.leases.select_related("item", "item__survey"))
+
+
+def vote_leased(annotator: Annotator, votes: Sequence[bool]) -> Optional[Item]:
+    """Vote leased
+
+    Applies the annotator's next votes, in order, moving on to a leased item after
+    each one. Returns the annotator's new current item
+
+    Votes beyond the survey's remaining budget are dropped
+
+    Raises:
+        LeaseError: If there are less leased items than votes, or the leases were
+        taken before the annotator's current item was assigned
+        LeaseExpiredError: If the leases have expired
+        MaxBudgetReachedError: If none of the votes fit in the survey's budget
+    """
+    with transaction.atomic():
+        votes = within_budget(annotator, votes)
+        if not votes:
+            raise MaxBudgetReachedError(
+                "Maximum survey budget reached. Cannot create more votes."
+            )
+        # Locked so the same leases cannot be voted twice by concurrent requests
+        leases = list(
+            annotator.leases.select_for_update(of=("self",)).select_related("item")[
+                : len(votes)
+            ]
+        )
+        if len(leases) < len(votes):
+            raise LeaseError(
+                f"Cannot vote {len(votes)} times with {len(leases)} leased items"
+            )
+        if not leases:
+            return annotator.current
+
+        stale = leases[0].after_id != annotator.current_id
+        expires = leases[0].expires
+        if not stale and (expires is None or expires > timezone.now()):
+            apply_votes(annotator, leases, votes)
+            return annotator.current
+        release_leases(annotator)
+
+    # Raised once the released leases are committed
+    if stale:
+        raise LeaseError("The items were leased before the annotator's last update")
+    raise LeaseExpiredError()
+
+
+def within_budget(annotator: Annotator, votes: Sequence[bool]) -> Sequence[bool]:
+    """Within budget
+
+    The first of the votes whose labels fit in the survey's remaining budget, with
+    the survey's counters as they are in the database
+    """
+    survey = annotator.survey
+    survey.refresh_from_db(fields=["annotator_count", "item_count", "label_count"])
+    remaining = max(survey.budget - survey.label_count, 0)
+    if annotator.previous is None:
+        # The first vote of the annotator has no previous item to label
+        remaining += 1
+    return votes[:remaining]
+
+
+def apply_votes(
+    annotator: Annotator, leases: Sequence[Lease], votes: Sequence[bool]
+) -> None:
+    """Apply votes
+
+    Records and scores one vote per lease and makes the last leased item the
+    annotator's current one
+    """
+    from apps.labels.locks import lock_labels
+    from apps.labels.models import Label
+
+    survey = annotator.survey
+    # Held until the votes commit, see apps.labels.locks
+    lock_labels(survey.id, shared=True)
+    # Items in the order they are shown, each vote is between consecutive ones
+    shown: List[Optional[Item]] = [annotator.previous, annotator.current] + [
+        lease.item for lease in leases
+    ]
+    pairs: List[Tuple[Item, Item]] = [
+        (shown[i + 1], shown[i]) if current_wins else (shown[i], shown[i + 1])
+        for i, current_wins in enumerate(votes)
+        if shown[i] is not None
+    ]
+
+    Label.objects.bulk_create(
+        Label(
+            survey=survey,
+            annotator=annotator,
+            winner=winner,
+            loser=loser,
+            processed=not survey.async_scoring,
+        )
+        for winner, loser in pairs
+    )
+    if survey.async_scoring:
+        from apps.labels.pending import schedule_scoring
+
+        survey_id = survey.id
+        transaction.on_commit(lambda: schedule_scoring(survey_id))
+    elif pairs:
+        score_pairs(annotator, pairs)
+
+    previous, current = shown[-2], shown[-1]
+    viewed = [lease.item_id for lease in leases]
+    if not survey.allow_concurrent:
+        annotator.current.deactivate()
+        Item.objects.filter(id__in=viewed[:-1]).update(active=False, active_until=None)
+        current.activate(survey.max_time)
+    Item.objects.filter(id__in=viewed).update(
+        view_count=F("view_count") + 1, prioritized=False
+    )
+    annotator.viewed_bits = bitmaps.add(
+        annotator.viewed_bits, [lease.item.ordinal for lease in leases]
+    )
+
+    annotator.previous, annotator.current = previous, current
+    annotator.save(
+        update_fields=["current", "previous", "viewed_bits"]
+        + ([] if survey.async_scoring else ["alpha", "beta"])
+    )
+    Lease.objects.filter(id__in=[lease.id for lease in leases]).delete()
+    annotator.leases.update(after=current)
+    # Last, as it locks the survey's row until the votes commit
+    Label.count_created(survey, len(pairs))
+
+
+def score_pairs(annotator: Annotator, pairs: Sequence[Tuple[Item, Item]]) -> None:
+    """Score pairs
+
+    Applies the annotator's (winner, loser) pairs, in order, to the items' scores
+    and the annotator's confidence in a single replay, and saves the items
+    """
+    # Scores and confidence as they are once the items are locked, like in
+    # `Annotator.bt_update`, so the ones written by concurrent votes are not lost
+    item_ids, mu, sigma_squared = zip(
+        *Item.objects.select_for_update()
+        .filter(id__in={item.id for pair in pairs for item in pair})
+        .order_by("id")
+        .values_list("id", "mu", "sigma_squared")
+    )
+    index = {item_id: position for position, item_id in enumerate(item_ids)}
+    scores = RelevanceScores(
+        np.array(mu, dtype=np.float64), np.array(sigma_squared, dtype=np.float64)
+    )
+    annotator.refresh_from_db(fields=["alpha", "beta"])
+    confidences = AnnotatorConfidences(
+        np.array([annotator.alpha], dtype=np.float64),
+        np.array([annotator.beta], dtype=np.float64),
+    )
+    replay(
+        scores,
+        confidences,
+        np.array([index[winner.id] for winner, _ in pairs], dtype=np.int64),
+        np.array([index[loser.id] for _, loser in pairs], dtype=np.int64),
+        np.zeros(len(pairs), dtype=np.int64),
+        default_confidence=annotator.confidence,
+    )
+
+    items = [
+        Item(id=item_id, mu=mu, sigma_squared=sigma_squared)
+        for item_id, mu, sigma_squared in zip(
+            item_ids, scores.mu.tolist(), scores.sigma_squared.tolist()
+        )
+    ]
+    Item.objects.bulk_update(items, ["mu", "sigma_squared"])
+    for item in {item.id: item for pair in pairs for item in pair}.values():
+        item.mu = float(scores.mu[index[item.id]])
+        item.sigma_squared = float(scores.sigma_squared[index[item.id]])
+    leaderboard.update(annotator.survey_id, [(item.id, item.mu) for item in items])
+    annotator.alpha = float(confidences.alpha[0])
+    annotator.beta = float(confidences.beta[0])
+    bump_score_version(annotator.survey_id, len(pairs))
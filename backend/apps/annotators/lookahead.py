@@ -0,0 +1,113 @@
+"""Lookahead
+
+Speculative precomputation of an annotator's next item, for surveys with
+`lookahead`. Once a vote is committed, the next one can only have two outcomes, so
+a background task chooses the item that would follow each of them, simulating the
+score update the vote would make, and caches both stamped with the survey's score
+version.
+
+The next vote takes the item precomputed for its outcome instead of running
+`Annotator.choose_next`, as long as the survey's scores went through at most
+MAX_STALENESS updates since and the item is still available to the annotator.
+Otherwise it falls back to the exact path.
+"""
+from typing import NamedTuple, Optional
+import numpy as np
+from django.core.cache import cache
+from apps.crowd_bt.online import update_annotator, update_scores
+from apps.items.models import Item
+from apps.surveys.versions import get_score_version, is_fresh
+from . import bitmaps
+from .models import Annotator
+
+# How many score updates a prediction survives
+MAX_STALENESS = 20
+# Seconds a prediction is kept, annotators usually vote well before
+TIMEOUT = 10 * 60
+
+
+class Prediction(NamedTuple):
+    """Prediction
+
+    Next item id for each outcome of the vote between `current` and `previous`
+    (None if there were no options), computed at score version `version`
+    """
+
+    version: int
+    current: int
+    previous: int
+    current_wins: Optional[int]
+    previous_wins: Optional[int]
+
+
+def lookahead_key(annotator_id: int) -> str:
+    return f"annotators:{annotator_id}:lookahead"
+
+
+def predict_next(annotator: Annotator, current_wins: bool) -> Optional[int]:
+    """Predict next
+
+    Id of the item `choose_next` would pick after the annotator's next vote, if it
+    had the given outcome. Nothing is saved
+    """
+    current, previous = annotator.current.score, annotator.previous.score
+    winner, loser = (current, previous) if current_wins else (previous, current)
+    confidence, _ = update_annotator(winner, loser, annotator.confidence)
+    new_winner, new_loser = update_scores(winner, loser, confidence)
+    next_item = annotator.choose_next(
+        new_winner if current_wins else new_loser, confidence
+    )
+    return None if next_item is None else next_item.id
+
+
+def precompute(annotator: Annotator) -> Optional[Prediction]:
+    """Precompute
+
+    Predicts the annotator's next item for both outcomes of its next vote and
+    caches them. Annotators that cannot vote on a pair yet get no prediction
+    """
+    if annotator.current is None or annotator.previous is None:
+        return None
+    # Read before predicting, so updates made meanwhile count as staleness
+    version = get_score_version(annotator.survey_id)
+    prediction = Prediction(
+        version,
+        annotator.current_id,
+        annotator.previous_id,
+        predict_next(annotator, True),
+        predict_next(annotator, False),
+    )
+    cache.set(lookahead_key(annotator.id), prediction, TIMEOUT)
+    return prediction
+
+
+def predicted_next(annotator: Annotator, current_wins: bool) -> Optional[Item]:
+    """Predicted next
+
+    The item precomputed for the given outcome of the annotator's vote, if the
+    prediction is for its current pair, fresh enough and the item is still
+    available. Otherwise None
+    """
+    prediction: Optional[Prediction] = cache.get(lookahead_key(annotator.id))
+    if (
+        prediction is None
+        or (prediction.current, prediction.previous)
+        != (annotator.current_id, annotator.previous_id)
+        or not is_fresh(annotator.survey_id, prediction.version, MAX_STALENESS)
+    ):
+        return None
+    item_id = prediction.current_wins if current_wins else prediction.previous_wins
+    if item_id is None:
+        return None
+    # Only the predicted item is checked, not every available one
+    item: Optional[Item] = (
+        Item.objects.select_related("survey")
+        .filter(id=item_id, survey_id=annotator.survey_id, active=False)
+        .first()
+    )
+    if (
+        item is None
+        or bitmaps.contains(annotator.seen_bits, np.array([item.ordinal]))[0]
+    ):
+        return None
+    return item
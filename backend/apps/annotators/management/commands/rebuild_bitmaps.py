@@ -0,0 +1,26 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from apps.surveys.models import Survey
+from apps.annotators.bitmaps import rebuild_bitmaps
+
+
+class Command(BaseCommand):
+    help = "Rebuilds annotators' viewed and ignored bitmaps from their M2M relations"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "surveys", nargs="*", help="UUIDs of the surveys to rebuild"
+        )
+        parser.add_argument("--all", action="store_true", help="Rebuild every survey")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["all"]:
+            surveys = Survey.objects.all()
+        elif options["surveys"]:
+            surveys = Survey.objects.filter(uuid__in=options["surveys"])
+        else:
+            raise CommandError("Provide survey UUIDs or --all")
+
+        for survey in surveys:
+            rebuilt = rebuild_bitmaps(survey.annotators.all())
+            self.stdout.write(f"Survey {survey.uuid}: {rebuilt} annotators rebuilt")
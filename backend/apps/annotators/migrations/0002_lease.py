@@ -0,0 +1,33 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0002_item_candidate_indexes'),
+        ('annotators', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('expires', models.DateTimeField(null=True)),
+                ('after', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='items.Item')),
+                ('annotator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leases', to='annotators.Annotator')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leases', to='items.Item')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='lease',
+            constraint=models.UniqueConstraint(fields=('annotator', 'position'), name='unique_lease_position'),
+        ),
+    ]
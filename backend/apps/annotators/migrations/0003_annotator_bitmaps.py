@@ -0,0 +1,66 @@
+# Generated by Django 3.0.5 on 2026-10-18 10:12
+
+from collections import defaultdict
+
+import numpy as np
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def to_bits(ordinals):
+    # Least significant bit first within each byte, like apps.annotators.bitmaps
+    if not ordinals:
+        return b''
+    mask = np.zeros(max(ordinals) + 1, dtype=bool)
+    mask[list(ordinals)] = True
+    return np.packbits(mask, bitorder='little').tobytes()
+
+
+def rebuild_bitmaps(apps, schema_editor):
+    # Frozen copy of the bitmaps' rebuild at the time of this migration
+    Annotator = apps.get_model('annotators', 'Annotator')
+    ids = list(Annotator.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        fields = {annotator_id: {} for annotator_id in batch}
+        for relation in ('viewed', 'ignored'):
+            through = Annotator._meta.get_field(relation).remote_field.through
+            ordinals = defaultdict(list)
+            for annotator_id, ordinal in through.objects.filter(
+                annotator_id__in=batch
+            ).values_list('annotator_id', 'item__ordinal'):
+                ordinals[annotator_id].append(ordinal)
+            for annotator_id in batch:
+                fields[annotator_id][f'{relation}_bits'] = to_bits(
+                    ordinals[annotator_id]
+                )
+        Annotator.objects.bulk_update(
+            [
+                Annotator(id=annotator_id, **values)
+                for annotator_id, values in fields.items()
+            ],
+            ['viewed_bits', 'ignored_bits'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotators', '0002_lease'),
+        ('items', '0005_item_ordinal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annotator',
+            name='ignored_bits',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name='annotator',
+            name='viewed_bits',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(rebuild_bitmaps, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,21 @@
-from typing import Callable, Optional, Any
-from numpy.random import random, choice
-from django.db import models
+from datetime import datetime
+from typing import Optional, Any
+from random import choice
+from numpy.random import random
+from django.db import models, transaction
 from django.contrib.postgres.fields import JSONField
+from apps.items import leaderboard
 from apps.items.models import Item
 from apps.surveys.models import Survey
-from apps.crowd_bt.types import Alpha, Beta, AnnotatorConfidence
+from apps.crowd_bt.types import Alpha, Beta, AnnotatorConfidence, RelevanceScore
 from apps.crowd_bt.constants import ALPHA, BETA
-from apps.crowd_bt.entropy import expected_information_gain
-from apps.crowd_bt.utils import random_argmax
+from apps.crowd_bt import vectorized
+from apps.crowd_bt.policies import SelectionContext, get_policy
 from apps.crowd_bt.online import update_scores, update_annotator
+from apps.surveys.versions import bump_score_version
 from backend.fields import ShortUUIDField
+from . import bitmaps
+from .candidates import random_candidates, shortlist
 from backend.custom_types.models import QueryType
 
 
@@ -30,6 +36,10 @@ class Annotator(models.Model):
     )
     ignored: QueryType[Item] = models.ManyToManyField(Item, related_name="ignored_by")
     viewed: QueryType[Item] = models.ManyToManyField(Item, related_name="viewed_by")
+    # `viewed` and `ignored` as bitmaps over the items' ordinals, see `bitmaps`.
+    # Votes only write the bitmaps, `rebuild_bitmaps` writes the relations from them
+    viewed_bits: bytes = models.BinaryField(default=bytes)
+    ignored_bits: bytes = models.BinaryField(default=bytes)
 
     alpha: Alpha = models.FloatField(default=ALPHA)
     beta: Beta = models.FloatField(default=BETA)
@@ -42,63 +52,102 @@ class Annotator(models.Model):
     def quality(self) -> float:
         return self.alpha / (self.alpha + self.beta)
 
+    @property
+    def seen_bits(self) -> bytes:
+        return bitmaps.union(self.viewed_bits, self.ignored_bits)
+
     @property
     def items_left(self) -> int:
-        # items_left might be annotated into the object by the viewset
-        if getattr(self, "sql_items_left", None) is not None:
-            return self.sql_items_left
-        return (
-            self.survey.items.count() - self.labels.count() - self.ignored.count() - 1
-        )
+        return max(self.survey.item_count - bitmaps.popcount(self.seen_bits), 0)
 
     def update_confidence(self, winner: Item, loser: Item) -> None:
+        # Not saved here, `assign` saves it along with the annotator's new items
         new_confidence, _ = update_annotator(winner.score, loser.score, self.confidence)
         self.alpha = new_confidence.alpha
         self.beta = new_confidence.beta
-        self.save()
 
     def bt_update(self, winner: Item, loser: Item) -> None:
+        # Scores and confidence as they are once the survey's labels lock is held,
+        # see `vote`, with the items locked, so the ones written by concurrent votes
+        # or a refit are not overwritten
+        scores = {
+            item_id: (mu, sigma_squared)
+            for item_id, mu, sigma_squared in Item.objects.select_for_update()
+            .filter(id__in=[winner.id, loser.id])
+            .order_by("id")
+            .values_list("id", "mu", "sigma_squared")
+        }
+        winner.mu, winner.sigma_squared = scores[winner.id]
+        loser.mu, loser.sigma_squared = scores[loser.id]
+        self.refresh_from_db(fields=["alpha", "beta"])
         self.update_confidence(winner, loser)
         new_winner_score, new_loser_score = update_scores(
             winner.score, loser.score, self.confidence
         )
-        winner.update_score(new_winner_score)
-        loser.update_score(new_loser_score)
+        winner.mu, winner.sigma_squared = new_winner_score
+        loser.mu, loser.sigma_squared = new_loser_score
+        Item.objects.bulk_update([winner, loser], ["mu", "sigma_squared"])
+        leaderboard.update(
+            self.survey_id, [(winner.id, winner.mu), (loser.id, loser.mu)]
+        )
+        bump_score_version(self.survey_id)
 
-    def choose_next(self) -> Optional[Item]:
+    def available_items(self) -> QueryType[Item]:
         items: QueryType[Item] = self.survey.items.filter(active=False)
+        return bitmaps.exclude_set(items, self.seen_bits)
 
-        available: QueryType[Item] = items.exclude(
-            id__in=self.ignored.only("id")
-        ).exclude(id__in=self.viewed.only("id"))
+    def options(self) -> QueryType[Item]:
+        # Available items, narrowed down to the prioritized ones and then to those
+        # with less than min_views views, whenever there are any
+        available = self.available_items()
         prioritized: QueryType[Item] = available.filter(prioritized=True)
 
         options = prioritized if prioritized.exists() else available
 
-        less_seen: QueryType[Item] = options.annotate(
-            viewed_by_count=models.Count("viewed_by")
-        ).filter(viewed_by_count__lt=self.survey.min_views)
+        less_seen: QueryType[Item] = options.filter(
+            view_count__lt=self.survey.min_views
+        )
 
-        options = less_seen if less_seen.exists() else options
+        return less_seen if less_seen.exists() else options
 
-        chosen: Optional[Item] = None
+    def choose_next(
+        self,
+        current_score: Optional[RelevanceScore] = None,
+        confidence: Optional[AnnotatorConfidence] = None,
+    ) -> Optional[Item]:
+        # current_score and confidence replace the current item's score and the
+        # annotator's confidence, to choose as if they had been updated
+        options = self.options()
+        max_candidates = self.survey.max_candidates
+        # epsilon greedy
+        if random() < self.survey.epsilon or self.current is None:
+            candidates = random_candidates(options, max_candidates)
+            if not candidates:
+                return None
+            return Item.objects.select_related("survey").get(id=choice(candidates)[0])
 
-        list_options = list(options.only("mu", "sigma_squared"))
+        if current_score is None:
+            current_score = self.current.score
+        candidates = shortlist(options, current_score, max_candidates)
+        if not candidates:
+            return None
 
-        if list_options:
-            # epsilon greedy
-            if random() < self.survey.epsilon or self.current is None:
-                chosen = choice(list_options)
-            else:
-                previous = self.current.score
-                annotator = self.confidence
-                gamma = self.survey.gamma
-                func: Callable[[Item], float] = lambda item: expected_information_gain(
-                    item.score, previous, annotator, gamma=gamma
-                )
-                chosen = random_argmax(func, list_options)
-        return chosen
+        ids, mus, sigmas_squared = zip(*candidates)
+        policy = get_policy(self.survey.selection_policy)
+        scores = policy(
+            vectorized.as_scores(mus, sigmas_squared),
+            SelectionContext(
+                current_score,
+                self.confidence if confidence is None else confidence,
+                gamma=self.survey.gamma,
+                interpolate=self.survey.interpolate_gain,
+            ),
+        )
+        return Item.objects.select_related("survey").get(
+            id=ids[vectorized.random_argmax(scores)]
+        )
 
+    @transaction.atomic
     def vote(self, current_wins: bool) -> Optional[Item]:
         if self.current is None:
             # If current is none, assume there are inactive items left
@@ -106,28 +155,64 @@ class Annotator(models.Model):
 
         # If this is not the first vote
         if self.previous is not None:
+            from apps.labels.locks import lock_labels
             from apps.labels.models import Label
 
-            if current_wins:
-                Label.create_label(self, self.current, self.previous)
-                self.bt_update(self.current, self.previous)
+            winner, loser = (
+                (self.current, self.previous)
+                if current_wins
+                else (self.previous, self.current)
+            )
+            next_item = None
+            if self.survey.lookahead:
+                from .lookahead import predicted_next
+
+                next_item = predicted_next(self, current_wins)
+
+            # Held until the vote commits, see apps.labels.locks
+            lock_labels(self.survey_id, shared=True)
+            if self.survey.async_scoring:
+                from apps.labels.pending import schedule_scoring
+
+                # Scores are updated by a worker, see apps.labels.pending
+                Label.create_label(self, winner, loser, processed=False, counted=False)
+                survey_id = self.survey_id
+                transaction.on_commit(lambda: schedule_scoring(survey_id))
+                next_item = self.update_items(next_item=next_item)
             else:
-                Label.create_label(self, self.previous, self.current)
-                self.bt_update(self.previous, self.current)
+                Label.create_label(self, winner, loser, counted=False)
+                self.bt_update(winner, loser)
+                next_item = self.update_items(
+                    confidence_updated=True, next_item=next_item
+                )
+            # Updating the survey's counters locks its row until the vote commits, so
+            # it is done last, once the next item is chosen
+            Survey.update_counts(self.survey_id, label_count=1)
+            return next_item
 
         return self.update_items()
 
+    @transaction.atomic
     def ignore(self) -> Optional[Item]:
         if self.current is None:
             return None
 
-        self.ignored.add(self.current)
+        self.ignored_bits = bitmaps.add(self.ignored_bits, [self.current.ordinal])
 
         return self.update_items()
 
-    def update_items(self) -> Optional[Item]:
+    def update_items(
+        self, confidence_updated: bool = False, next_item: Optional[Item] = None
+    ) -> Optional[Item]:
+        # next_item may have been chosen in advance, see `lookahead`
+        if next_item is None:
+            next_item = self.choose_next()
+        return self.assign(next_item, confidence_updated)
+
+    def assign(
+        self, next_item: Optional[Item], confidence_updated: bool = False
+    ) -> Optional[Item]:
         survey = self.survey
-        next_item = self.choose_next()
 
         if self.current is not None:
             self.previous = self.current
@@ -135,16 +220,40 @@ class Annotator(models.Model):
                 self.current.deactivate()
 
         self.current = next_item
-        self.save()
+        if next_item is not None:
+            self.viewed_bits = bitmaps.add(self.viewed_bits, [next_item.ordinal])
+        # alpha and beta are only written when `bt_update` changed them, otherwise
+        # they could overwrite the ones written by the async scoring worker
+        self.save(
+            update_fields=["current", "previous", "viewed_bits", "ignored_bits"]
+            + (["alpha", "beta"] if confidence_updated else [])
+        )
 
         if self.current is not None:
-            if not survey.allow_concurrent:
-                self.current.activate()
-                self.current.schedule_deactivate(survey.max_time)
-            self.current.deprioritize()
-            self.viewed.add(self.current)
+            # Unless concurrent annotators are allowed, it is also activated so no
+            # other annotator is assigned the same item
+            self.current.view(None if survey.allow_concurrent else survey.max_time)
+            if survey.lookahead and self.previous is not None:
+                from .tasks import precompute_next_items
+
+                annotator_id = self.id
+                transaction.on_commit(lambda: precompute_next_items.delay(annotator_id))
         return self.current
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        # pylint: disable=arguments-differ
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            Survey.update_counts(self.survey_id, annotator_count=1)
+
+    @transaction.atomic
+    def delete(self, *args: Any, **kwargs: Any) -> Any:
+        # pylint: disable=arguments-differ
+        deleted = super().delete(*args, **kwargs)
+        Survey.update_counts(self.survey_id, annotator_count=-1)
+        return deleted
+
     @classmethod
     def create_annotator(cls, **data: Any) -> "Annotator":
         survey: Survey = data["survey"]
@@ -155,3 +264,31 @@ class Annotator(models.Model):
         annotator.save()
         annotator.update_items()
         return annotator
+
+
+class Lease(models.Model):
+    """Lease
+
+    An item reserved for one of an annotator's upcoming comparisons. An
+    annotator's leases are compared in `position` order, the first one against
+    the `after` item, which must be the annotator's current item, and expire at
+    `expires` (never if null). See `leases`
+    """
+
+    annotator: Annotator = models.ForeignKey(
+        Annotator, on_delete=models.CASCADE, related_name="leases"
+    )
+    item: Item = models.ForeignKey(
+        Item, on_delete=models.CASCADE, related_name="leases"
+    )
+    after: Item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="+")
+    position: int = models.PositiveSmallIntegerField()
+    expires: Optional[datetime] = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["annotator", "position"], name="unique_lease_position"
+            )
+        ]
@@ -0,0 +1,191 @@
+"""Scheduler
+
+Chooses the next item of many annotators of a survey at once. Instead of every
+annotator scanning the candidates on its own (and racing for the same inactive
+item), the survey is loaded once as a SurveyState and the selection policy score
+(the expected information gain by default) of each annotator's shortlist of
+options is computed with vectorized NumPy code. Blocks of annotators are then
+matched to items maximizing their total score, so no two annotators get the same
+item unless the survey allows concurrent annotators.
+"""
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from django.db import transaction
+from apps.crowd_bt import vectorized
+from apps.crowd_bt.policies import SelectionContext, get_policy
+from apps.crowd_bt.types import RelevanceScores
+from apps.items.models import Item
+from apps.surveys.state import SurveyState
+from .models import Annotator
+
+# Gain given to unavailable pairs so the assignment only picks them when forced to
+UNAVAILABLE = -1e9
+# Annotators matched at once. Each one has at most max_candidates candidates, so
+# this bounds a block's gains matrix to MATCH_BLOCK² × max_candidates entries
+MATCH_BLOCK = 100
+
+
+def candidate_gains(
+    state: SurveyState,
+    annotator: Annotator,
+    options: np.ndarray,
+    current: int,
+    explore: bool,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Candidate gains
+
+    At most the survey's max_candidates of the annotator's `options` dense indexes,
+    and the gain of showing each one to it. Exploring annotators get random options
+    with random gains, the others a shortlist scored by the selection policy, like
+    `Annotator.choose_next`
+    """
+    size = state.survey.max_candidates
+    if explore:
+        if 0 < size < len(options):
+            options = np.random.choice(options, size, replace=False)
+        return options, np.random.random(len(options))
+
+    options = state.shortlist(options, current, size)
+    policy = get_policy(state.survey.selection_policy)
+    gains = policy(
+        RelevanceScores(state.mu[options], state.sigma_squared[options]),
+        SelectionContext(
+            state.score(current),
+            annotator.confidence,
+            gamma=state.survey.gamma,
+            interpolate=state.survey.interpolate_gain,
+        ),
+    )
+    scored = ~np.isnan(gains)
+    return options[scored], gains[scored]
+
+
+def gains_matrix(
+    candidates: Sequence[Tuple[np.ndarray, np.ndarray]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Gains matrix
+
+    Matrix of the gains of each row's candidate columns, and the columns it spans:
+    the union of the candidates. Other columns of a row are UNAVAILABLE
+    """
+    columns = (
+        np.unique(np.concatenate([row_columns for row_columns, _ in candidates]))
+        if candidates
+        else np.empty(0, dtype=np.int64)
+    )
+    gains = np.full((len(candidates), len(columns)), UNAVAILABLE)
+    for row, (row_columns, row_gains) in enumerate(candidates):
+        gains[row, np.searchsorted(columns, row_columns)] = row_gains
+    return gains, columns
+
+
+def match(gains: np.ndarray, unique: bool = True) -> List[Optional[int]]:
+    """Match
+
+    Column chosen for each row of the gains matrix, or None if it has no available
+    column. With `unique`, no column is chosen twice and the total gain is maximized
+    """
+    n_rows, n_columns = gains.shape
+    available = gains > UNAVAILABLE
+    if not n_rows or not n_columns:
+        return [None] * n_rows
+    if not unique:
+        return [
+            vectorized.random_argmax(row) if row_available.any() else None
+            for row, row_available in zip(gains, available)
+        ]
+
+    # An optimal matching only uses each row's n_rows best columns: any other column
+    # can be swapped for one of them that is left free and gains at least as much
+    columns = np.arange(n_columns)
+    if n_columns > n_rows:
+        best = np.argpartition(-gains, n_rows - 1, axis=1)[:, :n_rows]
+        columns = np.unique(best)
+    rows, matched = linear_sum_assignment(gains[:, columns], maximize=True)
+
+    choices: List[Optional[int]] = [None] * n_rows
+    for row, column in zip(rows.tolist(), columns[matched].tolist()):
+        if available[row, column]:
+            choices[row] = column
+    return choices
+
+
+def choose(state: SurveyState, annotators: Sequence[Annotator]) -> List[Optional[int]]:
+    """Choose
+
+    Dense index of the next item of each annotator, or None if it has no options.
+    Annotators with a current item are matched first, by policy score. Those
+    that explore (without a current item, or with probability epsilon) are then
+    matched to random options among the remaining ones. Annotators are matched
+    MATCH_BLOCK at a time, each block to the items left by the previous ones
+    """
+    unique = not state.survey.allow_concurrent
+    currents = state.index(
+        -1 if annotator.current_id is None else annotator.current_id
+        for annotator in annotators
+    )
+    explore = (currents < 0) | (
+        np.random.random(len(annotators)) < state.survey.epsilon
+    )
+
+    choices: List[Optional[int]] = [None] * len(annotators)
+    taken = np.zeros(len(state), dtype=bool)
+    for rows in (np.flatnonzero(~explore), np.flatnonzero(explore)):
+        for start in range(0, len(rows), MATCH_BLOCK):
+            block = rows[start : start + MATCH_BLOCK].tolist()
+            gains, columns = gains_matrix(
+                [
+                    candidate_gains(
+                        state,
+                        annotators[row],
+                        np.flatnonzero(
+                            state.options(state.bitmap_mask(annotators[row].seen_bits))
+                            & ~taken
+                        ),
+                        int(currents[row]),
+                        bool(explore[row]),
+                    )
+                    for row in block
+                ]
+            )
+            for row, column in zip(block, match(gains, unique)):
+                choices[row] = None if column is None else int(columns[column])
+                if unique and column is not None:
+                    taken[columns[column]] = True
+    return choices
+
+
+def assign_next(
+    annotators: Sequence[Annotator], waiting_only: bool = False
+) -> List[Annotator]:
+    """Assign next
+
+    Chooses and assigns the next item of every annotator, which must all belong to
+    the same survey, in a single pass. The annotators are locked and read again
+    first, so concurrent votes and skips are not overwritten, and with
+    `waiting_only` those that got a current item meanwhile are left out. Returns
+    the assigned annotators
+    """
+    if not annotators:
+        return []
+    survey = annotators[0].survey
+    with transaction.atomic():
+        queryset = (
+            Annotator.objects.select_for_update(of=("self",))
+            .select_related("survey", "current")
+            .filter(id__in=[annotator.id for annotator in annotators])
+            .order_by("id")
+        )
+        if waiting_only:
+            queryset = queryset.filter(current__isnull=True)
+        locked = list(queryset)
+        state = SurveyState.load(survey)
+        choices = choose(state, locked)
+
+        items = Item.objects.in_bulk(
+            [int(state.ids[choice]) for choice in choices if choice is not None]
+        )
+        for annotator, choice in zip(locked, choices):
+            annotator.assign(None if choice is None else items[int(state.ids[choice])])
+    return locked
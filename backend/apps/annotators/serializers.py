@@ -10,8 +10,9 @@ from apps.surveys.fields import (
     SurveyHyperlinkedRelatedField,
 )
 from apps.items.serializers import ItemSerializer
-from .models import Annotator
+from .models import Annotator, Lease
 from .exceptions import AnnotatorsQuotaError
+from .leases import MAX_LEASE_SIZE, release_leases, vote_leased
 
 
 class AnnotatorSerializer(
@@ -43,7 +44,7 @@ class AnnotatorSerializer(
         survey: Survey = Survey.objects.get(uuid=survey_id)
         if (
             survey.max_annotators > 0
-            and survey.max_annotators <= survey.annotators.count()
+            and survey.max_annotators <= survey.annotator_count
         ):
             raise AnnotatorsQuotaError()
         validated_data["survey"] = survey
@@ -98,6 +99,8 @@ class IgnoreSerializer(PrefetchMixin, serializers.ModelSerializer):
     )
 
     def update(self, instance: Annotator, validated_data: Any) -> Annotator:
+        # Leases are taken after the current item, which is about to change
+        release_leases(instance)
         instance.ignore()
         return instance
 
@@ -118,6 +121,7 @@ class IgnoreSerializer(PrefetchMixin, serializers.ModelSerializer):
             "items_left",
         ]
         select_related_fields = [
+            "survey",
             "current",
             "current__survey",
             "previous",
@@ -132,8 +136,55 @@ class VoteSerializer(IgnoreSerializer):
     )
 
     def update(self, instance: Annotator, validated_data: Any) -> Annotator:
+        release_leases(instance)
         instance.vote(**validated_data)
         return instance
 
     class Meta(IgnoreSerializer.Meta):
         fields = IgnoreSerializer.Meta.fields + ["current_wins"]
+
+
+class AssignSerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    annotators = serializers.ListField(
+        child=serializers.CharField(),
+        label=(
+            "Ids of the annotators. Defaults to every active annotator of the survey "
+            "waiting for an item"
+        ),
+        required=False,
+    )
+
+
+class LeaseSerializer(PrefetchMixin, serializers.ModelSerializer):
+    item = ItemSerializer(label="Leased item's data", read_only=True)
+
+    class Meta:
+        model = Lease
+        fields = ["position", "item", "expires"]
+        read_only_fields = fields
+        select_related_fields = ["item", "item__survey"]
+
+
+class LeaseRequestSerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    size = serializers.IntegerField(
+        label="How many upcoming items to lease", min_value=1, max_value=MAX_LEASE_SIZE,
+    )
+
+
+class BatchVoteSerializer(IgnoreSerializer):
+    votes = serializers.ListField(
+        child=serializers.BooleanField(),
+        label="Whether the current item is the winner, for each leased item in order",
+        min_length=1,
+        max_length=MAX_LEASE_SIZE,
+        write_only=True,
+    )
+    leases = LeaseSerializer(label="Items still leased", many=True, read_only=True)
+
+    def update(self, instance: Annotator, validated_data: Any) -> Annotator:
+        vote_leased(instance, validated_data["votes"])
+        return instance
+
+    class Meta(IgnoreSerializer.Meta):
+        fields = IgnoreSerializer.Meta.fields + ["votes", "leases"]
+        read_only_fields = IgnoreSerializer.Meta.read_only_fields + ["leases"]
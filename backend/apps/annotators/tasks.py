@@ -0,0 +1,15 @@
+from celery import shared_task
+
+
+@shared_task
+def precompute_next_items(annotator_id: int) -> None:
+    from .lookahead import precompute
+    from .models import Annotator
+
+    try:
+        annotator: Annotator = Annotator.objects.select_related(
+            "survey", "current", "previous"
+        ).get(id=annotator_id)
+        precompute(annotator)
+    except Annotator.DoesNotExist:
+        pass
@@ -1,3 +1,594 @@
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import numpy as np
+from rest_framework.test import APIClient
+from apps.crowd_bt.entropy import expected_information_gain
+from apps.crowd_bt.online import update_annotator, update_scores
+from apps.surveys.exceptions import MaxBudgetReachedError
+from apps.surveys.models import Survey
+from apps.surveys.state import SurveyState
+from apps.surveys.versions import bump_score_version
+from apps.items.models import Item
+from .models import Annotator
+from . import bitmaps
+from .candidates import random_candidates, shortlist
+from .exceptions import LeaseError, LeaseExpiredError
+from .leases import lease_items, vote_leased
+from .lookahead import MAX_STALENESS, precompute, predicted_next
+from .scheduler import (
+    MATCH_BLOCK,
+    UNAVAILABLE,
+    assign_next,
+    candidate_gains,
+    choose,
+    gains_matrix,
+    match,
+)
 
-# Create your tests here.
+
+class ChooseNextTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey", owner=owner, epsilon=0, min_views=0
+        )
+        self.items = [
+            Item.objects.create(
+                name=f"item {i}", survey=self.survey, mu=i / 4, sigma_squared=1 + i / 3
+            )
+            for i in range(8)
+        ]
+
+    def test_choose_next_maximizes_information_gain(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.refresh_from_db()
+        previous = annotator.current
+        candidates = Item.objects.filter(survey=self.survey).exclude(id=previous.id)
+        gamma = self.survey.gamma
+        expected = max(
+            candidates,
+            key=lambda item: expected_information_gain(
+                item.score, previous.score, annotator.confidence, gamma=gamma
+            ),
+        )
+        self.assertEqual(annotator.choose_next(), expected)
+
+    def test_choose_next_with_policy(self):
+        self.survey.selection_policy = "uncertainty"
+        self.survey.save()
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.refresh_from_db()
+        expected = (
+            Item.objects.filter(survey=self.survey)
+            .exclude(id=annotator.current_id)
+            .order_by("-sigma_squared")
+            .first()
+        )
+        self.assertEqual(annotator.choose_next(), expected)
+
+    def test_choose_next_without_options(self):
+        Item.objects.filter(survey=self.survey).update(active=True)
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        self.assertIsNone(annotator.current)
+        self.assertIsNone(annotator.choose_next())
+
+
+class CandidatesTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner)
+        for i in range(30):
+            Item.objects.create(
+                name=f"item {i}", survey=self.survey, mu=i, sigma_squared=1 / (i + 1)
+            )
+        self.options = self.survey.items.all()
+
+    def test_shortlist_is_bounded(self):
+        current = self.survey.items.get(mu=15)
+        candidates = shortlist(self.options.exclude(id=current.id), current, 9)
+        self.assertLessEqual(len(candidates), 9)
+        mus = {mu for _, mu, _ in candidates}
+        # Closest μ above and below, and the three highest σ²
+        self.assertTrue({16, 14, 0, 1, 2} <= mus)
+
+    def test_shortlist_without_bound(self):
+        current = self.survey.items.get(mu=15)
+        self.assertEqual(len(shortlist(self.options, current, 0)), 30)
+
+    def test_random_candidates(self):
+        for _ in range(10):
+            candidates = random_candidates(self.options, 4)
+            self.assertEqual(len(candidates), 4)
+            self.assertEqual(len(set(candidates)), 4)
+
+    def test_random_slice_wraps_around(self):
+        # Only the last item follows the last uuid, the rest are the first ones
+        ids = list(self.options.order_by("uuid").values_list("id", flat=True))
+        last = self.options.get(id=ids[-1]).uuid
+        current = self.survey.items.get(mu=15)
+        with patch("apps.annotators.candidates.default_gen", return_value=last):
+            candidates = random_candidates(self.options, 4)
+            self.assertEqual(
+                {item_id for item_id, _, _ in candidates}, {ids[-1], *ids[:3]}
+            )
+            candidates = shortlist(self.options.exclude(id=current.id), current, 9)
+        window = [item_id for item_id in ids[-1:] + ids if item_id != current.id][:3]
+        self.assertTrue(set(window) <= {item_id for item_id, _, _ in candidates})
+
+
+class SchedulerTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey",
+            owner=self.owner,
+            epsilon=0,
+            min_views=0,
+            max_time=0,
+            allow_concurrent=False,
+        )
+        for i in range(12):
+            Item.objects.create(
+                name=f"item {i}", survey=self.survey, mu=i / 4, sigma_squared=1 + i / 3
+            )
+        self.annotators = [
+            Annotator.create_annotator(survey=self.survey, name=f"annotator {i}")
+            for i in range(4)
+        ]
+
+    def test_match_maximizes_total_gain(self):
+        gains = np.array([[3.0, 2.0, 0.0], [3.0, 0.0, 0.0], [UNAVAILABLE] * 3])
+        self.assertEqual(match(gains), [1, 0, None])
+        self.assertEqual(match(gains, unique=False), [0, 0, None])
+
+    def test_assign_next_gives_distinct_items(self):
+        annotators = list(Annotator.objects.filter(survey=self.survey))
+        previous = {annotator.id: annotator.current_id for annotator in annotators}
+        assigned = {
+            annotator.id: annotator.current for annotator in assign_next(annotators)
+        }
+
+        items = [item.id for item in assigned.values()]
+        self.assertEqual(len(set(items)), len(annotators))
+        for annotator in Annotator.objects.filter(survey=self.survey):
+            self.assertEqual(annotator.current_id, assigned[annotator.id].id)
+            self.assertEqual(annotator.previous_id, previous[annotator.id])
+            self.assertTrue(annotator.current.active)
+            self.assertEqual(bitmaps.popcount(annotator.viewed_bits), 2)
+
+    def test_assign_next_runs_out_of_items(self):
+        annotators = list(Annotator.objects.filter(survey=self.survey))
+        for _ in range(20):
+            assigned = [
+                annotator.current
+                for annotator in assign_next(annotators)
+                if annotator.current
+            ]
+            self.assertEqual(len({item.id for item in assigned}), len(assigned))
+        self.assertEqual(assigned, [])
+        for annotator in Annotator.objects.filter(survey=self.survey):
+            self.assertEqual(bitmaps.popcount(annotator.viewed_bits), 12)
+
+    def test_assign_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.post(
+            reverse("api:annotator-assign", kwargs={"survey_id": self.survey.uuid}),
+            {"annotators": [self.annotators[0].uuid, self.annotators[1].uuid]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response.data[0]["current"], response.data[1]["current"])
+
+    def test_assign_endpoint_defaults_to_waiting_annotators(self):
+        Annotator.objects.filter(id=self.annotators[0].id).update(current=None)
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.post(
+            reverse("api:annotator-assign", kwargs={"survey_id": self.survey.uuid}),
+            {},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [annotator["id"] for annotator in response.data],
+            [str(self.annotators[0].uuid)],
+        )
+        for annotator in self.annotators[1:]:
+            self.assertEqual(
+                Annotator.objects.get(id=annotator.id).current_id, annotator.current_id
+            )
+
+    def test_assign_next_waiting_only(self):
+        annotators = list(Annotator.objects.filter(survey=self.survey))
+        Annotator.objects.filter(id=annotators[0].id).update(current=None)
+        assigned = assign_next(annotators, waiting_only=True)
+        self.assertEqual([annotator.id for annotator in assigned], [annotators[0].id])
+        self.assertIsNotNone(assigned[0].current)
+
+    def test_candidate_gains_are_bounded(self):
+        self.survey.max_candidates = 6
+        state = SurveyState.load(self.survey)
+        options = np.arange(len(state))
+        for explore in (False, True):
+            columns, gains = candidate_gains(
+                state, self.annotators[0], options, 5, explore
+            )
+            self.assertLessEqual(len(columns), 6)
+            self.assertEqual(len(columns), len(gains))
+            self.assertEqual(len(set(columns.tolist())), len(columns))
+        # The closest items to the current one and the most uncertain ones
+        self.assertTrue({4, 5, 11} <= set(state.shortlist(options, 5, 6).tolist()))
+
+    def test_choose_matches_in_blocks(self):
+        self.survey.max_candidates = 3
+        state = SurveyState.load(self.survey)
+        annotators = [
+            Annotator(survey=self.survey, current_id=int(state.ids[0]))
+            for _ in range(MATCH_BLOCK + 10)
+        ]
+        choices = [choice for choice in choose(state, annotators) if choice is not None]
+        self.assertEqual(sorted(choices), np.flatnonzero(~state.active).tolist())
+
+    def test_gains_matrix_spans_candidates(self):
+        gains, columns = gains_matrix(
+            [(np.array([4, 1]), np.array([0.5, 0.2])), (np.array([1]), np.array([1.0]))]
+        )
+        self.assertEqual(columns.tolist(), [1, 4])
+        self.assertEqual(gains.tolist(), [[0.2, 0.5], [1.0, UNAVAILABLE]])
+
+
+class VoteQueriesTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def create_annotator(self, **survey_data):
+        # Without exploration, so every vote scores candidates and reads gamma
+        survey = Survey.objects.create(
+            name="survey", owner=self.owner, min_views=0, epsilon=0, **survey_data
+        )
+        for i in range(10):
+            Item.objects.create(name=f"item {i}", survey=survey)
+        annotator = Annotator.create_annotator(survey=survey, name="annotator")
+        url = reverse(
+            "api:annotator-vote",
+            kwargs={"survey_id": survey.uuid, "id": annotator.uuid},
+        )
+        # The first vote has no previous item to compare to
+        self.client.post(url, {"current_wins": True}, format="json")
+        return annotator, url
+
+    def test_vote_queries(self):
+        # Includes the savepoint of the vote transaction, the lookup of the leases it
+        # releases, the labels lock, reading the scores and confidence again once it
+        # is held and the response's items_left
+        for allow_concurrent, queries in ((True, 16), (False, 17)):
+            _, url = self.create_annotator(allow_concurrent=allow_concurrent)
+            with self.assertNumQueries(queries):
+                response = self.client.post(url, {"current_wins": True}, format="json")
+            self.assertEqual(response.status_code, 200)
+
+    def test_vote_counts_label_last(self):
+        for async_scoring in (False, True):
+            annotator, url = self.create_annotator(async_scoring=async_scoring)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(url, {"current_wins": True}, format="json")
+            writes = [
+                query["sql"]
+                for query in queries.captured_queries
+                if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+            ]
+            self.assertTrue(writes[-1].startswith('UPDATE "surveys_survey"'))
+            self.assertEqual(Survey.objects.get(id=annotator.survey_id).label_count, 1)
+
+    def test_vote_only_writes_changed_fields(self):
+        annotator, url = self.create_annotator()
+        Annotator.objects.filter(id=annotator.id).update(metadata={"edited": True})
+        Item.objects.filter(survey=annotator.survey).update(metadata={"edited": True})
+        self.client.post(url, {"current_wins": False}, format="json")
+        annotator.refresh_from_db()
+        self.assertEqual(annotator.metadata, {"edited": True})
+        self.assertEqual(annotator.labels.count(), 1)
+        self.assertFalse(
+            Item.objects.filter(survey=annotator.survey)
+            .exclude(metadata={"edited": True})
+            .exists()
+        )
+
+    def test_no_op_writes_are_skipped(self):
+        annotator, _ = self.create_annotator()
+        item = Item.objects.exclude(id=annotator.current_id).first()
+        with self.assertNumQueries(0):
+            item.deprioritize()
+            item.deactivate()
+
+
+class LookaheadTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey", owner=owner, min_views=0, lookahead=True
+        )
+        for i in range(10):
+            Item.objects.create(name=f"item {i}", survey=self.survey)
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.vote(current_wins=True)
+        self.annotator = Annotator.objects.get(id=annotator.id)
+
+    def test_precompute_predicts_both_outcomes(self):
+        prediction = precompute(self.annotator)
+        self.assertEqual(prediction.current, self.annotator.current_id)
+        self.assertEqual(prediction.previous, self.annotator.previous_id)
+        for item_id in (prediction.current_wins, prediction.previous_wins):
+            item = self.survey.items.get(id=item_id)
+            self.assertFalse(
+                bitmaps.contains(self.annotator.viewed_bits, np.array([item.ordinal]))[
+                    0
+                ]
+            )
+
+    def test_vote_uses_prediction(self):
+        prediction = precompute(self.annotator)
+        with patch.object(Annotator, "choose_next", return_value=None) as choose_next:
+            next_item = self.annotator.vote(current_wins=False)
+        self.assertEqual(next_item.id, prediction.previous_wins)
+        choose_next.assert_not_called()
+
+    def test_stale_prediction_falls_back(self):
+        precompute(self.annotator)
+        bump_score_version(self.survey.id, MAX_STALENESS + 1)
+        with patch.object(Annotator, "choose_next", return_value=None) as choose_next:
+            self.assertIsNone(self.annotator.vote(current_wins=True))
+        choose_next.assert_called_once()
+
+    def test_unavailable_prediction_falls_back(self):
+        prediction = precompute(self.annotator)
+        Item.objects.filter(id=prediction.current_wins).update(active=True)
+        with patch.object(Annotator, "choose_next", return_value=None) as choose_next:
+            self.assertIsNone(self.annotator.vote(current_wins=True))
+        choose_next.assert_called_once()
+
+    def test_seen_prediction_falls_back(self):
+        prediction = precompute(self.annotator)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                predicted_next(self.annotator, True).id, prediction.current_wins
+            )
+        item = Item.objects.get(id=prediction.current_wins)
+        self.annotator.ignored_bits = bitmaps.add(b"", [item.ordinal])
+        self.assertIsNone(predicted_next(self.annotator, True))
+
+
+class LeaseTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey",
+            owner=self.owner,
+            min_views=0,
+            max_time=0,
+            allow_concurrent=False,
+        )
+        for i in range(10):
+            Item.objects.create(name=f"item {i}", survey=self.survey)
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.vote(current_wins=True)
+        self.annotator = Annotator.objects.get(id=annotator.id)
+
+    def test_lease_items(self):
+        leases = lease_items(self.annotator, 4)
+        items = [lease.item.id for lease in leases]
+        self.assertEqual([lease.position for lease in leases], [0, 1, 2, 3])
+        self.assertEqual(len(set(items)), 4)
+        ordinals = np.array([lease.item.ordinal for lease in leases])
+        self.assertFalse(bitmaps.contains(self.annotator.viewed_bits, ordinals).any())
+        self.assertEqual(Item.objects.filter(id__in=items, active=True).count(), 4)
+
+        # The shortlist is never smaller than the lease
+        Survey.objects.filter(id=self.survey.id).update(max_candidates=2)
+        self.annotator.survey.refresh_from_db()
+        self.assertEqual(len(lease_items(self.annotator, 4)), 4)
+
+        # Leasing again releases the previous leases
+        leases = lease_items(self.annotator, 2)
+        self.assertEqual(self.annotator.leases.count(), 2)
+        self.assertEqual(self.survey.items.filter(active=True).count(), 3)
+
+    def test_vote_leased_matches_votes(self):
+        leases = lease_items(self.annotator, 3)
+        votes = [True, False, True]
+        shown = [self.annotator.previous_id, self.annotator.current_id] + [
+            lease.item.id for lease in leases
+        ]
+        # Written by a concurrent vote after the leases were taken
+        Item.objects.filter(id=self.annotator.current_id).update(
+            mu=1.5, sigma_squared=0.5
+        )
+        scores = {item.id: item.score for item in self.survey.items.all()}
+        confidence = self.annotator.confidence
+
+        vote_leased(self.annotator, votes)
+        self.assertEqual(self.annotator.current, leases[2].item)
+        self.assertEqual(self.annotator.previous, leases[1].item)
+        self.assertEqual(self.annotator.labels.count(), 3)
+        self.assertFalse(self.annotator.leases.exists())
+        self.assertEqual(list(self.survey.items.filter(active=True)), [leases[2].item])
+
+        # The same votes, one by one
+        for i, current_wins in enumerate(votes):
+            winner, loser = (
+                (shown[i + 1], shown[i]) if current_wins else (shown[i], shown[i + 1])
+            )
+            confidence, _ = update_annotator(scores[winner], scores[loser], confidence)
+            scores[winner], scores[loser] = update_scores(
+                scores[winner], scores[loser], confidence
+            )
+        annotator = Annotator.objects.get(id=self.annotator.id)
+        self.assertAlmostEqual(annotator.alpha, confidence.alpha)
+        self.assertAlmostEqual(annotator.beta, confidence.beta)
+        for item in self.survey.items.all():
+            self.assertAlmostEqual(item.mu, scores[item.id].mu)
+            self.assertAlmostEqual(item.sigma_squared, scores[item.id].sigma_squared)
+
+    def test_vote_leased_errors(self):
+        with self.assertRaises(LeaseError):
+            vote_leased(self.annotator, [True])
+        leases = lease_items(self.annotator, 2)
+        with self.assertRaises(LeaseError):
+            vote_leased(self.annotator, [True, True, True])
+
+        self.annotator.leases.update(expires=timezone.now())
+        with self.assertRaises(LeaseExpiredError):
+            vote_leased(self.annotator, [True])
+        self.assertFalse(self.annotator.leases.exists())
+        self.assertFalse(
+            Item.objects.filter(id=leases[0].item.id, active=True).exists()
+        )
+
+    def test_batch_vote_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        kwargs = {"survey_id": self.survey.uuid, "id": self.annotator.uuid}
+        response = client.post(
+            reverse("api:annotator-lease", kwargs=kwargs), {"size": 3}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+        response = client.post(
+            reverse("api:annotator-votes", kwargs=kwargs),
+            {"votes": [True, False]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["leases"]), 1)
+        self.assertEqual(self.annotator.labels.count(), 2)
+
+    def test_vote_leased_within_budget(self):
+        Survey.objects.filter(id=self.survey.id).update(min_budget=2, max_budget=2)
+        leases = lease_items(self.annotator, 3)
+        vote_leased(self.annotator, [True, True, True])
+        self.assertEqual(self.annotator.labels.count(), 2)
+        self.assertEqual(self.annotator.current, leases[1].item)
+        self.assertEqual(list(self.annotator.leases.all()), [leases[2]])
+        with self.assertRaises(MaxBudgetReachedError):
+            vote_leased(self.annotator, [True])
+
+    def test_vote_and_skip_release_leases(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        kwargs = {"survey_id": self.survey.uuid, "id": self.annotator.uuid}
+        for url, data in (
+            (reverse("api:annotator-vote", kwargs=kwargs), {"current_wins": True}),
+            (reverse("api:annotator-skip", kwargs=kwargs), {}),
+        ):
+            leases = lease_items(self.annotator, 2)
+            response = client.post(url, data, format="json")
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(self.annotator.leases.exists())
+            current = Annotator.objects.get(id=self.annotator.id).current_id
+            self.assertFalse(
+                Item.objects.filter(
+                    id__in=[lease.item.id for lease in leases], active=True
+                )
+                .exclude(id=current)
+                .exists()
+            )
+            self.annotator = Annotator.objects.get(id=self.annotator.id)
+
+
+class BitmapTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner, min_views=0)
+        self.items = [
+            Item.objects.create(name=f"item {i}", survey=self.survey) for i in range(12)
+        ]
+
+    def test_bitmaps(self):
+        bits = bitmaps.add(b"", [0, 9])
+        self.assertEqual(bits, bytes([0b1, 0b10]))
+        self.assertEqual(
+            bitmaps.popcount(bitmaps.union(bits, bitmaps.add(b"", [3]))), 3
+        )
+        np.testing.assert_array_equal(
+            bitmaps.contains(bits, np.array([0, 1, 9, 100])), [True, False, True, False]
+        )
+
+    def test_ordinals_are_dense(self):
+        self.assertEqual([item.ordinal for item in self.items], list(range(12)))
+        self.survey.refresh_from_db()
+        self.assertEqual(self.survey.item_ordinals, 12)
+
+    def test_votes_set_bits(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        viewed = {annotator.current.ordinal}
+        annotator.vote(current_wins=True)
+        viewed.add(annotator.current.ordinal)
+        ignored = {annotator.current.ordinal}
+        annotator.ignore()
+        viewed.add(annotator.current.ordinal)
+        annotator = Annotator.objects.get(id=annotator.id)
+
+        ordinals = np.arange(12)
+        np.testing.assert_array_equal(
+            bitmaps.contains(annotator.viewed_bits, ordinals),
+            np.isin(ordinals, list(viewed)),
+        )
+        np.testing.assert_array_equal(
+            bitmaps.contains(annotator.ignored_bits, ordinals),
+            np.isin(ordinals, list(ignored)),
+        )
+        self.assertFalse(annotator.viewed.exists())
+        self.assertFalse(annotator.ignored.exists())
+        self.assertEqual(annotator.items_left, 12 - len(viewed | ignored))
+        self.assertFalse(
+            annotator.available_items().filter(ordinal__in=viewed | ignored).exists()
+        )
+
+    def test_deleted_items_are_not_seen(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.vote(current_wins=True)
+        annotator.previous.delete()
+        annotator = Annotator.objects.select_related("survey").get(id=annotator.id)
+        self.assertEqual(bitmaps.popcount(annotator.viewed_bits), 1)
+        self.assertEqual(annotator.items_left, 10)
+
+    def test_rebuild_bitmaps(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.vote(current_wins=True)
+        annotator.ignore()
+        annotator = Annotator.objects.get(id=annotator.id)
+        viewed = set(np.flatnonzero(bitmaps.to_mask(annotator.viewed_bits)).tolist())
+        legacy = self.survey.items.exclude(ordinal__in=viewed).first()
+        annotator.viewed.add(legacy)
+
+        call_command("rebuild_bitmaps", self.survey.uuid, stdout=StringIO())
+        annotator = Annotator.objects.get(id=annotator.id)
+        self.assertEqual(
+            set(annotator.viewed.values_list("ordinal", flat=True)),
+            viewed | {legacy.ordinal},
+        )
+        self.assertEqual(
+            list(annotator.ignored.values_list("id", flat=True)),
+            [annotator.previous_id],
+        )
+        self.assertEqual(
+            bytes(annotator.viewed_bits), bitmaps.add(b"", viewed | {legacy.ordinal})
+        )
+        self.assertEqual(
+            bytes(annotator.ignored_bits),
+            bitmaps.add(b"", [annotator.previous.ordinal]),
+        )
@@ -1,5 +1,4 @@
 from typing import Any
-from django.db.models import Count
 from rest_framework import permissions, viewsets
 from rest_framework.decorators import action
 from rest_framework.request import Request
@@ -9,16 +8,31 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from backend.permissions.ownership import OwnsObject
 from backend.mixins.prefetch import PrefetchQuerysetModelMixin
+from backend.mixins.shared_object import SharedObjectMixin
 from backend.mixins.queryfields import QueryFieldsMixin
 from backend.custom_types.models import QueryType
+from apps.surveys.ids import get_survey_id
 from apps.surveys.exceptions import InactiveSurveyError, MaxBudgetReachedError
 from .exceptions import InactiveAnnotatorError
-from .serializers import AnnotatorSerializer, VoteSerializer, IgnoreSerializer
+from .serializers import (
+    AnnotatorSerializer,
+    AssignSerializer,
+    BatchVoteSerializer,
+    VoteSerializer,
+    IgnoreSerializer,
+    LeaseRequestSerializer,
+    LeaseSerializer,
+)
+from .leases import lease_items
 from .models import Annotator
+from .scheduler import assign_next
 
 
 class SurveyAnnotatorViewset(
-    PrefetchQuerysetModelMixin, QueryFieldsMixin, viewsets.ModelViewSet
+    SharedObjectMixin,
+    PrefetchQuerysetModelMixin,
+    QueryFieldsMixin,
+    viewsets.ModelViewSet,
 ):
     swagger_tags = ["Annotator"]
 
@@ -34,17 +48,8 @@ class SurveyAnnotatorViewset(
     queryset = Annotator.objects.all()
 
     def get_queryset(self) -> QueryType[Annotator]:
-        survey_uuid = self.kwargs.get("survey_id")
-        qs: QueryType[Annotator] = super().get_queryset().filter(
-            survey__uuid=survey_uuid
-        )
-        if self.action in ["retrieve", "list"]:
-            qs = qs.annotate(
-                sql_items_left=Count("survey__items", distinct=True)
-                - Count("labels", distinct=True)
-                - Count("ignored", distinct=True)
-                - 1
-            )
+        survey_id = get_survey_id(self.kwargs.get("survey_id"))
+        qs: QueryType[Annotator] = super().get_queryset().filter(survey_id=survey_id)
         return qs
 
     def get_serializer_class(self) -> Any:
@@ -52,6 +57,12 @@ class SurveyAnnotatorViewset(
             return VoteSerializer
         if self.action == "skip":
             return IgnoreSerializer
+        if self.action == "assign":
+            return AssignSerializer
+        if self.action == "lease":
+            return LeaseRequestSerializer
+        if self.action == "votes":
+            return BatchVoteSerializer
         return super().get_serializer_class()
 
     @swagger_auto_schema(
@@ -63,9 +74,56 @@ class SurveyAnnotatorViewset(
     def vote(self, request: Request, **kwargs: Any) -> Response:
         """Vote for an item
 
-        Votes for an item as the annotator. The parameter provided `current_wins` represents whether the current item is better than the previous. **This cannot be undone.**
+        Votes for an item as the annotator. The parameter provided `current_wins` represents whether the current item is better than the previous. Releases the annotator's leases. **This cannot be undone.**
+        """
+        annotator: Annotator = self.get_object()
+        self.check_can_vote(annotator)
+        return self.update_annotator(annotator, request)
+
+    @swagger_auto_schema(
+        responses={
+            400: "Request data is missing or contains errors, the leases expired or do not match the votes, or Annotator/Survey are inactive"
+        }
+    )
+    @action(detail=True, methods=["post"])
+    def votes(self, request: Request, **kwargs: Any) -> Response:
+        """Vote for many leased items
+
+        Applies several votes of the annotator at once, in order. The first one is on the current and previous items, and after each vote the next leased item becomes the current one, just like sending them one by one to the voting URL. There must be at least as many leased items as votes, and the votes beyond the survey's remaining budget are dropped. **This cannot be undone.**
+        """
+        annotator: Annotator = self.get_object()
+        self.check_can_vote(annotator)
+        return self.update_annotator(annotator, request)
+
+    @swagger_auto_schema(
+        responses={
+            200: LeaseSerializer(many=True),
+            400: "Request data is missing or contains errors, or Annotator/Survey are inactive",
+        }
+    )
+    @action(detail=True, methods=["post"])
+    def lease(self, request: Request, **kwargs: Any) -> Response:
+        """Lease the annotator's next items
+
+        Reserves the next items the annotator will be shown, in order, so they can be voted in a batch. Replaces any previous leases. Leases expire after the survey's `max_time` per leased item, releasing their items.
         """
         annotator: Annotator = self.get_object()
+        if not annotator.active:
+            raise InactiveAnnotatorError(
+                "Cannot lease because the annotator is inactive"
+            )
+        if not annotator.survey.active:
+            raise InactiveSurveyError("Cannot lease because the survey is inactive")
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        leases = lease_items(annotator, serializer.validated_data["size"])
+        return Response(
+            LeaseSerializer(
+                leases, many=True, context=self.get_serializer_context()
+            ).data
+        )
+
+    def check_can_vote(self, annotator: Annotator) -> None:
         if not annotator.active:
             raise InactiveAnnotatorError(
                 "Cannot vote because the annotator is inactive"
@@ -77,14 +135,13 @@ class SurveyAnnotatorViewset(
             raise MaxBudgetReachedError(
                 "Maximum survey budget reached. Cannot create more votes."
             )
-        return super().update(request, **kwargs)
 
     @swagger_auto_schema(responses={400: "Annotator/Survey are inactive"})
     @action(detail=True, methods=["post"])
     def skip(self, request: Request, **kwargs: Any) -> Response:
         """Skip the annotator's current item
 
-        Skips the current item being evaluated by the annotator. **This cannot be undone.**
+        Skips the current item being evaluated by the annotator. Releases the annotator's leases. **This cannot be undone.**
         """
         annotator = self.get_object()
         if not annotator.active:
@@ -94,7 +151,47 @@ class SurveyAnnotatorViewset(
 
         if not annotator.survey.active:
             raise InactiveSurveyError("Cannot skip because the survey is inactive")
-        return super().update(request, **kwargs)
+        return self.update_annotator(annotator, request)
+
+    def update_annotator(self, annotator: Annotator, request: Request) -> Response:
+        """Update an already fetched annotator, like `update` without fetching it again"""
+        serializer = self.get_serializer(annotator, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
+
+    @swagger_auto_schema(
+        responses={
+            200: AnnotatorSerializer(many=True),
+            400: "Request data contains errors, or the Survey is inactive",
+        }
+    )
+    @action(detail=False, methods=["post"])
+    def assign(self, request: Request, **kwargs: Any) -> Response:
+        """Assign next items to many annotators
+
+        Chooses the next item of several annotators at once, in a single pass. No two annotators get the same item unless the survey allows concurrent annotators. Defaults to every active annotator of the survey that is waiting for an item, since assigning to an annotator in the middle of a comparison drops it.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queryset = self.get_queryset().filter(active=True)
+        if not request.user.is_staff:
+            queryset = queryset.filter(survey__owner=request.user)
+        waiting_only = "annotators" not in serializer.validated_data
+        if waiting_only:
+            queryset = queryset.filter(current__isnull=True)
+        else:
+            queryset = queryset.filter(uuid__in=serializer.validated_data["annotators"])
+        annotators = list(queryset.select_related("survey", "current"))
+
+        if annotators and not annotators[0].survey.active:
+            raise InactiveSurveyError("Cannot assign because the survey is inactive")
+        annotators = assign_next(annotators, waiting_only=waiting_only)
+        return Response(
+            AnnotatorSerializer(
+                annotators, many=True, context=self.get_serializer_context()
+            ).data
+        )
 
     @swagger_auto_schema(responses={400: "Request data is missing or contains errors"})
     def create(self, *args: Any, **kwargs: Any) -> Response:
@@ -0,0 +1,235 @@
+"""Benchmark
+
+Microbenchmarks of the Crowd-BT kernels, comparing the scalar implementations
+(`online`, `entropy`, `utils`) looping over the candidates with the batch ones
+(`vectorized`, `lookup`) as the number of candidates grows, along with the cost
+of choosing a candidate with each selection policy. Every kernel scores
+all the candidates against a single current item and annotator, just like
+`Annotator.choose_next` does.
+
+It only needs NumPy and SciPy, so it runs without a database or any other service:
+
+    python -m apps.crowd_bt.benchmark --output benchmark.json
+    python -m apps.crowd_bt.benchmark --output new.json --compare benchmark.json
+
+Results are saved as JSON, so runs of different commits can be compared.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import scipy
+from . import entropy, lookup, online, policies, utils, vectorized
+from .constants import KAPPA
+from .types import AnnotatorConfidence, RelevanceScore, RelevanceScores
+
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+# Scalar paths take seconds per run above this size
+MAX_SCALAR_SIZE = 10_000
+REPEAT = 5
+# A kernel is reported as a regression when it gets this much slower
+THRESHOLD = 1.25
+
+Result = Dict[str, Any]
+Case = Tuple[str, str, Callable[[], Any]]
+
+
+def make_inputs(
+    size: int, seed: int = 0
+) -> Tuple[RelevanceScores, RelevanceScore, AnnotatorConfidence]:
+    """Make inputs
+
+    Random candidates, current item and annotator confidence
+    """
+    rng = np.random.default_rng(seed)
+    candidates = RelevanceScores(rng.normal(0, 2, size), rng.uniform(KAPPA, 1.0, size))
+    current = RelevanceScore(0.5, 0.4)
+    annotator = AnnotatorConfidence(13.7, 1.3)
+    return candidates, current, annotator
+
+
+def cases(size: int, scalar: bool) -> Iterator[Case]:
+    """Cases
+
+    (kernel, path, function) of every benchmark for a given number of candidates
+    """
+    candidates, current, annotator = make_inputs(size)
+    scores = [
+        RelevanceScore(mu, sigma_squared)
+        for mu, sigma_squared in zip(
+            candidates.mu.tolist(), candidates.sigma_squared.tolist()
+        )
+    ]
+    gains = vectorized.expected_information_gain(candidates, current, annotator)
+    gain_list = gains.tolist()
+    indexes = list(range(size))
+    # Warm the table cache, building it is not part of the query cost
+    lookup.get_table(annotator)
+
+    kernels = (
+        ("update_mu", online.update_mu, vectorized.update_mu),
+        (
+            "update_sigma_squared",
+            online.update_sigma_squared,
+            vectorized.update_sigma_squared,
+        ),
+        ("update_annotator", online.update_annotator, vectorized.update_annotator),
+        (
+            "expected_information_gain",
+            entropy.expected_information_gain,
+            vectorized.expected_information_gain,
+        ),
+    )
+    for name, scalar_kernel, batch_kernel in kernels:
+        if scalar:
+            yield name, "scalar", lambda k=scalar_kernel: [
+                k(score, current, annotator) for score in scores
+            ]
+        yield name, "batch", lambda k=batch_kernel: k(candidates, current, annotator)
+    yield "expected_information_gain", "lookup", lambda: lookup.expected_information_gain(
+        candidates, current, annotator
+    )
+
+    context = policies.SelectionContext(current, annotator)
+    for name, policy in policies.POLICIES.items():
+        yield "selection_policy", name, lambda p=policy: vectorized.random_argmax(
+            p(candidates, context)
+        )
+
+    if scalar:
+        yield "random_argmax", "scalar", lambda: utils.random_argmax(
+            gain_list.__getitem__, indexes
+        )
+        # Same search without shuffling first, isolates the cost of the shuffle
+        yield "random_argmax", "scalar_unshuffled", lambda: max(
+            indexes, key=gain_list.__getitem__
+        )
+    yield "random_argmax", "batch", lambda: vectorized.random_argmax(gains)
+
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Measure
+
+    Times `function` with enough calls per run to last at least 0.2 seconds, and
+    returns the best and mean seconds per call over `repeat` runs
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {"best": min(times), "mean": sum(times) / len(times), "number": number}
+
+
+def run(
+    sizes: Sequence[int] = SIZES,
+    max_scalar_size: int = MAX_SCALAR_SIZE,
+    repeat: int = REPEAT,
+) -> List[Result]:
+    """Run
+
+    Runs every benchmark for every number of candidates
+    """
+    results = []
+    for size in sizes:
+        for kernel, path, function in cases(size, scalar=size <= max_scalar_size):
+            timing = measure(function, repeat)
+            results.append(
+                {
+                    "kernel": kernel,
+                    "path": path,
+                    "size": size,
+                    **timing,
+                    "per_item": timing["best"] / size,
+                }
+            )
+    return results
+
+
+def environment() -> Dict[str, Optional[str]]:
+    """Environment
+
+    Versions and commit the results were measured with
+    """
+    try:
+        commit: Optional[str] = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(
+    results: List[Result], baseline: List[Result], threshold: float = THRESHOLD
+) -> List[Tuple[Result, float]]:
+    """Compare
+
+    Returns each result present in the baseline along with how many times slower
+    it got, only for those slower than `threshold`
+    """
+    previous = {
+        (result["kernel"], result["path"], result["size"]): result["best"]
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        key = (result["kernel"], result["path"], result["size"])
+        if key in previous:
+            ratio = result["best"] / previous[key]
+            if ratio > threshold:
+                regressions.append((result, ratio))
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Crowd-BT kernels")
+    parser.add_argument("--output", help="JSON file where results are saved")
+    parser.add_argument(
+        "--compare", help="JSON file of a previous run to check for regressions"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--max-scalar-size", type=int, default=MAX_SCALAR_SIZE)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.max_scalar_size, args.repeat)
+    for result in results:
+        print(
+            f"{result['kernel']:>26} {result['path']:>17} {result['size']:>7}"
+            f" {result['best'] * 1e6:>12.1f} µs {result['per_item'] * 1e9:>10.1f} ns/item"
+        )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"environment": environment(), "results": results}, output, indent=2
+            )
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(
+                results, json.load(baseline)["results"], args.threshold
+            )
+        for result, ratio in regressions:
+            print(
+                f"Regression: {result['kernel']} ({result['path']}, {result['size']})"
+                f" is {ratio:.2f}x slower"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
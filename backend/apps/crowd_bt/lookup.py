@@ -0,0 +1,206 @@
+"""Lookup tables
+
+Precomputed expected information gain. The gain only depends on the items' scores
+through μa - μb, σa² and σb², and it is linear on Ɣ:
+
+    EIG = entropy + Ɣ * annotator_entropy
+
+So, for a given annotator confidence, both terms are tabulated once over a grid of
+(μa - μb, log σa², log σb²) and queries are answered by trilinear interpolation,
+which only needs array lookups instead of `psi` and `beta` evaluations.
+
+Annotator confidences are snapped to bins evenly spaced on log2(ɑ) and log2(β),
+and each bin's tables are cached.
+"""
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+from . import vectorized
+from .types import AnnotatorConfidence, RelevanceScores
+from .constants import GAMMA, KAPPA
+from .vectorized import Scores
+
+# Grid of μa - μb. Differences outside of it are clipped
+DELTA_RANGE: Tuple[float, float] = (-6.0, 6.0)
+DELTA_POINTS = 121
+
+# Grid of log σ². Variances outside of it are clipped
+LOG_SIGMA_SQUARED_RANGE: Tuple[float, float] = (float(np.log(KAPPA)), float(np.log(2)))
+LOG_SIGMA_SQUARED_POINTS = 41
+
+# Number of annotator bins per doubling of ɑ or β
+BINS_PER_OCTAVE = 8
+
+# How many annotator bins are kept in memory
+CACHE_SIZE = 16
+
+
+class Grid(NamedTuple):
+    """Grid
+
+    Evenly spaced points of one of the tables' axes
+    """
+
+    start: float
+    stop: float
+    points: int
+
+    @property
+    def step(self) -> float:
+        return (self.stop - self.start) / (self.points - 1)
+
+    def values(self) -> np.ndarray:
+        return np.linspace(self.start, self.stop, self.points)
+
+    def locate(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Locate
+
+        Returns the index of the cell containing each value and the value's relative
+        position inside of it
+        """
+        position = np.clip((values - self.start) / self.step, 0, self.points - 1)
+        index = np.minimum(position.astype(np.int64), self.points - 2)
+        return index, position - index
+
+
+DELTA_GRID = Grid(*DELTA_RANGE, DELTA_POINTS)
+SIGMA_GRID = Grid(*LOG_SIGMA_SQUARED_RANGE, LOG_SIGMA_SQUARED_POINTS)
+
+
+def annotator_bin(annotator: AnnotatorConfidence) -> AnnotatorConfidence:
+    """Annotator bin
+
+    Snaps a confidence to the closest bin on the log2 scale
+    """
+    return AnnotatorConfidence(
+        *(
+            2 ** (round(np.log2(value) * BINS_PER_OCTAVE) / BINS_PER_OCTAVE)
+            for value in annotator
+        )
+    )
+
+
+class InformationGainTable:
+    """Information Gain Table
+
+    Tabulated expected information gain of a single annotator confidence
+    """
+
+    def __init__(self, annotator: AnnotatorConfidence) -> None:
+        self.annotator = annotator
+        delta, log_sigma_a, log_sigma_b = np.meshgrid(
+            DELTA_GRID.values(), SIGMA_GRID.values(), SIGMA_GRID.values(), indexing="ij"
+        )
+        score_a = RelevanceScores(delta, np.exp(log_sigma_a))
+        score_b = RelevanceScores(np.zeros_like(delta), np.exp(log_sigma_b))
+        # Since the gain is linear on Ɣ, two evaluations recover both terms
+        self.entropy = vectorized.expected_information_gain(
+            score_a, score_b, annotator, gamma=0
+        )
+        self.annotator_entropy = (
+            vectorized.expected_information_gain(score_a, score_b, annotator, gamma=1)
+            - self.entropy
+        )
+        self._max_error: Optional[float] = None
+
+    @property
+    def max_error(self) -> float:
+        """Max error
+
+        Largest interpolation error of the table for its own annotator and the
+        default Ɣ. Computed on first access
+        """
+        if self._max_error is None:
+            self._max_error = self.measure_error(self.annotator)
+        return self._max_error
+
+    def interpolate(
+        self, score_a: Scores, score_b: Scores, gamma: float = GAMMA,
+    ) -> np.ndarray:
+        """Interpolate
+
+        Approximate `vectorized.expected_information_gain` for the table's annotator
+        """
+        d_index, d_weight = DELTA_GRID.locate(np.asarray(score_a.mu - score_b.mu))
+        a_index, a_weight = SIGMA_GRID.locate(
+            np.broadcast_to(np.log(score_a.sigma_squared), np.shape(d_index))
+        )
+        b_index, b_weight = SIGMA_GRID.locate(
+            np.broadcast_to(np.log(score_b.sigma_squared), np.shape(d_index))
+        )
+
+        entropy = np.zeros(np.shape(d_index))
+        annotator_entropy = np.zeros(np.shape(d_index))
+        for d_corner in (0, 1):
+            d_part = d_weight if d_corner else 1 - d_weight
+            for a_corner in (0, 1):
+                a_part = d_part * (a_weight if a_corner else 1 - a_weight)
+                for b_corner in (0, 1):
+                    weight = a_part * (b_weight if b_corner else 1 - b_weight)
+                    corner = (
+                        d_index + d_corner,
+                        a_index + a_corner,
+                        b_index + b_corner,
+                    )
+                    entropy += weight * self.entropy[corner]
+                    annotator_entropy += weight * self.annotator_entropy[corner]
+        return entropy + gamma * annotator_entropy
+
+    def measure_error(
+        self, annotator: AnnotatorConfidence, gamma: float = GAMMA
+    ) -> float:
+        """Measure error
+
+        Largest absolute difference between the table and the exact gain of
+        `annotator`, which also accounts for the error of snapping it to a bin.
+        It is evaluated at the center of every cell, where interpolation is the
+        least accurate
+        """
+        delta, log_sigma_a, log_sigma_b = np.meshgrid(
+            DELTA_GRID.values()[:-1] + DELTA_GRID.step / 2,
+            SIGMA_GRID.values()[:-1] + SIGMA_GRID.step / 2,
+            SIGMA_GRID.values()[:-1] + SIGMA_GRID.step / 2,
+            indexing="ij",
+        )
+        score_a = RelevanceScores(delta, np.exp(log_sigma_a))
+        score_b = RelevanceScores(np.zeros_like(delta), np.exp(log_sigma_b))
+        exact = vectorized.expected_information_gain(
+            score_a, score_b, annotator, gamma=gamma
+        )
+        return float(np.max(np.abs(self.interpolate(score_a, score_b, gamma) - exact)))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _table(annotator: AnnotatorConfidence) -> InformationGainTable:
+    return InformationGainTable(annotator)
+
+
+def get_table(annotator: AnnotatorConfidence) -> InformationGainTable:
+    """Get table
+
+    Returns the cached table of the annotator's bin, building it if needed
+    """
+    return _table(annotator_bin(annotator))
+
+
+def expected_information_gain(
+    score_a: Scores,
+    score_b: Scores,
+    annotator: AnnotatorConfidence,
+    gamma: float = GAMMA,
+) -> np.ndarray:
+    """Expected Information Gain
+
+    Interpolated counterpart of `vectorized.expected_information_gain` for a
+    single annotator
+    """
+    return get_table(annotator).interpolate(score_a, score_b, gamma)
+
+
+def max_error(annotator: AnnotatorConfidence, gamma: float = GAMMA) -> float:
+    """Max error
+
+    Largest absolute error of the interpolated gain for the annotator, compared to
+    the exact computation
+    """
+    return get_table(annotator).measure_error(annotator, gamma)
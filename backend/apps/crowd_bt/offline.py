@@ -0,0 +1,207 @@
+"""Offline learning
+
+Full-batch counterpart of the online updaters. Instead of processing labels one at
+a time, all of a survey's labels are used at once to jointly estimate the items'
+scores and the annotators' confidences, so the result does not depend on the order
+in which the votes were cast.
+
+The estimation is an EM procedure over the Crowd-BT model:
+- E step: for every label, compute the probability that the annotator agreed with
+the true preference given the current scores and annotator's η
+- M step: update each annotator's Beta(α, β) with those probabilities and take a
+Newton step on the items' μ, weighting each comparison by them
+
+Every step is a handful of array operations over the labels plus `np.bincount`
+reductions, so the cost is linear in the number of labels and memory is bounded by
+a few arrays of that size. No label × item matrix is ever built.
+"""
+from typing import Callable, NamedTuple, Optional
+import numpy as np
+from scipy.special import expit  # pylint: disable=no-name-in-module
+from .types import AnnotatorConfidence, AnnotatorConfidences, RelevanceScores
+from .constants import ALPHA, BETA, MU, SIGMA_SQUARED
+
+# Default number of EM iterations
+MAX_ITERATIONS = 50
+
+# Default convergence tolerance on the relative change of the log likelihood
+TOLERANCE = 1e-4
+
+# Conjugate gradient iterations and residual reduction for each Newton step
+CG_ITERATIONS = 20
+CG_TOLERANCE = 1e-2
+
+
+class RefitResult(NamedTuple):
+    """Refit Result
+
+    Scores and confidences estimated by `refit`, alongside convergence information
+    """
+
+    scores: RelevanceScores
+    confidences: AnnotatorConfidences
+    iterations: int
+    converged: bool
+
+
+def scatter(
+    winners: np.ndarray, losers: np.ndarray, values: np.ndarray, n_items: int
+) -> np.ndarray:
+    """Scatter
+
+    Adds each label's value to its winner and subtracts it from its loser. This is
+    the transposed incidence matrix of the comparison graph applied to `values`
+    """
+    return np.bincount(winners, weights=values, minlength=n_items) - np.bincount(
+        losers, weights=values, minlength=n_items
+    )
+
+
+def conjugate_gradient(
+    matvec: Callable[[np.ndarray], np.ndarray],
+    rhs: np.ndarray,
+    diagonal: np.ndarray,
+    tolerance: float = CG_TOLERANCE,
+    max_iterations: int = CG_ITERATIONS,
+) -> np.ndarray:
+    """Conjugate Gradient
+
+    Jacobi-preconditioned conjugate gradient for the symmetric positive definite
+    system matvec(x) = rhs. Stops once the residual's norm has been reduced by
+    `tolerance`, since each Newton step only needs to be solved approximately
+    """
+    solution = np.zeros_like(rhs)
+    residual = rhs.copy()
+    preconditioned = residual / diagonal
+    direction = preconditioned.copy()
+    rho = residual @ preconditioned
+    threshold = rho * tolerance ** 2
+    for _ in range(max_iterations):
+        if rho <= threshold:
+            break
+        product = matvec(direction)
+        step = rho / (direction @ product)
+        solution += step * direction
+        residual -= step * product
+        preconditioned = residual / diagonal
+        rho, previous_rho = residual @ preconditioned, rho
+        direction = preconditioned + (rho / previous_rho) * direction
+    return solution
+
+
+def refit(
+    winners: np.ndarray,
+    losers: np.ndarray,
+    annotators: np.ndarray,
+    n_items: int,
+    n_annotators: int,
+    prior_confidence: AnnotatorConfidence = AnnotatorConfidence(ALPHA, BETA),
+    initial_mu: Optional[np.ndarray] = None,
+    max_iterations: int = MAX_ITERATIONS,
+    tolerance: float = TOLERANCE,
+) -> RefitResult:
+    """Refit
+
+    Jointly estimates the items' scores and the annotators' confidences from a
+    whole set of labels.
+
+    Arguments:
+        winners {np.ndarray} -- Dense index of each label's winner
+        losers {np.ndarray} -- Dense index of each label's loser
+        annotators {np.ndarray} -- Dense index of each label's annotator. Labels
+        whose annotator is unknown should use -1, and are weighted by the prior
+        n_items {int} -- Number of items
+        n_annotators {int} -- Number of annotators
+
+    Keyword Arguments:
+        prior_confidence {AnnotatorConfidence} -- Prior Beta(α, β) of every annotator (default: {(ALPHA, BETA)})
+        initial_mu {Optional[np.ndarray]} -- Starting μ, such as the online estimates (default: {None})
+        max_iterations {int} -- Maximum number of EM iterations (default: {MAX_ITERATIONS})
+        tolerance {float} -- Stop once the log likelihood improves by a smaller fraction (default: {TOLERANCE})
+
+    Returns:
+        RefitResult -- Estimated scores, confidences and convergence information
+    """
+    prior_alpha, prior_beta = prior_confidence
+    prior_precision = 1 / SIGMA_SQUARED
+
+    known = annotators >= 0
+    known_annotators = annotators[known]
+    label_count = np.bincount(known_annotators, minlength=n_annotators)
+
+    mu = np.full(n_items, MU, dtype=np.float64)
+    if initial_mu is not None:
+        mu[:] = initial_mu
+    alpha = np.full(n_annotators, prior_alpha, dtype=np.float64)
+    beta = np.full(n_annotators, prior_beta, dtype=np.float64)
+    eta = np.full(len(winners), prior_alpha / (prior_alpha + prior_beta))
+
+    iterations = 0
+    converged = False
+    likelihood = -np.inf
+    while iterations < max_iterations:
+        iterations += 1
+
+        # E step: probability that each label agrees with the true preference
+        eta[known] = alpha[known_annotators] / (
+            alpha[known_annotators] + beta[known_annotators]
+        )
+        probability = expit(mu[winners] - mu[losers])
+        agreement = eta * probability
+        observed = agreement + (1 - eta) * (1 - probability)
+        responsibility = agreement / observed
+
+        # Stop once the marginal likelihood of the labels stabilizes
+        likelihood, previous_likelihood = np.sum(np.log(observed)), likelihood
+        if previous_likelihood - likelihood >= tolerance * likelihood:
+            converged = True
+            break
+
+        # M step for annotators: Beta posterior given the expected agreements
+        agreed = np.bincount(
+            known_annotators, weights=responsibility[known], minlength=n_annotators
+        )
+        alpha = prior_alpha + agreed
+        beta = prior_beta + label_count - agreed
+
+        # M step for items: Newton step on the MAP of the weighted Bradley-Terry
+        # model. The Hessian is a weighted graph Laplacian, so it is never built
+        weights = probability * (1 - probability)
+        gradient = (
+            scatter(winners, losers, responsibility - probability, n_items)
+            - (mu - MU) * prior_precision
+        )
+        diagonal = (
+            np.bincount(winners, weights=weights, minlength=n_items)
+            + np.bincount(losers, weights=weights, minlength=n_items)
+            + prior_precision
+        )
+        hessian: Callable[[np.ndarray], np.ndarray] = lambda vector: (
+            scatter(
+                winners, losers, weights * (vector[winners] - vector[losers]), n_items
+            )
+            + vector * prior_precision
+        )
+        mu += conjugate_gradient(hessian, gradient, diagonal)
+
+    # Laplace approximation of σ² using the Fisher information of the observations
+    eta[known] = alpha[known_annotators] / (
+        alpha[known_annotators] + beta[known_annotators]
+    )
+    probability = expit(mu[winners] - mu[losers])
+    observed = eta * probability + (1 - eta) * (1 - probability)
+    information = ((2 * eta - 1) * probability * (1 - probability)) ** 2 / (
+        observed * (1 - observed)
+    )
+    precision = (
+        np.bincount(winners, weights=information, minlength=n_items)
+        + np.bincount(losers, weights=information, minlength=n_items)
+        + prior_precision
+    )
+
+    return RefitResult(
+        RelevanceScores(mu, 1 / precision),
+        AnnotatorConfidences(alpha, beta),
+        iterations,
+        converged,
+    )
@@ -0,0 +1,119 @@
+"""Selection policies
+
+Strategies to choose which candidate an annotator compares with its current item.
+A policy scores every candidate at once and the highest score is chosen, so all of
+them share the same candidate filtering and tie breaking. Policies are registered
+by name, which is what surveys store.
+"""
+from typing import Callable, Dict, List, NamedTuple, Tuple
+import numpy as np
+from . import lookup, vectorized
+from .constants import GAMMA
+from .vectorized import Confidences, Scores
+
+EXPECTED_INFORMATION_GAIN = "eig"
+THOMPSON_SAMPLING = "thompson"
+MAX_UNCERTAINTY = "uncertainty"
+
+DEFAULT_POLICY = EXPECTED_INFORMATION_GAIN
+
+
+class SelectionContext(NamedTuple):
+    """Selection Context
+
+    Everything a policy may need besides the candidates. `current` and `annotator`
+    may be arrays that broadcast against the candidates, to score many annotators
+    at once. `interpolate` is only honored for a single annotator
+    """
+
+    current: Scores
+    annotator: Confidences
+    gamma: float = GAMMA
+    interpolate: bool = False
+
+
+Policy = Callable[[Scores, SelectionContext], np.ndarray]
+
+POLICIES: Dict[str, Policy] = {}
+
+
+def register(name: str) -> Callable[[Policy], Policy]:
+    """Register
+
+    Decorator that registers a policy under `name`
+    """
+
+    def decorator(policy: Policy) -> Policy:
+        POLICIES[name] = policy
+        return policy
+
+    return decorator
+
+
+def get_policy(name: str) -> Policy:
+    """Get policy
+
+    Returns the policy registered under `name`
+
+    Raises:
+        KeyError: If there is no such policy
+    """
+    return POLICIES[name]
+
+
+def policy_choices() -> List[Tuple[str, str]]:
+    return [(name, name) for name in POLICIES]
+
+
+def result_shape(candidates: Scores, context: SelectionContext) -> Tuple[int, ...]:
+    return np.broadcast(np.asarray(candidates.mu), np.asarray(context.current.mu)).shape
+
+
+@register(EXPECTED_INFORMATION_GAIN)
+def expected_information_gain(
+    candidates: Scores, context: SelectionContext
+) -> np.ndarray:
+    """Expected Information Gain
+
+    The original Crowd-BT strategy: the comparison that is expected to change the
+    scores and the annotator's confidence the most
+    """
+    information_gain = (
+        lookup.expected_information_gain
+        if context.interpolate
+        else vectorized.expected_information_gain
+    )
+    return information_gain(
+        candidates, context.current, context.annotator, gamma=context.gamma
+    )
+
+
+@register(THOMPSON_SAMPLING)
+def thompson_sampling(candidates: Scores, context: SelectionContext) -> np.ndarray:
+    """Thompson Sampling
+
+    Draws a relevance for every item from N(μ, σ²) and prefers the candidate whose
+    draw is closest to the current item's one, which are the comparisons whose
+    outcome is the most uncertain under the posterior
+    """
+    shape = result_shape(candidates, context)
+    candidate_draws = np.random.normal(
+        np.broadcast_to(candidates.mu, shape),
+        np.sqrt(np.broadcast_to(candidates.sigma_squared, shape)),
+    )
+    current_draws = np.random.normal(
+        context.current.mu, np.sqrt(context.current.sigma_squared)
+    )
+    return -np.abs(candidate_draws - current_draws)
+
+
+@register(MAX_UNCERTAINTY)
+def max_uncertainty(candidates: Scores, context: SelectionContext) -> np.ndarray:
+    """Max Uncertainty
+
+    Prefers the candidates with the highest σ²
+    """
+    return np.array(
+        np.broadcast_to(candidates.sigma_squared, result_shape(candidates, context)),
+        dtype=np.float64,
+    )
@@ -0,0 +1,91 @@
+"""Replay
+
+Batched replay of the online updates. Replaying labels one by one is inherently
+sequential, but two labels that share no item and no annotator can be applied in
+any order. Labels are therefore grouped into waves: a label goes in the wave right
+after the last wave that touched its winner, loser or annotator. Every wave is then
+applied with the vectorized updaters, which gives exactly the same result as the
+one by one replay.
+"""
+from typing import List
+import numpy as np
+from . import vectorized
+from .types import AnnotatorConfidence, AnnotatorConfidences, RelevanceScores
+
+
+def schedule_waves(
+    winners: np.ndarray, losers: np.ndarray, annotators: np.ndarray, n_items: int
+) -> np.ndarray:
+    """Schedule waves
+
+    Returns the wave of each label. Labels of the same wave share no item and no
+    annotator, and every label comes after the previous labels of its entities.
+    Annotators are offset by `n_items` so a single lookup holds both
+    """
+    last_wave: List[int] = [-1] * (n_items + int(np.max(annotators, initial=-1)) + 1)
+    waves: List[int] = []
+    for winner, loser, annotator in zip(
+        winners.tolist(), losers.tolist(), annotators.tolist()
+    ):
+        wave = max(last_wave[winner], last_wave[loser])
+        if annotator >= 0:
+            wave = max(wave, last_wave[n_items + annotator])
+            last_wave[n_items + annotator] = wave + 1
+        last_wave[winner] = last_wave[loser] = wave + 1
+        waves.append(wave + 1)
+    return np.array(waves, dtype=np.int64)
+
+
+def replay(
+    scores: RelevanceScores,
+    confidences: AnnotatorConfidences,
+    winners: np.ndarray,
+    losers: np.ndarray,
+    annotators: np.ndarray,
+    default_confidence: AnnotatorConfidence,
+) -> None:
+    """Replay
+
+    Applies a batch of labels, in order, to the scores and confidences arrays in
+    place. Each label updates its annotator first and then both items with the
+    updated confidence, just like `Annotator.bt_update`. Labels without an
+    annotator (-1) start from `default_confidence` and do not update any annotator
+
+    Arguments:
+        scores {RelevanceScores} -- Scores of all items, updated in place
+        confidences {AnnotatorConfidences} -- Confidences of all annotators, updated in place
+        winners {np.ndarray} -- Dense index of each label's winner
+        losers {np.ndarray} -- Dense index of each label's loser
+        annotators {np.ndarray} -- Dense index of each label's annotator, or -1
+        default_confidence {AnnotatorConfidence} -- Confidence used for labels without annotator
+    """
+    # The extra last slot holds the default confidence, so -1 indexes it
+    alpha = np.append(confidences.alpha, default_confidence.alpha)
+    beta = np.append(confidences.beta, default_confidence.beta)
+
+    waves = schedule_waves(winners, losers, annotators, len(scores.mu))
+    order = np.argsort(waves, kind="stable")
+    boundaries = np.flatnonzero(np.diff(waves[order])) + 1
+    for wave in np.split(order, boundaries):
+        winner, loser, annotator = winners[wave], losers[wave], annotators[wave]
+        known = annotator >= 0
+        winner_score = RelevanceScores(scores.mu[winner], scores.sigma_squared[winner])
+        loser_score = RelevanceScores(scores.mu[loser], scores.sigma_squared[loser])
+        confidence = AnnotatorConfidences(alpha[annotator], beta[annotator])
+
+        new_confidence, _ = vectorized.update_annotator(
+            winner_score, loser_score, confidence
+        )
+        new_winner, new_loser = vectorized.update_scores(
+            winner_score, loser_score, new_confidence
+        )
+
+        scores.mu[winner] = new_winner.mu
+        scores.sigma_squared[winner] = new_winner.sigma_squared
+        scores.mu[loser] = new_loser.mu
+        scores.sigma_squared[loser] = new_loser.sigma_squared
+        alpha[annotator[known]] = new_confidence.alpha[known]
+        beta[annotator[known]] = new_confidence.beta[known]
+
+    confidences.alpha[:] = alpha[:-1]
+    confidences.beta[:] = beta[:-1]
@@ -1,6 +1,9 @@
 import itertools
 import unittest
-from apps.crowd_bt import utils, online, entropy
+import numpy as np
+from apps.crowd_bt import utils, online, entropy, vectorized, offline, replay, lookup
+from apps.crowd_bt import benchmark, policies
+from apps.crowd_bt.constants import KAPPA
 from apps.crowd_bt.types import (
     RelevanceScore,
     AnnotatorConfidence,
@@ -8,6 +11,8 @@ from apps.crowd_bt.types import (
     SigmaSquared,
     Alpha,
     Beta,
+    RelevanceScores,
+    AnnotatorConfidences,
 )
 
 
@@ -1008,3 +1013,366 @@ class EntropyTestCase(unittest.TestCase):
         ]
         for comb, solution in zip(combinations, solutions):
             self.assertEqual(entropy.expected_information_gain(*comb), solution)
+
+
+class VectorizedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scores = [
+            RelevanceScore(Mu(2.0), SigmaSquared(2.0)),
+            RelevanceScore(Mu(4.0), SigmaSquared(1.0)),
+            RelevanceScore(Mu(3.0), SigmaSquared(0.5)),
+        ]
+
+        self.annotators = [
+            AnnotatorConfidence(Alpha(5), Beta(2)),
+            AnnotatorConfidence(Alpha(2), Beta(5)),
+            AnnotatorConfidence(Alpha(1), Beta(2)),
+        ]
+        self.combinations = combine(self.scores, self.scores, self.annotators)
+        winners = extract(self.combinations, 0)
+        losers = extract(self.combinations, 1)
+        annotators = extract(self.combinations, 2)
+        self.winners = RelevanceScores(*map(np.array, zip(*winners)))
+        self.losers = RelevanceScores(*map(np.array, zip(*losers)))
+        self.confidences = AnnotatorConfidences(*map(np.array, zip(*annotators)))
+
+    def assertAllClose(self, vector, expected):
+        np.testing.assert_allclose(vector, expected, rtol=1e-10)
+
+    def test_update_scores(self):
+        new_winners, new_losers = vectorized.update_scores(
+            self.winners, self.losers, self.confidences
+        )
+        expected = [online.update_scores(*comb) for comb in self.combinations]
+        self.assertAllClose(new_winners.mu, [e[0].mu for e in expected])
+        self.assertAllClose(
+            new_winners.sigma_squared, [e[0].sigma_squared for e in expected]
+        )
+        self.assertAllClose(new_losers.mu, [e[1].mu for e in expected])
+        self.assertAllClose(
+            new_losers.sigma_squared, [e[1].sigma_squared for e in expected]
+        )
+
+    def test_update_annotator(self):
+        new_annotators, c = vectorized.update_annotator(
+            self.winners, self.losers, self.confidences
+        )
+        expected = [online.update_annotator(*comb) for comb in self.combinations]
+        self.assertAllClose(new_annotators.alpha, [e[0].alpha for e in expected])
+        self.assertAllClose(new_annotators.beta, [e[0].beta for e in expected])
+        self.assertAllClose(c, [e[1] for e in expected])
+
+    def test_relative_entropies(self):
+        self.assertAllClose(
+            vectorized.gaussian_relative_entropy(self.winners, self.losers),
+            [utils.gaussian_relative_entropy(*comb[:2]) for comb in self.combinations],
+        )
+        annotators = combine(self.annotators, self.annotators)
+        first = AnnotatorConfidences(*map(np.array, zip(*extract(annotators, 0))))
+        second = AnnotatorConfidences(*map(np.array, zip(*extract(annotators, 1))))
+        np.testing.assert_allclose(
+            vectorized.beta_relative_entropy(first, second),
+            [utils.beta_relative_entropy(*comb) for comb in annotators],
+            atol=1e-12,
+        )
+
+    def test_expected_information_gain(self):
+        self.assertAllClose(
+            vectorized.expected_information_gain(
+                self.winners, self.losers, self.confidences
+            ),
+            [entropy.expected_information_gain(*comb) for comb in self.combinations],
+        )
+
+    def test_expected_information_gain_broadcast(self):
+        candidates = vectorized.as_scores(*zip(*self.scores))
+        for previous in self.scores:
+            for annotator in self.annotators:
+                self.assertAllClose(
+                    vectorized.expected_information_gain(
+                        candidates, previous, annotator, gamma=2.5
+                    ),
+                    [
+                        entropy.expected_information_gain(
+                            score, previous, annotator, gamma=2.5
+                        )
+                        for score in self.scores
+                    ],
+                )
+
+    def test_random_argmax(self):
+        values = np.array([1.0, 3.0, 2.0, 3.0])
+        chosen = {vectorized.random_argmax(values) for _ in range(100)}
+        self.assertEqual(chosen, {1, 3})
+
+    def test_win_probability(self):
+        probabilities = vectorized.win_probability(self.winners, self.losers)
+        self.assertAllClose(
+            probabilities + vectorized.win_probability(self.losers, self.winners), 1
+        )
+        # Against a Monte Carlo estimate of the expected Bradley-Terry probability
+        rng = np.random.RandomState(0)
+        winner, loser = self.scores[1], self.scores[0]
+        difference = rng.normal(
+            winner.mu - loser.mu,
+            np.sqrt(winner.sigma_squared + loser.sigma_squared),
+            size=200000,
+        )
+        self.assertAlmostEqual(
+            float(vectorized.win_probability(winner, loser)),
+            float(np.mean(1 / (1 + np.exp(-difference)))),
+            places=2,
+        )
+
+    def test_rank_percentiles(self):
+        scores = vectorized.as_scores([0.0, 10.0, 0.0, 5.0], [1.0, 1.0, 1.0, 0.0])
+        percentiles = vectorized.rank_percentiles(
+            scores, [5, 50, 95], 500, np.random.default_rng(0), chunk_size=64
+        )
+        self.assertEqual(percentiles.shape, (3, 4))
+        self.assertTrue(np.all(percentiles[:, 1] == 1))
+        self.assertTrue(np.all(percentiles[:, 3] == 2))
+        # The tied items share the last two ranks
+        self.assertTrue(np.all(percentiles[0, [0, 2]] == 3))
+        self.assertTrue(np.all(percentiles[2, [0, 2]] == 4))
+
+
+class OfflineTestCase(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        n_items, n_annotators, n_labels = 30, 6, 6000
+        self.true_mu = np.linspace(-2, 2, n_items)
+        # The last annotator answers at random
+        true_eta = np.array([0.95] * (n_annotators - 1) + [0.5])
+        first = random.randint(0, n_items, n_labels)
+        second = (first + random.randint(1, n_items, n_labels)) % n_items
+        annotators = random.randint(0, n_annotators, n_labels)
+        preference = random.random_sample(n_labels) < 1 / (
+            1 + np.exp(self.true_mu[second] - self.true_mu[first])
+        )
+        agrees = random.random_sample(n_labels) < true_eta[annotators]
+        first_wins = preference == agrees
+        self.winners = np.where(first_wins, first, second)
+        self.losers = np.where(first_wins, second, first)
+        self.annotators = annotators
+        self.n_items = n_items
+        self.n_annotators = n_annotators
+
+    def test_refit_recovers_ranking(self):
+        result = offline.refit(
+            self.winners, self.losers, self.annotators, self.n_items, self.n_annotators
+        )
+        self.assertTrue(result.converged)
+        self.assertGreater(np.corrcoef(result.scores.mu, self.true_mu)[0, 1], 0.95)
+        self.assertTrue(np.all(result.scores.sigma_squared < 1))
+        quality = result.confidences.alpha / (
+            result.confidences.alpha + result.confidences.beta
+        )
+        self.assertEqual(np.argmin(quality), self.n_annotators - 1)
+
+    def test_refit_is_order_independent(self):
+        order = np.random.RandomState(1).permutation(len(self.winners))
+        first = offline.refit(
+            self.winners, self.losers, self.annotators, self.n_items, self.n_annotators
+        )
+        second = offline.refit(
+            self.winners[order],
+            self.losers[order],
+            self.annotators[order],
+            self.n_items,
+            self.n_annotators,
+        )
+        np.testing.assert_allclose(first.scores.mu, second.scores.mu)
+        np.testing.assert_allclose(first.confidences.alpha, second.confidences.alpha)
+
+    def test_refit_unknown_annotators(self):
+        annotators = np.full(len(self.winners), -1)
+        result = offline.refit(
+            self.winners, self.losers, annotators, self.n_items, self.n_annotators
+        )
+        np.testing.assert_allclose(result.confidences.alpha, 10)
+        self.assertGreater(np.corrcoef(result.scores.mu, self.true_mu)[0, 1], 0.95)
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.n_items, self.n_annotators, n_labels = 12, 4, 300
+        first = random.randint(0, self.n_items, n_labels)
+        self.winners = first
+        self.losers = (first + random.randint(1, self.n_items, n_labels)) % self.n_items
+        self.annotators = random.randint(-1, self.n_annotators, n_labels)
+        self.default = AnnotatorConfidence(Alpha(10), Beta(1))
+
+    def test_schedule_waves(self):
+        waves = replay.schedule_waves(
+            np.array([0, 2, 0, 3]), np.array([1, 3, 4, 5]), np.array([0, 1, -1, 0]), 6
+        )
+        np.testing.assert_array_equal(waves, [0, 0, 1, 1])
+
+    def test_replay_matches_sequential_updates(self):
+        scores = [RelevanceScore(Mu(0.0), SigmaSquared(1.0))] * self.n_items
+        confidences = [self.default] * self.n_annotators
+        for winner, loser, annotator in zip(self.winners, self.losers, self.annotators):
+            confidence = self.default if annotator < 0 else confidences[annotator]
+            new_confidence, _ = online.update_annotator(
+                scores[winner], scores[loser], confidence
+            )
+            scores[winner], scores[loser] = online.update_scores(
+                scores[winner], scores[loser], new_confidence
+            )
+            if annotator >= 0:
+                confidences[annotator] = new_confidence
+
+        batch_scores = RelevanceScores(np.zeros(self.n_items), np.ones(self.n_items))
+        batch_confidences = AnnotatorConfidences(
+            np.full(self.n_annotators, 10.0), np.full(self.n_annotators, 1.0)
+        )
+        # Replaying in two chunks must be the same as replaying all at once
+        for chunk in (slice(0, 120), slice(120, None)):
+            replay.replay(
+                batch_scores,
+                batch_confidences,
+                self.winners[chunk],
+                self.losers[chunk],
+                self.annotators[chunk],
+                self.default,
+            )
+        np.testing.assert_allclose(batch_scores.mu, extract(scores, 0), rtol=1e-10)
+        np.testing.assert_allclose(
+            batch_scores.sigma_squared, extract(scores, 1), rtol=1e-10
+        )
+        np.testing.assert_allclose(
+            batch_confidences.alpha, extract(confidences, 0), rtol=1e-10
+        )
+        np.testing.assert_allclose(
+            batch_confidences.beta, extract(confidences, 1), rtol=1e-10
+        )
+
+
+class LookupTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.scores = RelevanceScores(
+            rng.normal(0, 2, 500), rng.uniform(KAPPA, 1.5, 500)
+        )
+        self.current = RelevanceScore(Mu(0.5), SigmaSquared(0.3))
+        self.annotator = AnnotatorConfidence(Alpha(13.7), Beta(1.3))
+
+    def test_annotator_bin(self):
+        self.assertEqual(
+            lookup.annotator_bin(AnnotatorConfidence(Alpha(16.0), Beta(1.0))),
+            AnnotatorConfidence(Alpha(16.0), Beta(1.0)),
+        )
+        binned = lookup.annotator_bin(self.annotator)
+        self.assertLess(abs(np.log2(binned.alpha / self.annotator.alpha)), 1 / 16)
+
+    def test_expected_information_gain(self):
+        exact = vectorized.expected_information_gain(
+            self.scores, self.current, self.annotator, gamma=3.0
+        )
+        approximate = lookup.expected_information_gain(
+            self.scores, self.current, self.annotator, gamma=3.0
+        )
+        error = lookup.max_error(self.annotator, gamma=3.0)
+        self.assertLess(error, 0.05)
+        self.assertLessEqual(np.max(np.abs(approximate - exact)), error + 1e-9)
+
+    def test_exact_at_grid_points(self):
+        table = lookup.get_table(AnnotatorConfidence(Alpha(8.0), Beta(1.0)))
+        sigmas_squared = np.exp(lookup.SIGMA_GRID.values())
+        scores = RelevanceScores(
+            np.array([-1.0, 0.0, 2.0]), sigmas_squared[[0, 10, 20]]
+        )
+        current = RelevanceScore(Mu(0.0), SigmaSquared(sigmas_squared[30]))
+        np.testing.assert_allclose(
+            table.interpolate(scores, current, gamma=2.0),
+            vectorized.expected_information_gain(
+                scores, current, table.annotator, gamma=2.0
+            ),
+            rtol=1e-6,
+        )
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_cases(self):
+        cases = list(benchmark.cases(20, scalar=True))
+        self.assertEqual(
+            {(kernel, path) for kernel, path, _ in cases if kernel == "random_argmax"},
+            {
+                ("random_argmax", "scalar"),
+                ("random_argmax", "scalar_unshuffled"),
+                ("random_argmax", "batch"),
+            },
+        )
+        for _, _, function in cases:
+            function()
+        self.assertNotIn(
+            "scalar", {path for _, path, _ in benchmark.cases(20, scalar=False)}
+        )
+
+    def test_compare(self):
+        baseline = [
+            {"kernel": "update_mu", "path": "batch", "size": 10, "best": 1.0},
+            {"kernel": "update_mu", "path": "batch", "size": 100, "best": 1.0},
+        ]
+        results = [
+            {"kernel": "update_mu", "path": "batch", "size": 10, "best": 1.1},
+            {"kernel": "update_mu", "path": "batch", "size": 100, "best": 2.0},
+            {"kernel": "update_mu", "path": "batch", "size": 1000, "best": 9.0},
+        ]
+        regressions = benchmark.compare(results, baseline, threshold=1.25)
+        self.assertEqual(
+            [(result["size"], ratio) for result, ratio in regressions], [(100, 2.0)]
+        )
+
+
+class PoliciesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.candidates = RelevanceScores(
+            np.array([0.0, 1.0, 2.0, 3.0]), np.array([0.5, 0.1, 0.9, 1e-6])
+        )
+        self.context = policies.SelectionContext(
+            RelevanceScore(Mu(2.9), SigmaSquared(1e-6)),
+            AnnotatorConfidence(Alpha(10.0), Beta(1.0)),
+        )
+
+    def test_registry(self):
+        self.assertEqual(
+            set(policies.POLICIES),
+            {
+                policies.EXPECTED_INFORMATION_GAIN,
+                policies.THOMPSON_SAMPLING,
+                policies.MAX_UNCERTAINTY,
+            },
+        )
+        with self.assertRaises(KeyError):
+            policies.get_policy("unknown")
+
+    def test_expected_information_gain(self):
+        np.testing.assert_allclose(
+            policies.expected_information_gain(self.candidates, self.context),
+            vectorized.expected_information_gain(
+                self.candidates, self.context.current, self.context.annotator
+            ),
+        )
+
+    def test_max_uncertainty(self):
+        scores = policies.max_uncertainty(self.candidates, self.context)
+        self.assertEqual(vectorized.random_argmax(scores), 2)
+
+    def test_thompson_sampling(self):
+        # Almost certain scores make the closest μ the best candidate
+        candidates = self.candidates._replace(sigma_squared=np.full(4, 1e-8))
+        scores = policies.thompson_sampling(candidates, self.context)
+        self.assertEqual(vectorized.random_argmax(scores), 3)
+
+    def test_broadcast(self):
+        context = self.context._replace(
+            current=RelevanceScores(np.array([[0.0], [3.0]]), np.array([[0.5], [0.5]])),
+            annotator=AnnotatorConfidences(
+                np.array([[10.0], [2.0]]), np.array([[1.0], [2.0]])
+            ),
+        )
+        for policy in policies.POLICIES.values():
+            self.assertEqual(policy(self.candidates, context).shape, (2, 4))
@@ -1,4 +1,5 @@
 from typing import NewType, NamedTuple
+import numpy as np
 
 
 # pylint: disable=pointless-string-statement
@@ -67,3 +68,25 @@ class AnnotatorConfidence(NamedTuple):
 
     alpha: Alpha
     beta: Beta
+
+
+class RelevanceScores(NamedTuple):
+    """Relevance Scores (s)
+
+    Vectorized counterpart of RelevanceScore. Each field is an array holding the
+    parameters of many scores, so that a whole pool of items can be updated at once
+    """
+
+    mu: np.ndarray
+    sigma_squared: np.ndarray
+
+
+class AnnotatorConfidences(NamedTuple):
+    """Annotator Confidences (η)
+
+    Vectorized counterpart of AnnotatorConfidence. Each field is an array holding
+    the parameters of many confidences
+    """
+
+    alpha: np.ndarray
+    beta: np.ndarray
@@ -0,0 +1,272 @@
+"""Vectorized
+
+NumPy counterparts of the online updaters, relative entropies and expected
+information gain. Every function accepts arrays (or anything that broadcasts
+against them) instead of single values, so a whole pool of items can be scored
+in one pass instead of one Python call per item
+"""
+from typing import Sequence, Tuple, Union
+import numpy as np
+from scipy.special import expit, psi, beta  # pylint: disable=no-name-in-module
+from .types import (
+    AnnotatorConfidence,
+    AnnotatorConfidences,
+    RelevanceScore,
+    RelevanceScores,
+)
+from .constants import GAMMA, KAPPA
+
+Scores = Union[RelevanceScore, RelevanceScores]
+Confidences = Union[AnnotatorConfidence, AnnotatorConfidences]
+
+# Values sampled or sorted at once by rank_percentiles, at most
+SAMPLE_CHUNK_SIZE = 1 << 22
+
+
+def as_scores(mu: np.ndarray, sigma_squared: np.ndarray) -> RelevanceScores:
+    """As Scores
+
+    Builds a RelevanceScores out of anything that can be converted to float arrays,
+    such as the lists returned by `values_list`
+    """
+    return RelevanceScores(
+        np.asarray(mu, dtype=np.float64), np.asarray(sigma_squared, dtype=np.float64)
+    )
+
+
+def update_mu(
+    winner: Scores, loser: Scores, annotator: Confidences
+) -> Tuple[RelevanceScores, RelevanceScores]:
+    """Update μ
+
+    Vectorized equations (11) and (12). See `online.update_mu`
+    """
+    exp_winner_mu = np.exp(winner.mu)
+    exp_loser_mu = np.exp(loser.mu)
+    alpha_exp_winner_mu = annotator.alpha * exp_winner_mu
+    update_factor = (
+        alpha_exp_winner_mu / (alpha_exp_winner_mu + annotator.beta * exp_loser_mu)
+    ) - (exp_winner_mu / (exp_winner_mu + exp_loser_mu))
+
+    return (
+        RelevanceScores(
+            winner.mu + winner.sigma_squared * update_factor, winner.sigma_squared
+        ),
+        RelevanceScores(
+            loser.mu - loser.sigma_squared * update_factor, loser.sigma_squared
+        ),
+    )
+
+
+def update_sigma_squared(
+    winner: Scores, loser: Scores, annotator: Confidences
+) -> Tuple[RelevanceScores, RelevanceScores]:
+    """Update σ²
+
+    Vectorized equations (13) and (14). See `online.update_sigma_squared`
+    """
+    exp_winner_mu = np.exp(winner.mu)
+    exp_loser_mu = np.exp(loser.mu)
+    alpha_exp_winner_mu = annotator.alpha * exp_winner_mu
+    beta_exp_loser_mu = annotator.beta * exp_loser_mu
+    update_factor = (alpha_exp_winner_mu * beta_exp_loser_mu) / (
+        (alpha_exp_winner_mu + beta_exp_loser_mu) ** 2
+    ) - (exp_winner_mu * exp_loser_mu) / ((exp_winner_mu + exp_loser_mu) ** 2)
+
+    return (
+        RelevanceScores(
+            winner.mu,
+            winner.sigma_squared
+            * np.maximum(1 + winner.sigma_squared * update_factor, KAPPA),
+        ),
+        RelevanceScores(
+            loser.mu,
+            loser.sigma_squared
+            * np.maximum(1 + loser.sigma_squared * update_factor, KAPPA),
+        ),
+    )
+
+
+def update_scores(
+    winner: Scores, loser: Scores, annotator: Confidences
+) -> Tuple[RelevanceScores, RelevanceScores]:
+    """Update Scores
+
+    Vectorized `online.update_scores`. Returns updated (Winners, Losers)
+    """
+    (mu_winner, mu_loser) = update_mu(winner, loser, annotator)
+    (sigma_winner, sigma_loser) = update_sigma_squared(winner, loser, annotator)
+    return (
+        RelevanceScores(mu_winner.mu, sigma_winner.sigma_squared),
+        RelevanceScores(mu_loser.mu, sigma_loser.sigma_squared),
+    )
+
+
+def update_annotator(
+    winner: Scores, loser: Scores, annotator: Confidences
+) -> Tuple[AnnotatorConfidences, np.ndarray]:
+    """Update Annotator
+
+    Vectorized equations (16) and (17). See `online.update_annotator`
+    """
+    alpha = annotator.alpha
+    beta_ = annotator.beta
+    total = alpha + beta_
+
+    exp_winner_mu = np.exp(winner.mu)
+    exp_loser_mu = np.exp(loser.mu)
+
+    c_1 = exp_winner_mu / (exp_winner_mu + exp_loser_mu) + 0.5 * (
+        winner.sigma_squared + loser.sigma_squared
+    ) * (
+        exp_winner_mu
+        * exp_loser_mu
+        * (exp_loser_mu - exp_winner_mu)
+        / (exp_winner_mu + exp_loser_mu) ** 3
+    )
+    c_2 = 1 - c_1
+    c = (c_1 * alpha + c_2 * beta_) / total  # pylint: disable=invalid-name
+
+    expectation = (c_1 * (alpha + 1) * alpha + c_2 * alpha * beta_) / (
+        c * (total + 1) * total
+    )
+    expectation_squared = (
+        c_1 * (alpha + 2) * (alpha + 1) * alpha + c_2 * (alpha + 1) * alpha * beta_
+    ) / (c * (total + 2) * (total + 1) * total)
+
+    variance = expectation_squared - expectation ** 2
+    new_alpha = ((expectation - expectation_squared) * expectation) / variance
+    new_beta = ((expectation - expectation_squared) * (1 - expectation)) / variance
+
+    return AnnotatorConfidences(new_alpha, new_beta), c
+
+
+def update(
+    winner: Scores, loser: Scores, annotator: Confidences
+) -> Tuple[RelevanceScores, RelevanceScores, AnnotatorConfidences]:
+    """Update decision
+
+    Vectorized `online.update`. Returns the new winners, losers and annotators
+    """
+    (new_winner, new_loser) = update_scores(winner, loser, annotator)
+    (new_annotator, _) = update_annotator(winner, loser, annotator)
+    return new_winner, new_loser, new_annotator
+
+
+def gaussian_relative_entropy(score1: Scores, score2: Scores) -> np.ndarray:
+    """Gaussian Kullback–Leibler divergence
+
+    Vectorized `utils.gaussian_relative_entropy`
+    """
+    sigma_ratio = score1.sigma_squared / score2.sigma_squared
+    return (score1.mu - score2.mu) ** 2 / (2 * score2.sigma_squared) + (
+        sigma_ratio - 1 - np.log(sigma_ratio)
+    ) / 2
+
+
+def beta_relative_entropy(conf1: Confidences, conf2: Confidences) -> np.ndarray:
+    """Beta Kullback–Leibler divergence
+
+    Vectorized `utils.beta_relative_entropy`
+    """
+    return (
+        np.log(beta(conf2.alpha, conf2.beta) / beta(conf1.alpha, conf1.beta))
+        + (conf1.alpha - conf2.alpha) * psi(conf1.alpha)
+        + (conf1.beta - conf2.beta) * psi(conf1.beta)
+        + (conf2.alpha - conf1.alpha + conf2.beta - conf1.beta)
+        * psi(conf1.alpha + conf1.beta)
+    )
+
+
+def expected_information_gain(
+    score_a: Scores, score_b: Scores, annotator: Confidences, gamma: float = GAMMA,
+) -> np.ndarray:
+    """Expected Information Gain
+
+    Vectorized `entropy.expected_information_gain`. Usually `score_a` holds the
+    candidates' arrays while `score_b` and `annotator` are single values that get
+    broadcast against them
+
+    Returns:
+        np.ndarray -- Expected information gain of each (score_a, score_b) pair
+    """
+    (a_winner_score_a, a_winner_score_b) = update_scores(score_a, score_b, annotator)
+    a_winner_annotator, a_winner_c = update_annotator(score_a, score_b, annotator)
+
+    (b_winner_score_b, b_winner_score_a) = update_scores(score_b, score_a, annotator)
+    b_winner_annotator, b_winner_c = update_annotator(score_b, score_a, annotator)
+
+    return a_winner_c * (
+        gaussian_relative_entropy(a_winner_score_a, score_a)
+        + gaussian_relative_entropy(a_winner_score_b, score_b)
+        + gamma * beta_relative_entropy(a_winner_annotator, annotator)
+    ) + b_winner_c * (
+        gaussian_relative_entropy(b_winner_score_a, score_a)
+        + gaussian_relative_entropy(b_winner_score_b, score_b)
+        + gamma * beta_relative_entropy(b_winner_annotator, annotator)
+    )
+
+
+def win_probability(winner: Scores, loser: Scores) -> np.ndarray:
+    """Win probability
+
+    Probability that `winner` beats `loser` under the Bradley-Terry model, with
+    their relevances drawn from their Gaussian scores. The logistic of a Gaussian
+    difference has no closed form, it uses the probit approximation: the logistic
+    of the difference of the means, shrunk by sqrt(1 + π/8 (σ²_winner + σ²_loser))
+    """
+    spread = np.sqrt(1 + np.pi / 8 * (winner.sigma_squared + loser.sigma_squared))
+    return expit((winner.mu - loser.mu) / spread)
+
+
+def rank_percentiles(
+    scores: RelevanceScores,
+    percentiles: Sequence[float],
+    samples: int,
+    random: np.random.Generator,
+    chunk_size: int = SAMPLE_CHUNK_SIZE,
+) -> np.ndarray:
+    """Rank Percentiles
+
+    Monte Carlo estimate of the given percentiles of each item's rank (1 is the
+    best), with the relevances drawn from the Gaussian scores `samples` times.
+    Returns a (len(percentiles), items) array.
+
+    Draws are made and ranked a chunk at a time, and the percentiles computed a
+    chunk of items at a time, with at most `chunk_size` values each. The ranks are
+    kept whole, as a (samples, items) int32 array, so callers must bound
+    samples × items
+    """
+    size = len(scores.mu)
+    ranks = np.empty((samples, size), dtype=np.int32)
+    positions = np.arange(1, size + 1, dtype=np.int32)[None, :]
+    rows = max(chunk_size // max(size, 1), 1)
+    for start in range(0, samples, rows):
+        chunk = ranks[start : start + rows]
+        relevances = random.normal(
+            scores.mu, np.sqrt(scores.sigma_squared), size=chunk.shape
+        )
+        np.put_along_axis(chunk, np.argsort(-relevances, axis=1), positions, axis=1)
+
+    result = np.empty((len(percentiles), size), dtype=np.int32)
+    columns = max(chunk_size // max(samples, 1), 1)
+    for start in range(0, size, columns):
+        result[:, start : start + columns] = np.percentile(
+            ranks[:, start : start + columns],
+            percentiles,
+            axis=0,
+            interpolation="nearest",
+        )
+    return result
+
+
+def random_argmax(values: np.ndarray) -> int:
+    """Random Argmax
+
+    Vectorized `utils.random_argmax`. Returns the index of the maximum value,
+    breaking ties uniformly at random. NaNs are never selected unless every value is NaN
+    """
+    maxima = np.flatnonzero(values == np.nanmax(values))
+    if not len(maxima):  # pylint: disable=len-as-condition
+        maxima = np.arange(len(values))
+    return int(maxima[np.random.randint(len(maxima))])
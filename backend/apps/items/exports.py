@@ -0,0 +1,39 @@
+"""Item exports
+
+Rows of the item and ranking exports, read from a server-side cursor, see
+`backend.exports`
+"""
+from typing import Any, Iterator, Tuple
+from backend.custom_types.models import QueryType
+from backend.exports import EXPORT_CHUNK_SIZE
+
+ITEM_FIELDS = (
+    "id",
+    "name",
+    "metadata",
+    "active",
+    "prioritized",
+    "mu",
+    "sigma_squared",
+)
+RANKING_FIELDS = ("rank", "id", "name", "mu", "sigma_squared")
+
+
+def item_rows(items: QueryType) -> Iterator[Tuple[Any, ...]]:
+    columns = ("uuid",) + ITEM_FIELDS[1:]
+    rows: Iterator[Tuple[Any, ...]] = (
+        items.order_by("id")
+        .values_list(*columns)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return rows
+
+
+def ranking_rows(items: QueryType) -> Iterator[Tuple[Any, ...]]:
+    rows = (
+        items.order_by("-mu", "-id")
+        .values_list("uuid", "name", "mu", "sigma_squared")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for rank, row in enumerate(rows, 1):
+        yield (rank,) + row
@@ -0,0 +1,81 @@
+"""Item imports
+
+Creates a survey's items from a stream of rows, like the ones from the streaming
+parsers. Rows are validated one by one and the valid ones are inserted in
+batches, each with a single reservation of their ordinals, so the rows never
+have to be in memory at once. Invalid rows, and rows over the survey's item
+quota, are reported without stopping the import.
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from django.db import transaction
+from apps.surveys.models import Survey
+from apps.surveys.versions import bump_score_version
+from . import leaderboard
+from .exceptions import ItemsQuotaError
+from .models import Item
+from .serializers import ItemImportSerializer
+
+IMPORT_BATCH_SIZE = 1000
+
+
+class RowError(NamedTuple):
+    """Row error
+
+    Errors of the row at position `row` (starting at 1), by field
+    """
+
+    row: int
+    errors: Dict[str, Any]
+
+
+class ImportResult(NamedTuple):
+    created: int
+    errors: List[RowError]
+
+
+def create_items(survey: Survey, items: List[Item]) -> None:
+    with transaction.atomic():
+        first = Survey.reserve_item_ordinals(survey.id, len(items))
+        for ordinal, item in enumerate(items, first):
+            item.ordinal = ordinal
+        Item.objects.bulk_create(items)
+        leaderboard.update(survey.id, [(item.id, item.mu) for item in items])
+        bump_score_version(survey.id)
+
+
+def import_items(
+    survey: Survey,
+    rows: Iterable[Optional[Dict[str, Any]]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportResult:
+    """Import items
+
+    Creates an item of the survey for each valid row, in order, as long as the
+    survey's item quota (checked once, before the import) allows. Rows that are
+    None could not be parsed
+    """
+    left = survey.max_items - survey.item_count if survey.max_items > 0 else None
+    created = 0
+    errors: List[RowError] = []
+    batch: List[Item] = []
+    for number, row in enumerate(rows, 1):
+        if row is None:
+            errors.append(RowError(number, {"non_field_errors": ["Invalid row"]}))
+            continue
+        serializer = ItemImportSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append(RowError(number, serializer.errors))
+            continue
+        if left is not None and created + len(batch) >= left:
+            errors.append(
+                RowError(number, {"non_field_errors": [ItemsQuotaError.default_detail]})
+            )
+            continue
+        batch.append(Item(survey=survey, **serializer.validated_data))
+        if len(batch) >= batch_size:
+            create_items(survey, batch)
+            created, batch = created + len(batch), []
+    if batch:
+        create_items(survey, batch)
+        created += len(batch)
+    return ImportResult(created, errors)
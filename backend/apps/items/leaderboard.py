@@ -0,0 +1,226 @@
+"""Leaderboard
+
+Every survey's ranking is also kept in a Redis sorted set with the items' μ as
+scores, so ranking pages are read with ZREVRANGE and an item's rank with
+ZREVRANK, in O(log n), without sorting or counting rows. Members are the item ids
+zero padded, so ties in μ are ordered like the database ranking, by decreasing id.
+
+Scores are written once the transactions that change them commit, by the same
+code that writes them to the database, and only to sets that exist: missing sets
+are rebuilt from the database when read, so a partial set is never taken for a
+whole one. Writes that bypass the models, are lost while Redis is unreachable or
+race with a rebuild make sets drift, until `check_leaderboards` finds and
+rebuilds them. Without Redis, the ranking is read from the database.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+import redis
+from django.conf import settings
+from django.db import transaction
+
+# Members written per command
+WRITE_BATCH_SIZE = 1000
+# Seconds a set being rebuilt is kept if the rebuild never finishes
+REBUILD_TTL = 60 * 60
+
+# ZADD, unless the set does not exist
+ADD_IF_EXISTS = """
+if redis.call("exists", KEYS[1]) == 1 then
+    return redis.call("zadd", KEYS[1], unpack(ARGV))
+end
+return 0
+"""
+
+connection: Optional[redis.Redis] = None
+
+
+def get_connection() -> Optional[redis.Redis]:
+    global connection  # pylint: disable=global-statement
+    if not settings.REDIS_URL:
+        return None
+    if connection is None:
+        connection = redis.Redis.from_url(settings.REDIS_URL)
+    return connection
+
+
+def leaderboard_key(survey_id: int) -> str:
+    return f"items:leaderboard:{survey_id}"
+
+
+def to_member(item_id: int) -> str:
+    return f"{item_id:010d}"
+
+
+def update(survey_id: int, scores: Iterable[Tuple[int, float]]) -> None:
+    """Update
+
+    Sets the μ of the given (item id, μ) pairs in the survey's leaderboard, once
+    the current transaction commits
+    """
+    if get_connection() is None:
+        return
+    members = [(to_member(item_id), mu) for item_id, mu in scores]
+    transaction.on_commit(lambda: write(survey_id, members))
+
+
+def remove(survey_id: int, item_ids: Iterable[int]) -> None:
+    """Remove
+
+    Removes the given items from the survey's leaderboard, once the current
+    transaction commits
+    """
+    conn = get_connection()
+    if conn is None:
+        return
+    members = [to_member(item_id) for item_id in item_ids]
+
+    def delete() -> None:
+        try:
+            conn.zrem(leaderboard_key(survey_id), *members)
+        except redis.RedisError:
+            pass  # Repaired by the next check
+
+    if members:
+        transaction.on_commit(delete)
+
+
+def write(survey_id: int, members: List[Tuple[str, float]]) -> None:
+    conn = get_connection()
+    if conn is None:
+        return
+    add = conn.register_script(ADD_IF_EXISTS)
+    try:
+        for start in range(0, len(members), WRITE_BATCH_SIZE):
+            args: List[object] = []
+            for member, mu in members[start : start + WRITE_BATCH_SIZE]:
+                args += [mu, member]
+            add(keys=[leaderboard_key(survey_id)], args=args)
+    except redis.RedisError:
+        pass  # Repaired by the next check
+
+
+def rebuild(survey_id: int) -> int:
+    """Rebuild
+
+    Replaces the survey's leaderboard with the scores in the database. Returns
+    how many items it has
+    """
+    from .models import Item
+
+    conn = get_connection()
+    if conn is None:
+        return 0
+    key = leaderboard_key(survey_id)
+    building = f"{key}:rebuild:{uuid4().hex}"
+    count = 0
+    batch: Dict[str, float] = {}
+    rows = Item.objects.filter(survey_id=survey_id).values_list("id", "mu")
+    for item_id, mu in rows.iterator(chunk_size=WRITE_BATCH_SIZE):
+        batch[to_member(item_id)] = mu
+        if len(batch) == WRITE_BATCH_SIZE:
+            count += write_batch(conn, building, batch)
+    count += write_batch(conn, building, batch)
+
+    if count:
+        # The new set replaces the old one at once
+        conn.pipeline().rename(building, key).persist(key).execute()
+    else:
+        conn.delete(key)
+    return count
+
+
+def write_batch(conn: redis.Redis, key: str, batch: Dict[str, float]) -> int:
+    if not batch:
+        return 0
+    conn.pipeline().zadd(key, batch).expire(key, REBUILD_TTL).execute()
+    count = len(batch)
+    batch.clear()
+    return count
+
+
+def ensure(conn: redis.Redis, survey_id: int) -> bool:
+    """Ensure
+
+    Rebuilds the survey's leaderboard if it does not exist. Returns whether the
+    survey has any items
+    """
+    return bool(conn.exists(leaderboard_key(survey_id))) or rebuild(survey_id) > 0
+
+
+def page(survey_id: int, start: int, stop: int) -> Optional[Tuple[int, List[int]]]:
+    """Page
+
+    Number of items of the survey and the ids of those ranked from `start` to
+    `stop` (excluded), or None if the leaderboard is not available
+    """
+    conn = get_connection()
+    if conn is None:
+        return None
+    try:
+        if not ensure(conn, survey_id):
+            return 0, []
+        key = leaderboard_key(survey_id)
+        count, members = (
+            conn.pipeline().zcard(key).zrevrange(key, start, stop - 1).execute()
+        )
+    except redis.RedisError:
+        return None
+    return count, [int(member) for member in members]
+
+
+def rank(survey_id: int, item_id: int) -> Optional[int]:
+    """Rank
+
+    Rank of the item in the survey's leaderboard, starting at 1, or None if the
+    leaderboard is not available or does not have the item yet
+    """
+    conn = get_connection()
+    if conn is None:
+        return None
+    try:
+        if not ensure(conn, survey_id):
+            return None
+        position = conn.zrevrank(leaderboard_key(survey_id), to_member(item_id))
+    except redis.RedisError:
+        return None
+    return None if position is None else position + 1
+
+
+def check(survey_id: int) -> int:
+    """Check
+
+    Compares the survey's leaderboard with the scores in the database. Returns
+    how many items are missing, extra or have the wrong μ, none if the
+    leaderboard does not exist
+    """
+    from .models import Item
+
+    conn = get_connection()
+    key = leaderboard_key(survey_id)
+    if conn is None or not conn.exists(key):
+        return 0
+    expected = {
+        to_member(item_id): mu
+        for item_id, mu in Item.objects.filter(survey_id=survey_id)
+        .values_list("id", "mu")
+        .iterator(chunk_size=WRITE_BATCH_SIZE)
+    }
+    wrong = 0
+    for member, mu in conn.zscan_iter(key, count=WRITE_BATCH_SIZE):
+        if expected.pop(member.decode(), None) != mu:
+            wrong += 1
+    return wrong + len(expected)
+
+
+def check_leaderboards(survey_ids: Iterable[int]) -> int:
+    """Check leaderboards
+
+    Rebuilds the leaderboards of the given surveys that do not match the
+    database. Returns how many were rebuilt
+    """
+    rebuilt = 0
+    for survey_id in survey_ids:
+        if check(survey_id):
+            rebuild(survey_id)
+            rebuilt += 1
+    return rebuilt
@@ -0,0 +1,39 @@
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from apps.surveys.models import Survey
+from apps.items.leaderboard import check, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuilds surveys' leaderboards from the items' scores"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "surveys", nargs="*", help="UUIDs of the surveys to rebuild"
+        )
+        parser.add_argument("--all", action="store_true", help="Rebuild every survey")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only rebuild the leaderboards that do not match the database",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not settings.REDIS_URL:
+            raise CommandError("Leaderboards need REDIS_URL to be set")
+        if options["all"]:
+            surveys = Survey.objects.all()
+        elif options["surveys"]:
+            surveys = Survey.objects.filter(uuid__in=options["surveys"])
+        else:
+            raise CommandError("Provide survey UUIDs or --all")
+
+        for survey in surveys:
+            if options["check"]:
+                wrong = check(survey.id)
+                self.stdout.write(f"Survey {survey.uuid}: {wrong} items wrong")
+                if not wrong:
+                    continue
+            items = rebuild(survey.id)
+            self.stdout.write(f"Survey {survey.uuid}: {items} items rebuilt")
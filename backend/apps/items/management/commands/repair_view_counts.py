@@ -0,0 +1,27 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from apps.annotators.bitmaps import rebuild_bitmaps
+from apps.surveys.models import Survey
+from apps.items.view_counts import repair_view_counts
+
+
+class Command(BaseCommand):
+    help = "Rebuilds items' view counts from the annotators' viewed items"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("surveys", nargs="*", help="UUIDs of the surveys to repair")
+        parser.add_argument("--all", action="store_true", help="Repair every survey")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["all"]:
+            surveys = Survey.objects.all()
+        elif options["surveys"]:
+            surveys = Survey.objects.filter(uuid__in=options["surveys"])
+        else:
+            raise CommandError("Provide survey UUIDs or --all")
+
+        for survey in surveys:
+            # Brings the viewed relations up to date with the annotators' bitmaps
+            rebuild_bitmaps(survey.annotators.all())
+            repaired = repair_view_counts(survey.items.all())
+            self.stdout.write(f"Survey {survey.uuid}: {repaired} items repaired")
@@ -0,0 +1,60 @@
+"""Item metrics
+
+Prometheus metrics of the expired items sweeps. Sweeps run in the Celery workers,
+which are not scraped, so their counts are accumulated in the shared cache and
+read by a collector whenever the backend's metrics are scraped.
+"""
+from typing import Iterator, Union
+from django.core.cache import cache
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+
+SWEEPS_KEY = "items:sweeps"
+EXPIRED_KEY = "items:expired"
+LAST_SWEEP_KEY = "items:expired_last_sweep"
+
+Metric = Union[CounterMetricFamily, GaugeMetricFamily]
+
+
+def record_sweep(expired: int) -> None:
+    """Record sweep
+
+    Counts a sweep that deactivated `expired` items
+    """
+    for key, amount in ((SWEEPS_KEY, 1), (EXPIRED_KEY, expired)):
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+    cache.set(LAST_SWEEP_KEY, expired, timeout=None)
+
+
+class SweepCollector:
+    def metrics(
+        self, sweeps: int = 0, expired: int = 0, last_sweep: int = 0
+    ) -> Iterator[Metric]:
+        yield CounterMetricFamily(
+            "votai_item_sweeps", "Expired item sweeps run", value=sweeps
+        )
+        yield CounterMetricFamily(
+            "votai_items_expired",
+            "Items deactivated by sweeps because their time ran out",
+            value=expired,
+        )
+        yield GaugeMetricFamily(
+            "votai_items_expired_last_sweep",
+            "Items deactivated by the last sweep",
+            value=last_sweep,
+        )
+
+    def describe(self) -> Iterator[Metric]:
+        # Without reading the cache, which registering the collector would do
+        return self.metrics()
+
+    def collect(self) -> Iterator[Metric]:
+        values = cache.get_many([SWEEPS_KEY, EXPIRED_KEY, LAST_SWEEP_KEY])
+        return self.metrics(
+            values.get(SWEEPS_KEY, 0),
+            values.get(EXPIRED_KEY, 0),
+            values.get(LAST_SWEEP_KEY, 0),
+        )
+
+
+REGISTRY.register(SweepCollector())
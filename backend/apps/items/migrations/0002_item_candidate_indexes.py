@@ -0,0 +1,25 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['survey', 'mu'], name='items_item_survey__8634fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['survey', 'sigma_squared'], name='items_item_survey__c42a69_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['survey', 'uuid'], name='items_item_survey__52d04b_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0003_item_active_until'),
+        ('annotators', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['survey', 'view_count'], name='items_item_survey__23b23e_idx'),
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE items_item SET view_count = (
+                SELECT COUNT(*) FROM annotators_annotator_viewed
+                WHERE annotators_annotator_viewed.item_id = items_item.id
+            )
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.0.5 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0004_item_view_count'),
+        ('surveys', '0007_survey_item_ordinals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='ordinal',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE items_item SET ordinal = numbered.ordinal FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY survey_id ORDER BY id) - 1 AS ordinal
+                FROM items_item
+            ) AS numbered
+            WHERE items_item.id = numbered.id;
+            UPDATE surveys_survey SET item_ordinals = (
+                SELECT COUNT(*) FROM items_item WHERE items_item.survey_id = surveys_survey.id
+            );
+            ''',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='item',
+            constraint=models.UniqueConstraint(fields=('survey', 'ordinal'), name='unique_item_ordinal'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.5 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0005_item_ordinal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['survey', 'mu', 'id'], name='items_item_survey__43bf62_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='item',
+            name='items_item_survey__8634fd_idx',
+        ),
+    ]
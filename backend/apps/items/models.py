@@ -1,11 +1,21 @@
-from django.db import models
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from django.db import models, transaction
 from django.contrib.postgres.fields import JSONField
+from django.utils import timezone
 from backend.fields import ShortUUIDField
-from backend.celery import app as celery_app
 from apps.surveys.models import Survey
+from apps.surveys.versions import bump_score_version
 from apps.crowd_bt.constants import MU, SIGMA_SQUARED
 from apps.crowd_bt.types import Mu, SigmaSquared, RelevanceScore
-from .tasks import auto_deactivate
+from . import leaderboard
+from . import metrics  # pylint: disable=unused-import  # Registers the sweep collector
+
+
+def expiry(max_time: int) -> Optional[datetime]:
+    if max_time <= 0:
+        return None
+    return timezone.now() + timedelta(seconds=max_time)
 
 
 class Item(models.Model):
@@ -14,47 +24,122 @@ class Item(models.Model):
     metadata = JSONField(default=dict)
     active: bool = models.BooleanField(default=False)
     prioritized: bool = models.BooleanField(default=False)
+    # Number of annotators that have viewed the item, see `view`
+    view_count: int = models.PositiveIntegerField(default=0)
+    # When an active item is deactivated by the `deactivate_expired_items` sweep
+    active_until: Optional[datetime] = models.DateTimeField(null=True)
     survey: Survey = models.ForeignKey(
         Survey, on_delete=models.CASCADE, related_name="items"
     )
+    # Dense position of the item in its survey, the bit of the item in the
+    # annotators' bitmaps. Given out by `Survey.reserve_item_ordinals`
+    ordinal: int = models.PositiveIntegerField(editable=False)
 
     mu: Mu = models.FloatField(default=MU)
     sigma_squared: SigmaSquared = models.FloatField(default=SIGMA_SQUARED)
 
+    class Meta:
+        indexes = [
+            # Also serves the ranking's keyset pagination, see `ranking`
+            models.Index(fields=["survey", "mu", "id"]),
+            models.Index(fields=["survey", "sigma_squared"]),
+            models.Index(fields=["survey", "uuid"]),
+            models.Index(fields=["survey", "view_count"]),
+            models.Index(
+                fields=["active_until"],
+                name="items_item_expiry_idx",
+                condition=models.Q(active=True),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["survey", "ordinal"], name="unique_item_ordinal"
+            )
+        ]
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        # pylint: disable=arguments-differ
+        if self.ordinal is None:
+            # Also counts the item in the survey's item_count
+            self.ordinal = Survey.reserve_item_ordinals(self.survey_id)
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "mu" in update_fields:
+            leaderboard.update(self.survey_id, [(self.id, self.mu)])
+        if update_fields is None:
+            # New or edited items change the ranking snapshots, see `ranking`
+            bump_score_version(self.survey_id)
+
+    @transaction.atomic
+    def delete(self, *args: Any, **kwargs: Any) -> Any:
+        # pylint: disable=arguments-differ
+        from apps.annotators import bitmaps
+
+        # The item's labels are deleted along with it
+        labels = self.survey.labels.filter(
+            models.Q(winner_id=self.id) | models.Q(loser_id=self.id)
+        ).count()
+        leaderboard.remove(self.survey_id, [self.id])
+        # So the annotators' bitmaps only count existing items, see `items_left`
+        bitmaps.discard(self.survey.annotators.all(), self.ordinal)
+        deleted = super().delete(*args, **kwargs)
+        Survey.update_counts(self.survey_id, item_count=-1, label_count=-labels)
+        bump_score_version(self.survey_id)
+        return deleted
+
     @property
     def score(self) -> RelevanceScore:
         return RelevanceScore(self.mu, self.sigma_squared)
 
-    @property
-    def auto_deactivate_task_id(self) -> str:
-        current_annotator_uuid = self.current_annotators.only("uuid").first().uuid
-        return f"auto_deactivate_{self.uuid}_{current_annotator_uuid}"
-
     def prioritize(self) -> None:
-        self.prioritized = True
-        self.save()
+        if not self.prioritized:
+            self.prioritized = True
+            self.save(update_fields=["prioritized"])
 
     def deprioritize(self) -> None:
-        self.prioritized = False
-        self.save()
+        if self.prioritized:
+            self.prioritized = False
+            self.save(update_fields=["prioritized"])
+
+    def activate(self, max_time: int = 0) -> None:
+        """Activate
+
+        Marks the item as active. With a positive `max_time`, the item is
+        deactivated by the next sweep after that many seconds
+        """
+        active_until = expiry(max_time)
+        if not self.active or active_until != self.active_until:
+            self.active = True
+            self.active_until = active_until
+            self.save(update_fields=["active", "active_until"])
 
-    def activate(self) -> None:
-        self.active = True
-        self.save()
+    def view(self, max_time: Optional[int] = None) -> None:
+        """View
+
+        Records that the item was shown to one more annotator: counts the view and
+        deprioritizes it, in a single atomic update. Unless `max_time` is None, the
+        item is also activated like `activate` does
+        """
+        fields: Dict[str, Any] = {
+            "view_count": models.F("view_count") + 1,
+            "prioritized": False,
+        }
+        if max_time is not None:
+            self.active = True
+            self.active_until = fields["active_until"] = expiry(max_time)
+            fields["active"] = True
+        Item.objects.filter(id=self.id).update(**fields)
+        # The count may have been updated by others, this is only an estimate
+        self.view_count += 1
+        self.prioritized = False
 
     def deactivate(self) -> None:
-        self.active = False
-        self.save()
-        # Cancel auto deactivation tasks
-        celery_app.control.revoke(self.auto_deactivate_task_id)
+        if self.active or self.active_until is not None:
+            self.active = False
+            self.active_until = None
+            self.save(update_fields=["active", "active_until"])
 
     def update_score(self, new_score: RelevanceScore) -> None:
         self.mu = new_score.mu  # pylint: disable=invalid-name
         self.sigma_squared = new_score.sigma_squared
-        self.save()
-
-    def schedule_deactivate(self, max_time: int) -> None:
-        if max_time > 0:
-            auto_deactivate.apply_async(
-                (self.pk,), countdown=max_time, task_id=self.auto_deactivate_task_id
-            )
+        self.save(update_fields=["mu", "sigma_squared"])
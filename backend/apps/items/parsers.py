@@ -0,0 +1,101 @@
+"""Streaming parsers
+
+Parsers for the item import, which stream the request body instead of loading it
+at once: `request.data` is an iterator over the rows, read as they are consumed.
+Rows that cannot be decoded or parsed are None, so they are reported as errors
+of their own rows instead of failing the whole import.
+"""
+import csv
+import json
+from typing import Any, Dict, Iterator, Mapping, Optional
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+# A row, or None if it could not be parsed
+Row = Optional[Dict[str, Any]]
+
+
+def get_encoding(parser_context: Optional[Mapping[str, Any]]) -> str:
+    encoding: str = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+    return encoding
+
+
+def lines(stream: Any, encoding: str) -> Iterator[str]:
+    # Undecodable bytes are kept as lone surrogates, see `decoded`
+    for line in iter(stream.readline, b""):
+        yield line.decode(encoding, errors="surrogateescape")
+
+
+def decoded(text: str) -> bool:
+    """Decoded
+
+    Whether the text read by `lines` had no undecodable bytes
+    """
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+class NDJSONParser(BaseParser):
+    """NDJSON parser
+
+    One JSON object per line, blank lines are skipped
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(
+        self,
+        stream: Any,
+        media_type: Optional[str] = None,
+        parser_context: Optional[Mapping[str, Any]] = None,
+    ) -> Iterator[Row]:
+        encoding = get_encoding(parser_context)
+        for line in lines(stream, encoding):
+            if not line.strip():
+                continue
+            if not decoded(line):
+                yield None
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+class CSVParser(BaseParser):
+    """CSV parser
+
+    Rows by the column names in the header
+    """
+
+    media_type = "text/csv"
+
+    def parse(
+        self,
+        stream: Any,
+        media_type: Optional[str] = None,
+        parser_context: Optional[Mapping[str, Any]] = None,
+    ) -> Iterator[Row]:
+        encoding = get_encoding(parser_context)
+        rows = csv.DictReader(lines(stream, encoding))
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            except csv.Error:
+                # The reader moves on to the next line
+                yield None
+                continue
+            # Rows with more values than columns have them under None
+            if None in row or not all(
+                decoded(key) and (value is None or decoded(value))
+                for key, value in row.items()
+            ):
+                yield None
+            else:
+                yield dict(row)
@@ -0,0 +1,227 @@
+"""Ranking
+
+The ranking lists a survey's items by descending (mu, id). It is paginated by
+keyset: the cursor of a page is the (mu, id) of the last item of the previous
+one, so every page is a range scan of the (survey, mu, id) index however deep it
+is, and the items are never counted. Pages by offset, and items' ranks, are read
+from the survey's leaderboard when there is one, see `leaderboard`.
+
+How sure the ranking is can be told from the matrix of the probabilities of
+each item beating each other one, computed in a single vectorized pass, and
+from the items' rank intervals, sampled by Monte Carlo.
+
+Pages, win probabilities and rank intervals are also cached as snapshots keyed on the survey's
+score version, which changes with every score update, so polling them between
+votes does not hit the database. Versions are bumped before the votes commit, so
+a snapshot taken meanwhile may miss the vote until it expires, after RANKING_TTL
+seconds. Items' active and prioritized flags change as they are shown, without a
+new version, so ranking pages leave them out.
+"""
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional, Tuple
+import numpy as np
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from apps.crowd_bt import vectorized
+from apps.crowd_bt.types import RelevanceScores
+from backend.custom_types.models import QueryType
+from . import leaderboard
+
+RANKING_TTL = 60
+# Top items in the win probability matrix by default, and at most
+WIN_PROBABILITY_ITEMS = 100
+MAX_WIN_PROBABILITY_ITEMS = 1000
+# Probabilities are sent as multiples of 1 / QUANTIZATION, in uint16
+QUANTIZATION = 65535
+# Score samples for the rank intervals by default, and at most
+RANK_SAMPLES = 200
+MAX_RANK_SAMPLES = 1000
+# Sampled ranks kept at once, at most, as int32 (64 MB)
+MAX_SAMPLED_RANKS = 1 << 24
+
+
+class WinProbabilities(NamedTuple):
+    """Win probabilities
+
+    Probability of each of the ranked `items` beating each of the ones ranked
+    after it, which is the strict upper triangle of the matrix, row by row, as
+    little endian uint16 multiples of 1 / QUANTIZATION. The rest of the matrix
+    follows, as P(j beats i) = 1 - P(i beats j)
+    """
+
+    items: List[str]
+    probabilities: bytes
+
+
+class RankIntervals(NamedTuple):
+    """Rank intervals
+
+    Median rank of each of the ranked `items` and its 90% interval, from `low` to
+    `high`, over samples of the items' scores. Ranks start at 1
+    """
+
+    items: List[str]
+    median: List[int]
+    low: List[int]
+    high: List[int]
+
+
+def snapshot_key(survey_id: int, version: int, url: str) -> str:
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f"items:ranking:{survey_id}:{version}:{digest}"
+
+
+def win_probabilities_key(survey_id: int, version: int, top: int) -> str:
+    return f"items:win_probabilities:{survey_id}:{version}:{top}"
+
+
+def rank_intervals_key(survey_id: int, version: int, samples: int) -> str:
+    return f"items:rank_intervals:{survey_id}:{version}:{samples}"
+
+
+def ranked_scores(
+    items: QueryType, top: Optional[int] = None
+) -> Tuple[List[str], RelevanceScores]:
+    """Ranked scores
+
+    uuids and scores of the `top` ranked items, all of them by default
+    """
+    rows = list(
+        items.order_by("-mu", "-id").values_list("uuid", "mu", "sigma_squared")[:top]
+    )
+    uuids, mu, sigma_squared = zip(*rows) if rows else ((),) * 3
+    return list(uuids), vectorized.as_scores(mu, sigma_squared)
+
+
+def win_probabilities(items: QueryType, top: int) -> WinProbabilities:
+    """Win probabilities
+
+    Win probabilities between the `top` ranked items, see `WinProbabilities`
+    """
+    uuids, scores = ranked_scores(items, top)
+    matrix = vectorized.win_probability(
+        RelevanceScores(scores.mu[:, None], scores.sigma_squared[:, None]), scores
+    )
+    upper = matrix[np.triu_indices(len(uuids), k=1)]
+    return WinProbabilities(
+        uuids, np.round(upper * QUANTIZATION).astype("<u2").tobytes()
+    )
+
+
+def rank_intervals(items: QueryType, samples: int, seed: int) -> RankIntervals:
+    """Rank intervals
+
+    Rank intervals of every item, see `RankIntervals`. Samples are drawn from a
+    generator seeded with `seed`, so the same scores always get the same intervals
+    """
+    uuids, scores = ranked_scores(items)
+    low, median, high = vectorized.rank_percentiles(
+        scores, [5, 50, 95], samples, np.random.default_rng(seed)
+    ).tolist()
+    return RankIntervals(uuids, median, low, high)
+
+
+def item_rank(items: QueryType, item: Any) -> int:
+    """Item rank
+
+    Position of the item among the ranked `items`, starting at 1
+    """
+    rank = leaderboard.rank(item.survey_id, item.id)
+    if rank is None:
+        rank = (
+            items.filter(Q(mu__gt=item.mu) | Q(mu=item.mu, id__gt=item.id)).count() + 1
+        )
+    return rank
+
+
+def encode_cursor(mu: float, item_id: int) -> str:
+    return urlsafe_b64encode(f"{mu!r},{item_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        mu, item_id = urlsafe_b64decode(cursor.encode()).decode().split(",")
+        return float(mu), int(item_id)
+    except ValueError:
+        raise NotFound("Invalid cursor")
+
+
+class RankingPagination(LimitOffsetPagination):
+    """Ranking pagination
+
+    Keyset pagination of querysets ordered by descending (mu, id), see `ranking`.
+    Requests with an `offset` are paginated by offset, like other lists, from the
+    leaderboard of `survey_id` if it is set
+    """
+
+    cursor_query_param = "cursor"
+
+    survey_id: Optional[int] = None
+    keyset = False
+    has_next = False
+    page: List[Any] = []
+
+    def paginate_queryset(
+        self, queryset: QueryType, request: Request, view: Any = None
+    ) -> Optional[List[Any]]:
+        self.keyset = self.offset_query_param not in request.query_params
+        if not self.keyset:
+            return self.paginate_by_offset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request) or api_settings.PAGE_SIZE
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is not None:
+            table = queryset.model._meta.db_table
+            queryset = queryset.extra(
+                where=[f"({table}.mu, {table}.id) < (%s, %s)"],
+                params=list(decode_cursor(cursor)),
+            )
+        page = list(queryset[: self.limit + 1])
+        self.has_next = len(page) > self.limit
+        self.page = page[: self.limit]
+        return self.page
+
+    def paginate_by_offset(
+        self, queryset: QueryType, request: Request, view: Any = None
+    ) -> Optional[List[Any]]:
+        limit, offset = self.get_limit(request), self.get_offset(request)
+        ranked = None
+        if self.survey_id is not None and limit is not None:
+            ranked = leaderboard.page(self.survey_id, offset, offset + limit)
+        if ranked is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request, self.limit, self.offset = request, limit, offset
+        self.count, item_ids = ranked
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        items = queryset.in_bulk(item_ids)
+        # Items deleted since, if any, are left out of the page
+        return [items[item_id] for item_id in item_ids if item_id in items]
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encode_cursor(last.mu, last.id),
+        )
+
+    def get_paginated_response(self, data: Any) -> Response:
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
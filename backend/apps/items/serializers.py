@@ -1,3 +1,5 @@
+import json
+from base64 import b64encode
 from typing import Any
 from rest_framework import serializers
 from backend.mixins.prefetch import PrefetchMixin
@@ -10,6 +12,14 @@ from apps.surveys.fields import (
 )
 from .models import Item
 from .exceptions import ItemsQuotaError
+from .ranking import (
+    MAX_RANK_SAMPLES,
+    MAX_SAMPLED_RANKS,
+    MAX_WIN_PROBABILITY_ITEMS,
+    RANK_SAMPLES,
+    WIN_PROBABILITY_ITEMS,
+    WinProbabilities,
+)
 
 
 class ItemSerializer(
@@ -33,7 +43,7 @@ class ItemSerializer(
         view = self.context["view"]
         survey_id: int = validated_data.get("survey", view.kwargs.get("survey_id"))
         survey: Survey = Survey.objects.get(uuid=survey_id)
-        if survey.max_items > 0 and survey.max_items <= survey.items.count():
+        if survey.max_items > 0 and survey.max_items <= survey.item_count:
             raise ItemsQuotaError()
         validated_data["survey"] = survey
         item: Item = Item.objects.create(**validated_data)
@@ -67,6 +77,121 @@ class ItemSerializer(
         select_related_fields = ["survey"]
 
 
+class RankingItemSerializer(ItemSerializer):
+    # Ranking pages are cached until the scores change, see `ranking`, so they leave
+    # out the flags that change as items are shown to annotators
+    class Meta(ItemSerializer.Meta):
+        fields = [
+            field
+            for field in ItemSerializer.Meta.fields
+            if field not in ("active", "prioritized")
+        ]
+
+
+class ItemImportSerializer(serializers.ModelSerializer):
+    """Item import serializer
+
+    Validates a row of an item import. CSV rows have the metadata as JSON text
+    """
+
+    def validate_metadata(self, value: Any) -> Any:
+        if not isinstance(value, str):
+            return value
+        if not value:
+            return {}
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise serializers.ValidationError("Value must be valid JSON.")
+
+    class Meta:
+        model = Item
+        fields = ["name", "metadata"]
+
+
+class ItemImportResultSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    created = serializers.IntegerField(label="How many items were created")
+    errors = serializers.ListField(
+        label="Errors of the rows that were not imported, by row number (from 1)",
+        child=serializers.DictField(),
+    )
+
+    def to_representation(self, instance: Any) -> Any:
+        return {
+            "created": instance.created,
+            "errors": [error._asdict() for error in instance.errors],
+        }
+
+
+class WinProbabilitiesQuerySerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    top = serializers.IntegerField(
+        label="How many of the top ranked items to compare",
+        min_value=1,
+        max_value=MAX_WIN_PROBABILITY_ITEMS,
+        default=WIN_PROBABILITY_ITEMS,
+    )
+
+
+class WinProbabilitiesSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    items = serializers.ListField(
+        label="IDs of the top ranked items, from best to worst",
+        child=serializers.CharField(),
+    )
+    probabilities = serializers.SerializerMethodField(
+        label="Base64 of the probabilities of each item beating each of the ones after it: the upper triangle of the matrix by rows, as little endian uint16 multiples of 1/65535"
+    )
+
+    def get_probabilities(self, instance: WinProbabilities) -> str:
+        return b64encode(instance.probabilities).decode()
+
+
+class RankIntervalsQuerySerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    samples = serializers.IntegerField(
+        label="How many times to sample the scores",
+        min_value=1,
+        max_value=MAX_RANK_SAMPLES,
+        default=RANK_SAMPLES,
+    )
+
+    def validate(self, attrs: Any) -> Any:
+        # Ranks are sampled for every item, so large surveys get fewer samples
+        items = max(self.context["survey"].item_count, 1)
+        limit = max(MAX_SAMPLED_RANKS // items, 1)
+        if "samples" not in self.initial_data:
+            attrs["samples"] = min(attrs["samples"], limit)
+        elif attrs["samples"] > limit:
+            raise serializers.ValidationError(
+                {"samples": f"Ensure this value is less than or equal to {limit}."}
+            )
+        return attrs
+
+
+class RankIntervalsSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    items = serializers.ListField(
+        label="IDs of the items, from best to worst", child=serializers.CharField(),
+    )
+    median = serializers.ListField(
+        label="Median rank of each item", child=serializers.IntegerField()
+    )
+    low = serializers.ListField(
+        label="5th percentile of each item's rank", child=serializers.IntegerField()
+    )
+    high = serializers.ListField(
+        label="95th percentile of each item's rank", child=serializers.IntegerField()
+    )
+
+
+class ItemRankSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    id = serializers.CharField(label="ID of the item")
+    rank = serializers.IntegerField(label="Position in the ranking, starting at 1")
+
+
 class PrioritizeSerializer(ItemSerializer):
     def update(self, instance: Item, validated_data: Any) -> Item:
         instance.prioritize()
@@ -1,8 +1,11 @@
 from celery import shared_task
+from .metrics import record_sweep
 
 
 @shared_task
 def auto_deactivate(item_id: int) -> None:
+    # Items now expire with `deactivate_expired_items`. Kept so the countdown
+    # tasks queued before it still run
     from .models import Item
 
     try:
@@ -10,3 +13,24 @@ def auto_deactivate(item_id: int) -> None:
         item.deactivate()
     except Item.DoesNotExist:
         pass
+
+
+@shared_task
+def deactivate_expired_items() -> int:
+    from django.utils import timezone
+    from .models import Item
+
+    expired: int = Item.objects.filter(
+        active=True, active_until__lte=timezone.now()
+    ).update(active=False, active_until=None)
+    record_sweep(expired)
+    return expired
+
+
+@shared_task
+def check_leaderboards() -> int:
+    from apps.surveys.models import Survey
+    from .leaderboard import check_leaderboards as check
+
+    rebuilt: int = check(Survey.objects.values_list("id", flat=True).iterator())
+    return rebuilt
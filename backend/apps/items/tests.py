@@ -1,3 +1,390 @@
-from django.test import TestCase
+import gzip
+import json
+from base64 import b64decode
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+import numpy as np
+from unittest import skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.utils import timezone
+from apps.annotators import bitmaps
+from apps.annotators.models import Annotator
+from apps.surveys.models import Survey
+from apps.surveys.versions import bump_score_version
+from . import leaderboard
+from .imports import import_items
+from .metrics import EXPIRED_KEY, LAST_SWEEP_KEY, SWEEPS_KEY
+from .models import Item
+from .tasks import check_leaderboards, deactivate_expired_items
 
-# Create your tests here.
+
+class ExpiryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        survey = Survey.objects.create(name="survey", owner=owner)
+        self.items = [
+            Item.objects.create(name=f"item {i}", survey=survey) for i in range(3)
+        ]
+
+    def test_activate(self):
+        item = self.items[0]
+        item.activate(60)
+        item.refresh_from_db()
+        self.assertTrue(item.active)
+        self.assertGreater(item.active_until, timezone.now())
+
+        item.deactivate()
+        item.refresh_from_db()
+        self.assertFalse(item.active)
+        self.assertIsNone(item.active_until)
+
+        item.activate()
+        self.assertIsNone(Item.objects.get(id=item.id).active_until)
+
+    def test_sweep_deactivates_expired_items(self):
+        expired, running, unlimited = self.items
+        expired.activate(60)
+        running.activate(60)
+        unlimited.activate()
+        Item.objects.filter(id=expired.id).update(
+            active_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(deactivate_expired_items(), 1)
+        self.assertEqual(
+            set(Item.objects.filter(active=True).values_list("id", flat=True)),
+            {running.id, unlimited.id},
+        )
+        self.assertEqual(deactivate_expired_items(), 0)
+        self.assertEqual(
+            cache.get_many([SWEEPS_KEY, EXPIRED_KEY, LAST_SWEEP_KEY]),
+            {SWEEPS_KEY: 2, EXPIRED_KEY: 1, LAST_SWEEP_KEY: 0},
+        )
+
+
+class ViewCountTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner, min_views=0)
+        for i in range(4):
+            Item.objects.create(name=f"item {i}", survey=self.survey)
+        self.annotators = [
+            Annotator.create_annotator(survey=self.survey, name=f"annotator {i}")
+            for i in range(3)
+        ]
+
+    def view_counts(self):
+        viewed_bits = self.survey.annotators.values_list("viewed_bits", flat=True)
+        return {
+            item.id: (
+                item.view_count,
+                sum(
+                    bool(bitmaps.contains(bits, np.array([item.ordinal]))[0])
+                    for bits in viewed_bits
+                ),
+            )
+            for item in self.survey.items.all()
+        }
+
+    def test_view(self):
+        item = Item.objects.create(name="item", survey=self.survey, prioritized=True)
+        item.view()
+        item.view(0)
+        item.refresh_from_db()
+        self.assertEqual(item.view_count, 2)
+        self.assertFalse(item.prioritized)
+        self.assertTrue(item.active)
+        self.assertIsNone(item.active_until)
+
+    def test_assign_counts_views(self):
+        for annotator in self.annotators:
+            annotator.vote(current_wins=True)
+        for view_count, viewers in self.view_counts().values():
+            self.assertEqual(view_count, viewers)
+        self.assertEqual(
+            sum(view_count for view_count, _ in self.view_counts().values()), 6
+        )
+
+    def test_repair_command(self):
+        self.survey.items.update(view_count=7)
+        self.annotators[0].delete()
+        out = StringIO()
+        call_command("repair_view_counts", self.survey.uuid, stdout=out)
+        self.assertIn("4 items repaired", out.getvalue())
+        for view_count, viewers in self.view_counts().values():
+            self.assertEqual(view_count, viewers)
+
+
+class ImportTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey", owner=self.owner, max_items=5
+        )
+        Item.objects.create(name="item", survey=self.survey)
+        self.survey.refresh_from_db()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = reverse(
+            "api:item-bulk-import", kwargs={"survey_id": self.survey.uuid}
+        )
+
+    def test_import_items(self):
+        rows = [{"name": f"item {i}"} for i in range(5)]
+        rows[1] = {"name": "x" * 100}
+        rows.insert(3, None)
+        result = import_items(self.survey, rows, batch_size=2)
+        self.assertEqual(result.created, 4)
+        self.assertEqual([error.row for error in result.errors], [2, 4])
+
+        survey = Survey.objects.get(id=self.survey.id)
+        self.assertEqual(survey.item_count, 5)
+        self.assertEqual(
+            sorted(survey.items.values_list("ordinal", flat=True)), list(range(5))
+        )
+
+    def test_quota_is_checked(self):
+        result = import_items(self.survey, [{"name": "item"}] * 6)
+        self.assertEqual(result.created, 4)
+        self.assertEqual([error.row for error in result.errors], [5, 6])
+
+    def test_import_ndjson(self):
+        body = b'{"name": "a", "metadata": {"x": 1}}\n\nnot json\n{"name": "b"}\n'
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2])
+        self.assertEqual(self.survey.items.get(name="a").metadata, {"x": 1})
+
+    def test_import_csv(self):
+        body = 'name,metadata\na,"{""x"": 1}"\nb,\nc,{bad\n'.encode()
+        response = self.client.post(self.url, body, content_type="text/csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertIn("metadata", response.data["errors"][0]["errors"])
+        self.assertEqual(self.survey.items.get(name="a").metadata, {"x": 1})
+        self.assertEqual(self.survey.items.get(name="b").metadata, {})
+
+    def test_import_skips_unreadable_rows(self):
+        body = b'{"name": "a"}\n{"name": "\xff"}\n{"name": "b"}\n'
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2])
+
+        body = b"name\nc\nd\x00\n\xffe\nf\n"
+        response = self.client.post(self.url, body, content_type="text/csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3])
+
+    def test_import_requires_owner(self):
+        other = get_user_model().objects.create_user("other", "other@votai.io")
+        self.client.force_authenticate(other)
+        response = self.client.post(
+            self.url, b'{"name": "a"}\n', content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_round_trip(self):
+        Item.objects.create(name="tagged", survey=self.survey, metadata={"a": [1]})
+        response = self.client.get(
+            reverse("api:item-export-items", kwargs={"survey_id": self.survey.uuid}),
+            {"gzip": "true"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("items.csv.gz", response["Content-Disposition"])
+        content = gzip.decompress(b"".join(response.streaming_content))
+
+        survey = Survey.objects.create(name="copy", owner=self.owner)
+        self.client.post(
+            reverse("api:item-bulk-import", kwargs={"survey_id": survey.uuid}),
+            content,
+            content_type="text/csv",
+        )
+        self.assertEqual(
+            list(survey.items.order_by("id").values_list("name", "metadata")),
+            list(self.survey.items.order_by("id").values_list("name", "metadata")),
+        )
+
+    def test_export_owner_only(self):
+        other = get_user_model().objects.create_user("other", "other@votai.io")
+        self.client.force_authenticate(other)
+        response = self.client.get(
+            reverse("api:item-export-items", kwargs={"survey_id": self.survey.uuid})
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class RankingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner)
+        # Ties in mu are ordered by id
+        self.items = [
+            Item.objects.create(name=f"item {i}", survey=self.survey, mu=i // 2)
+            for i in range(7)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+        self.url = reverse("api:item-ranking", kwargs={"survey_id": self.survey.uuid})
+
+    def test_keyset_pages(self):
+        ranked, url = [], f"{self.url}?limit=3"
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            ranked += [item["id"] for item in response.data["results"]]
+            url = response.data["next"]
+        expected = sorted(self.items, key=lambda item: (item.mu, item.id), reverse=True)
+        self.assertEqual(ranked, [item.uuid for item in expected])
+
+    def test_offset_pages(self):
+        response = self.client.get(self.url, {"limit": 3, "offset": 3})
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_snapshot(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        Item.objects.filter(id=self.items[0].id).update(mu=10)
+        bump_score_version(self.survey.id)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["id"], self.items[0].uuid)
+
+    def test_snapshot_leaves_out_flags(self):
+        # Flags change without bumping the score version, so would be stale
+        self.items[0].prioritize()
+        item = self.client.get(self.url).data["results"][-1]
+        self.assertEqual(item["id"], self.items[0].uuid)
+        self.assertNotIn("prioritized", item)
+        self.assertNotIn("active", item)
+
+    def test_win_probabilities(self):
+        url = reverse(
+            "api:item-win-probabilities", kwargs={"survey_id": self.survey.uuid}
+        )
+        response = self.client.get(url, {"top": 4})
+        self.assertEqual(response.status_code, 200)
+        ranked = sorted(self.items, key=lambda item: (item.mu, item.id), reverse=True)
+        self.assertEqual(response.data["items"], [item.uuid for item in ranked[:4]])
+        probabilities = np.frombuffer(
+            b64decode(response.data["probabilities"]), dtype="<u2"
+        )
+        # Upper triangle of 4 items by rows, the second and third ones are tied
+        self.assertEqual(len(probabilities), 6)
+        self.assertEqual(probabilities[3], 32768)
+        self.assertTrue(np.all(np.delete(probabilities, 3) > 32768))
+
+        # Only the survey is loaded, for its owner
+        with self.assertNumQueries(1):
+            self.client.get(url, {"top": 4})
+        response = self.client.get(url, {"top": 0})
+        self.assertEqual(response.status_code, 400)
+
+        other = get_user_model().objects.create_user("other", "other@votai.io")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url, {"top": 4}).status_code, 403)
+
+    def test_rank_intervals(self):
+        Item.objects.filter(id=self.items[6].id).update(sigma_squared=0)
+        url = reverse("api:item-rank-intervals", kwargs={"survey_id": self.survey.uuid})
+        response = self.client.get(url, {"samples": 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["items"][0], self.items[6].uuid)
+        self.assertEqual(len(response.data["median"]), 7)
+        for low, median, high in zip(
+            response.data["low"], response.data["median"], response.data["high"]
+        ):
+            self.assertTrue(1 <= low <= median <= high <= 7)
+
+        cached = self.client.get(url, {"samples": 50})
+        self.assertEqual(cached.data, response.data)
+
+    @patch("apps.items.serializers.MAX_SAMPLED_RANKS", 70)
+    def test_rank_intervals_limits(self):
+        url = reverse("api:item-rank-intervals", kwargs={"survey_id": self.survey.uuid})
+        self.survey.refresh_from_db()
+        # 10 samples of the 7 items at most
+        self.assertEqual(self.client.get(url, {"samples": 11}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        other = get_user_model().objects.create_user("other", "other@votai.io")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_item_rank(self):
+        ranked = sorted(self.items, key=lambda item: (item.mu, item.id), reverse=True)
+        for rank in (1, 4, 7):
+            item = ranked[rank - 1]
+            response = self.client.get(
+                reverse(
+                    "api:item-rank",
+                    kwargs={"survey_id": self.survey.uuid, "id": item.uuid},
+                )
+            )
+            self.assertEqual(response.data, {"id": item.uuid, "rank": rank})
+
+    def test_export_ranking(self):
+        response = self.client.get(
+            reverse("api:item-export-ranking", kwargs={"survey_id": self.survey.uuid}),
+            {"export_format": "ndjson"},
+        )
+        content = b"".join(response.streaming_content)
+        rows = [json.loads(line) for line in content.splitlines()]
+        ranked = sorted(self.items, key=lambda item: (item.mu, item.id), reverse=True)
+        self.assertEqual([row["id"] for row in rows], [item.uuid for item in ranked])
+        self.assertEqual([row["rank"] for row in rows], list(range(1, 8)))
+
+
+@skipUnless(settings.REDIS_URL, "Leaderboards need Redis")
+class LeaderboardTestCase(TransactionTestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner)
+        self.items = [
+            Item.objects.create(name=f"item {i}", survey=self.survey, mu=i // 2)
+            for i in range(7)
+        ]
+        self.ranked = [
+            item.id
+            for item in sorted(
+                self.items, key=lambda item: (item.mu, item.id), reverse=True
+            )
+        ]
+
+    def tearDown(self):
+        leaderboard.get_connection().delete(leaderboard.leaderboard_key(self.survey.id))
+
+    def test_page_and_rank(self):
+        self.assertEqual(leaderboard.page(self.survey.id, 2, 5), (7, self.ranked[2:5]))
+        self.assertEqual(leaderboard.rank(self.survey.id, self.ranked[3]), 4)
+
+        # Written once committed
+        item = self.items[0]
+        item.mu = 10
+        item.save(update_fields=["mu"])
+        self.assertEqual(leaderboard.rank(self.survey.id, item.id), 1)
+        item.delete()
+        self.assertEqual(leaderboard.page(self.survey.id, 0, 10)[0], 6)
+
+    def test_check(self):
+        leaderboard.rebuild(self.survey.id)
+        self.assertEqual(leaderboard.check(self.survey.id), 0)
+
+        Item.objects.filter(id=self.items[0].id).update(mu=10)
+        self.assertEqual(leaderboard.check(self.survey.id), 1)
+        self.assertEqual(check_leaderboards(), 1)
+        self.assertEqual(leaderboard.rank(self.survey.id, self.items[0].id), 1)
@@ -0,0 +1,29 @@
+"""View counts
+
+`Item.view_count` is kept up to date as items are shown to annotators, but it
+drifts when views are removed some other way, e.g. when an annotator is deleted.
+It can then be rebuilt from the annotators' viewed relations, once
+`rebuild_bitmaps` has brought them up to date with their bitmaps.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from backend.custom_types.models import QueryType
+from .models import Item
+
+
+def repair_view_counts(items: QueryType[Item]) -> int:
+    """Repair view counts
+
+    Sets the view count of the given items to their number of viewers, in a
+    single query. Returns how many were wrong
+    """
+    viewers = (
+        Item.viewed_by.through.objects.filter(item_id=OuterRef("id"))
+        .order_by()
+        .values("item_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    view_count = Coalesce(Subquery(viewers, output_field=IntegerField()), Value(0))
+    repaired: int = items.exclude(view_count=view_count).update(view_count=view_count)
+    return repaired
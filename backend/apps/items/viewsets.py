@@ -1,21 +1,58 @@
-from typing import Any
+from typing import Any, Callable, Iterable, Sequence
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
 from rest_framework import permissions, viewsets
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.generics import get_object_or_404
 from rest_condition import And
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from backend.permissions.ownership import OwnsObject
 from backend.mixins.prefetch import PrefetchQuerysetModelMixin
+from backend.mixins.shared_object import SharedObjectMixin
 from backend.mixins.queryfields import QueryFieldsMixin
 from backend.custom_types.models import QueryType
-from .serializers import ItemSerializer, PrioritizeSerializer, DeprioritizeSerializer
+from backend.exports import ExportQuerySerializer, export_response
+from apps.surveys.ids import get_survey_id
+from apps.surveys.models import Survey
+from apps.surveys.versions import get_score_version
+from .exports import ITEM_FIELDS, RANKING_FIELDS, item_rows, ranking_rows
+from .imports import import_items
+from .parsers import CSVParser, NDJSONParser
+from .ranking import (
+    RANKING_TTL,
+    RankingPagination,
+    item_rank,
+    rank_intervals,
+    rank_intervals_key,
+    snapshot_key,
+    win_probabilities,
+    win_probabilities_key,
+)
+from .serializers import (
+    ItemSerializer,
+    ItemImportSerializer,
+    ItemImportResultSerializer,
+    PrioritizeSerializer,
+    DeprioritizeSerializer,
+    RankingItemSerializer,
+    WinProbabilitiesQuerySerializer,
+    WinProbabilitiesSerializer,
+    RankIntervalsQuerySerializer,
+    RankIntervalsSerializer,
+    ItemRankSerializer,
+)
 from .models import Item
 
 
 class SurveyItemViewset(
-    PrefetchQuerysetModelMixin, QueryFieldsMixin, viewsets.ModelViewSet
+    SharedObjectMixin,
+    PrefetchQuerysetModelMixin,
+    QueryFieldsMixin,
+    viewsets.ModelViewSet,
 ):
 
     swagger_tags = ["Items"]
@@ -30,10 +67,10 @@ class SurveyItemViewset(
     queryset = Item.objects.all()
 
     def get_queryset(self) -> QueryType[Item]:
-        survey_id = self.kwargs.get("survey_id")
-        qs: QueryType[Item] = super().get_queryset().filter(survey__uuid=survey_id)
+        survey_id = get_survey_id(self.kwargs.get("survey_id"))
+        qs: QueryType[Item] = super().get_queryset().filter(survey_id=survey_id)
         if self.action == "ranking":
-            qs = qs.order_by("-mu")
+            qs = qs.order_by("-mu", "-id")
         return qs
 
     def get_serializer_class(self) -> Any:
@@ -41,15 +78,180 @@ class SurveyItemViewset(
             return PrioritizeSerializer
         if self.action == "deprioritize":
             return DeprioritizeSerializer
+        if self.action == "bulk_import":
+            return ItemImportSerializer
+        if self.action == "ranking":
+            return RankingItemSerializer
         return super().get_serializer_class()
 
-    @action(detail=False, methods=["get"])
+    def get_owned_survey(self, request: Request) -> Survey:
+        """Get owned survey
+
+        The survey of the route, for list actions that are only for its owner
+        """
+        survey: Survey = get_object_or_404(Survey, uuid=self.kwargs.get("survey_id"))
+        if not request.user.is_staff and survey.owner_id != request.user.id:
+            raise PermissionDenied()
+        return survey
+
+    @action(detail=False, methods=["get"], pagination_class=RankingPagination)
     def ranking(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Ranked items
 
-        Returns the list of items ranked from best to worst.
+        Returns the list of items ranked from best to worst. Pages are linked by cursor, follow `next` to get the next one. With `offset`, it is paginated by offset like the other lists.
+        """
+        survey_id = get_survey_id(kwargs.get("survey_id"))
+        if survey_id is None:
+            return super().list(request, *args, **kwargs)
+        self.paginator.survey_id = survey_id
+        key = snapshot_key(
+            survey_id, get_score_version(survey_id), request.build_absolute_uri()
+        )
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, RANKING_TTL)
+        return Response(data)
+
+    @swagger_auto_schema(
+        query_serializer=WinProbabilitiesQuerySerializer,
+        responses={
+            200: WinProbabilitiesSerializer,
+            403: "You don't have access to the survey",
+            404: "Survey does not exist",
+        },
+    )
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def win_probabilities(
+        self, request: Request, *args: Any, **kwargs: Any
+    ) -> Response:
+        """Win probabilities
+
+        Returns the probability of each of the top ranked items beating each other one, under the Crowd-BT model with the items' score uncertainty. Only the upper triangle is sent, as P(j beats i) = 1 - P(i beats j): decode `probabilities` from base64 as little endian uint16 and divide by 65535, the first `len(items) - 1` values are the probabilities of the first item beating each of the next ones, then those of the second item, and so on.
+        """
+        survey = self.get_owned_survey(request)
+        query = WinProbabilitiesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        top = query.validated_data["top"]
+        key = win_probabilities_key(survey.id, get_score_version(survey.id), top)
+        data = cache.get(key)
+        if data is None:
+            data = WinProbabilitiesSerializer(
+                win_probabilities(survey.items.all(), top)
+            ).data
+            cache.set(key, data, RANKING_TTL)
+        return Response(data)
+
+    @swagger_auto_schema(
+        query_serializer=RankIntervalsQuerySerializer,
+        responses={
+            200: RankIntervalsSerializer,
+            400: "Too many samples for the survey's number of items",
+            403: "You don't have access to the survey",
+            404: "Survey does not exist",
+        },
+    )
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def rank_intervals(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Rank intervals
+
+        Returns the median rank of every item and its 90% interval, from `low` to `high`, by sampling the items' scores `samples` times. Items are listed from best to worst, and the lists of ranks are in the same order.
+        """
+        survey = self.get_owned_survey(request)
+        query = RankIntervalsQuerySerializer(
+            data=request.query_params, context={"survey": survey}
+        )
+        query.is_valid(raise_exception=True)
+        samples = query.validated_data["samples"]
+        version = get_score_version(survey.id)
+        key = rank_intervals_key(survey.id, version, samples)
+        data = cache.get(key)
+        if data is None:
+            data = RankIntervalsSerializer(
+                rank_intervals(survey.items.all(), samples, version)
+            ).data
+            cache.set(key, data, RANKING_TTL)
+        return Response(data)
+
+    @swagger_auto_schema(
+        responses={
+            200: ItemImportResultSerializer,
+            403: "You don't have access to the survey",
+            404: "Survey does not exist",
+        }
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[NDJSONParser, CSVParser],
+    )
+    def bulk_import(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Import items
+
+        Creates many items at once from a stream of rows, either NDJSON (`application/x-ndjson`, one object per line) or CSV (`text/csv`, with a header). Every row has a `name` and optionally `metadata`, as JSON text in CSV. Rows with errors, or over the survey's quota of items, are not imported and their errors are returned by row number, starting at 1.
+        """
+        survey = self.get_owned_survey(request)
+        result = import_items(survey, request.data)
+        return Response(ItemImportResultSerializer(result).data)
+
+    @swagger_auto_schema(
+        query_serializer=ExportQuerySerializer,
+        responses={
+            200: "CSV or NDJSON file",
+            403: "You don't have access to the survey",
+            404: "Survey does not exist",
+        },
+    )
+    @action(detail=False, methods=["get"], url_path="export")
+    def export_items(self, request: Request, *args: Any, **kwargs: Any) -> Any:
+        """Export items
+
+        Streams every item of the survey as a CSV or NDJSON file, optionally gzipped. The CSV file can be imported back.
+        """
+        return self.export(request, ITEM_FIELDS, item_rows, "items", **kwargs)
+
+    @swagger_auto_schema(
+        query_serializer=ExportQuerySerializer,
+        responses={
+            200: "CSV or NDJSON file",
+            403: "You don't have access to the survey",
+            404: "Survey does not exist",
+        },
+    )
+    @action(detail=False, methods=["get"], url_path="ranking/export")
+    def export_ranking(self, request: Request, *args: Any, **kwargs: Any) -> Any:
+        """Export ranking
+
+        Streams the ranking of the survey's items, from best to worst, as a CSV or NDJSON file, optionally gzipped.
+        """
+        return self.export(request, RANKING_FIELDS, ranking_rows, "ranking", **kwargs)
+
+    def export(
+        self,
+        request: Request,
+        fields: Sequence[str],
+        rows: Callable[[QueryType[Item]], Iterable[Sequence[Any]]],
+        name: str,
+        **kwargs: Any,
+    ) -> StreamingHttpResponse:
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        survey = self.get_owned_survey(request)
+        return export_response(
+            fields, rows(survey.items.all()), name, **query.validated_data
+        )
+
+    @swagger_auto_schema(responses={200: ItemRankSerializer})
+    @action(detail=True, methods=["get"])
+    def rank(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Item rank
+
+        Returns the item's position in the ranking, starting at 1 for the best one.
         """
-        return super().list(request, *args, **kwargs)
+        item: Item = self.get_object()
+        rank = item_rank(self.get_queryset(), item)
+        return Response(ItemRankSerializer({"id": item.uuid, "rank": rank}).data)
 
     @action(detail=True, methods=["post"])
     def prioritize(self, request: Request, *args: Any, **kwargs: Any) -> Response:
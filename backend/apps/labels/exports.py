@@ -0,0 +1,25 @@
+"""Label exports
+
+Rows of the label export, read from a server-side cursor, see `backend.exports`
+"""
+from typing import Any, Iterator, Tuple
+from backend.custom_types.models import QueryType
+from backend.exports import EXPORT_CHUNK_SIZE
+
+LABEL_FIELDS = ("id", "datetime", "annotator", "winner", "loser", "processed")
+
+
+def label_rows(labels: QueryType) -> Iterator[Tuple[Any, ...]]:
+    rows: Iterator[Tuple[Any, ...]] = (
+        labels.order_by("datetime", "id")
+        .values_list(
+            "id",
+            "datetime",
+            "annotator__uuid",
+            "winner__uuid",
+            "loser__uuid",
+            "processed",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return rows
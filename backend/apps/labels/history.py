@@ -0,0 +1,193 @@
+"""Label history
+
+Helpers to read a survey's labels as NumPy arrays and to write back the scores
+and confidences computed from them. Items and annotators are mapped to dense
+indexes (their position in the sorted array of ids) so they can be used directly
+to index score and confidence arrays
+"""
+from itertools import islice
+from typing import Any, Iterator, NamedTuple, Sequence, Tuple
+import numpy as np
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from apps.annotators.models import Annotator
+from apps.crowd_bt.types import AnnotatorConfidences, RelevanceScores
+from apps.items import leaderboard
+from apps.items.models import Item
+from apps.surveys.models import Survey
+from backend.custom_types.models import QueryType
+from .models import Label
+
+CHUNK_SIZE = 100_000
+UPDATE_BATCH_SIZE = 1000
+
+
+class LabelChunk(NamedTuple):
+    """Label Chunk
+
+    Dense indexes of the winner, loser and annotator of a batch of labels.
+    Labels without an annotator have -1 as their annotator index
+    """
+
+    winners: np.ndarray
+    losers: np.ndarray
+    annotators: np.ndarray
+
+
+def dense_ids(ids: Sequence[int]) -> np.ndarray:
+    """Dense ids
+
+    Sorted array of ids. The position of an id in this array is its dense index
+    """
+    return np.sort(np.asarray(ids, dtype=np.int64))
+
+
+def to_dense(index: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """To dense
+
+    Maps ids to their dense index. Ids that are not in the index are mapped to -1
+    """
+    positions = np.searchsorted(index, ids)
+    positions[positions == len(index)] = 0
+    found = index[positions] == ids if len(index) else np.zeros(len(ids), bool)
+    return np.where(found, positions, -1)
+
+
+def survey_index(survey: Survey) -> Tuple[np.ndarray, np.ndarray]:
+    """Survey index
+
+    Returns the dense item and annotator ids of a survey
+    """
+    item_ids = dense_ids(survey.items.values_list("id", flat=True))
+    annotator_ids = dense_ids(survey.annotators.values_list("id", flat=True))
+    return item_ids, annotator_ids
+
+
+def history_labels(survey: Survey, mark: int) -> QueryType[Label]:
+    """History labels
+
+    The survey's labels up to the `mark` label id, see `snapshot.label_mark`.
+    Labels recorded while the history is being processed are left out, so they
+    can be told apart
+    """
+    return survey.labels.filter(id__lte=mark)
+
+
+def reindex(
+    index: np.ndarray, values: np.ndarray, new_index: np.ndarray, default: Any
+) -> np.ndarray:
+    """Reindex
+
+    Values of the ids of `new_index`, from the values of the ids of `index`, or
+    `default` for the ids missing from it
+    """
+    positions = to_dense(index, new_index)
+    found = positions >= 0
+    result = np.full(len(new_index), default, dtype=values.dtype)
+    result[found] = values[positions[found]]
+    return result
+
+
+def labeled_annotators(annotators: np.ndarray, n_annotators: int) -> np.ndarray:
+    """Labeled annotators
+
+    Boolean array of whether each annotator has any of the labels, given their
+    dense annotator indexes
+    """
+    labeled = np.zeros(n_annotators, dtype=bool)
+    labeled[annotators[annotators >= 0]] = True
+    return labeled
+
+
+def iter_label_chunks(
+    labels: QueryType[Label],
+    item_ids: np.ndarray,
+    annotator_ids: np.ndarray,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[LabelChunk]:
+    """Iterate label chunks
+
+    Streams the labels in the queryset's order with a server-side cursor, yielding
+    them as dense arrays of at most `chunk_size` labels. Labels of items missing
+    from the index are skipped
+    """
+    rows = (
+        labels.annotate(annotator_or_none=Coalesce("annotator_id", Value(-1)))
+        .values_list("winner_id", "loser_id", "annotator_or_none")
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = np.array(list(islice(rows, chunk_size)), dtype=np.int64)
+        if not len(chunk):  # pylint: disable=len-as-condition
+            return
+        winners = to_dense(item_ids, chunk[:, 0])
+        losers = to_dense(item_ids, chunk[:, 1])
+        known = (winners >= 0) & (losers >= 0)
+        yield LabelChunk(
+            winners[known], losers[known], to_dense(annotator_ids, chunk[known, 2])
+        )
+
+
+def load_labels(
+    labels: QueryType[Label],
+    item_ids: np.ndarray,
+    annotator_ids: np.ndarray,
+    chunk_size: int = CHUNK_SIZE,
+) -> LabelChunk:
+    """Load labels
+
+    Loads every label of the queryset into a single LabelChunk. The arrays are
+    allocated once, so no more than one chunk of Python objects is alive at a time
+    """
+    total = labels.count()
+    history = LabelChunk(
+        np.empty(total, dtype=np.int64),
+        np.empty(total, dtype=np.int64),
+        np.empty(total, dtype=np.int64),
+    )
+    start = 0
+    for chunk in iter_label_chunks(labels, item_ids, annotator_ids, chunk_size):
+        end = min(start + len(chunk.winners), total)
+        for array, values in zip(history, chunk):
+            array[start:end] = values[: end - start]
+        start = end
+    # Skipped labels, or labels deleted after the count, leave a shorter history
+    return LabelChunk(*(array[:start] for array in history))
+
+
+def save_state(
+    survey_id: int,
+    item_ids: np.ndarray,
+    scores: RelevanceScores,
+    annotator_ids: np.ndarray,
+    confidences: AnnotatorConfidences,
+) -> None:
+    """Save state
+
+    Writes the scores and confidences arrays back to their items and annotators
+    with bulk updates, in a single transaction, and the scores to the survey's
+    leaderboard
+    """
+    items = [
+        Item(id=item_id, mu=mu, sigma_squared=sigma_squared)
+        for item_id, mu, sigma_squared in zip(
+            item_ids.tolist(), scores.mu.tolist(), scores.sigma_squared.tolist()
+        )
+    ]
+    annotators = [
+        Annotator(id=annotator_id, alpha=alpha, beta=beta)
+        for annotator_id, alpha, beta in zip(
+            annotator_ids.tolist(),
+            confidences.alpha.tolist(),
+            confidences.beta.tolist(),
+        )
+    ]
+    with transaction.atomic():
+        Item.objects.bulk_update(
+            items, ["mu", "sigma_squared"], batch_size=UPDATE_BATCH_SIZE
+        )
+        Annotator.objects.bulk_update(
+            annotators, ["alpha", "beta"], batch_size=UPDATE_BATCH_SIZE
+        )
+        leaderboard.update(survey_id, zip(item_ids.tolist(), scores.mu.tolist()))
@@ -0,0 +1,56 @@
+"""Locks
+
+Postgres advisory locks keyed on a survey, held until the end of the current
+transaction.
+
+The scoring lock is held by whoever rewrites the scores from the labels in
+batches: the pending labels scorer, refits and replays, so no two of them write
+the same scores at once.
+
+The labels lock is held in shared mode by votes while they record labels and
+update scores, and in exclusive mode by refits and replays when they take their
+snapshot of the labels and when they save their results, so every label is either
+in the snapshot or recorded afterwards, and no score written by a vote is lost.
+"""
+from django.db import connection
+
+# First half of the advisory lock keys, the survey's id is the second one
+LOCK_NAMESPACE = 0x5C0E
+LABELS_LOCK_NAMESPACE = 0x5C0F
+
+
+def try_lock_survey(survey_id: int) -> bool:
+    """Try lock survey
+
+    Takes the survey's scoring lock until the end of the current transaction,
+    unless someone else holds it. Returns whether it was taken
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_xact_lock(%s, %s)", [LOCK_NAMESPACE, survey_id]
+        )
+        locked: bool = cursor.fetchone()[0]
+    return locked
+
+
+def lock_survey(survey_id: int) -> None:
+    """Lock survey
+
+    Takes the survey's scoring lock until the end of the current transaction,
+    waiting for whoever holds it
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s, %s)", [LOCK_NAMESPACE, survey_id]
+        )
+
+
+def lock_labels(survey_id: int, shared: bool = False) -> None:
+    """Lock labels
+
+    Takes the survey's labels lock until the end of the current transaction,
+    shared by votes, waiting for whoever holds it in a conflicting mode
+    """
+    function = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {function}(%s, %s)", [LABELS_LOCK_NAMESPACE, survey_id])
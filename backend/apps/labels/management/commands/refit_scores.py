@@ -0,0 +1,36 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from apps.surveys.models import Survey
+from apps.labels.history import CHUNK_SIZE
+from apps.labels.refit import refit_survey
+
+
+class Command(BaseCommand):
+    help = "Re-estimates items' scores and annotators' confidences from all labels"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("surveys", nargs="*", help="UUIDs of the surveys to refit")
+        parser.add_argument(
+            "--all", action="store_true", help="Refit every active survey"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of labels read from the database at a time",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["all"]:
+            surveys = Survey.objects.filter(active=True)
+        elif options["surveys"]:
+            surveys = Survey.objects.filter(uuid__in=options["surveys"])
+        else:
+            raise CommandError("Provide survey UUIDs or --all")
+
+        for survey in surveys:
+            result = refit_survey(survey, chunk_size=options["chunk_size"])
+            self.stdout.write(
+                f"Survey {survey.uuid}: {result.iterations} iterations, "
+                + ("converged" if result.converged else "did not converge")
+            )
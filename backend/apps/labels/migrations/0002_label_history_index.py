@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labels', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(fields=['survey', 'datetime', 'id'], name='labels_labe_survey__b0d2b9_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labels', '0002_label_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='label',
+            name='processed',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(condition=models.Q(processed=False), fields=['survey', 'datetime', 'id'], name='labels_label_pending_idx'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 from django.db import models
 from apps.surveys.models import Survey
 from apps.annotators.models import Annotator
@@ -21,10 +21,52 @@ class Label(models.Model):
         Item, on_delete=models.CASCADE, related_name="loser_labels"
     )
 
+    # False while an asynchronously scored label waits for its scores to be updated
+    processed: bool = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["survey", "datetime", "id"]),
+            models.Index(
+                fields=["survey", "datetime", "id"],
+                name="labels_label_pending_idx",
+                condition=models.Q(processed=False),
+            ),
+        ]
+
+    def save(self, *args: Any, counted: bool = True, **kwargs: Any) -> None:
+        # pylint: disable=arguments-differ
+        # Without `counted`, the survey's label_count is only counted in memory and
+        # the caller updates the survey's row, see `Annotator.vote`
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            if counted:
+                self.count_created(self.survey, 1)
+            else:
+                self.survey.label_count += 1
+
+    @staticmethod
+    def count_created(survey: Survey, count: int) -> None:
+        # The survey instance is counted too, so its gamma takes the labels into account
+        Survey.update_counts(survey.id, label_count=count)
+        survey.label_count += count
+
     @classmethod
-    def create_label(cls, annotator: Annotator, winner: Item, loser: Item) -> "Label":
+    def create_label(
+        cls,
+        annotator: Annotator,
+        winner: Item,
+        loser: Item,
+        processed: bool = True,
+        counted: bool = True,
+    ) -> "Label":
         label = cls(
-            survey=annotator.survey, annotator=annotator, winner=winner, loser=loser
+            survey=annotator.survey,
+            annotator=annotator,
+            winner=winner,
+            loser=loser,
+            processed=processed,
         )
-        label.save()
+        label.save(counted=counted)
         return label
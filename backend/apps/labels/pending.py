@@ -0,0 +1,152 @@
+"""Pending labels
+
+Scoring for surveys with `async_scoring`. Votes only record their label as not
+processed, so requests do not wait for the scoring math nor for row locks on hot
+items. The labels are then applied in batches, in the order they were created, by
+a single writer per survey: the survey's scoring lock (see `locks`) is held
+while a batch is scored, so concurrent workers never read and write the same
+scores at once and no update is lost.
+
+At most one scoring task is queued per survey. A worker that finds the survey
+locked leaves it waiting instead of trying again, and whoever holds the lock
+schedules one more run once it is done.
+"""
+from typing import Optional
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from apps.annotators.models import Annotator
+from apps.crowd_bt.replay import replay
+from apps.crowd_bt.types import (
+    AnnotatorConfidence,
+    AnnotatorConfidences,
+    RelevanceScores,
+)
+from apps.items.models import Item
+from apps.surveys.models import Survey
+from apps.surveys.versions import bump_score_version
+from .history import dense_ids, save_state, to_dense
+from .locks import try_lock_survey
+from .models import Label
+
+BATCH_SIZE = 1000
+# Seconds the scheduling flags are kept, in case a worker dies before clearing them
+SCHEDULE_TTL = 60
+
+
+def scheduled_key(survey_id: int) -> str:
+    return f"labels:{survey_id}:scoring_scheduled"
+
+
+def waiting_key(survey_id: int) -> str:
+    return f"labels:{survey_id}:scoring_waiting"
+
+
+def schedule_scoring(survey_id: int) -> None:
+    """Schedule scoring
+
+    Queues the scoring of the survey's pending labels, unless it is queued already
+    """
+    from .tasks import score_survey_labels
+
+    if cache.add(scheduled_key(survey_id), True, SCHEDULE_TTL):
+        score_survey_labels.delay(survey_id)
+
+
+def start_scoring(survey_id: int) -> None:
+    # Labels recorded from now on queue another run
+    cache.delete(scheduled_key(survey_id))
+
+
+def scoring_locked(survey_id: int) -> None:
+    # The lock holder scores every label pending by now
+    cache.delete(waiting_key(survey_id))
+
+
+def scoring_unlocked(survey_id: int) -> None:
+    """Scoring unlocked
+
+    Schedules the run of the workers that found the survey locked, if any. Must
+    be called once the lock is released
+    """
+    if cache.get(waiting_key(survey_id)):
+        schedule_scoring(survey_id)
+
+
+def score_batch(survey: Survey, batch_size: int = BATCH_SIZE) -> int:
+    """Score batch
+
+    Applies the survey's oldest pending labels to the scores of their items and
+    the confidences of their annotators, and marks them as processed. Must run in
+    a transaction holding the survey's lock. Returns the number of labels scored
+    """
+    labels = np.array(
+        survey.labels.filter(processed=False)
+        .order_by("datetime", "id")
+        .annotate(annotator_or_none=Coalesce("annotator_id", Value(-1)))
+        .values_list("id", "winner_id", "loser_id", "annotator_or_none")[:batch_size],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    if not len(labels):  # pylint: disable=len-as-condition
+        return 0
+    label_ids, winners, losers, annotators = labels.T
+
+    items = list(
+        Item.objects.filter(id__in=np.union1d(winners, losers).tolist())
+        .order_by("id")
+        .values_list("id", "mu", "sigma_squared")
+    )
+    confidences = list(
+        Annotator.objects.filter(id__in=np.unique(annotators[annotators >= 0]).tolist())
+        .order_by("id")
+        .values_list("id", "alpha", "beta")
+    )
+    item_ids = dense_ids([row[0] for row in items])
+    annotator_ids = dense_ids([row[0] for row in confidences])
+    scores = RelevanceScores(
+        np.array([row[1] for row in items], dtype=np.float64),
+        np.array([row[2] for row in items], dtype=np.float64),
+    )
+    annotator_confidences = AnnotatorConfidences(
+        np.array([row[1] for row in confidences], dtype=np.float64),
+        np.array([row[2] for row in confidences], dtype=np.float64),
+    )
+
+    winners, losers = to_dense(item_ids, winners), to_dense(item_ids, losers)
+    known = (winners >= 0) & (losers >= 0)
+    replay(
+        scores,
+        annotator_confidences,
+        winners[known],
+        losers[known],
+        to_dense(annotator_ids, annotators[known]),
+        default_confidence=AnnotatorConfidence(*survey.get_default_annotator_quality()),
+    )
+    save_state(survey.id, item_ids, scores, annotator_ids, annotator_confidences)
+    Label.objects.filter(id__in=label_ids.tolist()).update(processed=True)
+    bump_score_version(survey.id, len(label_ids))
+    return len(label_ids)
+
+
+def score_pending_labels(survey: Survey, batch_size: int = BATCH_SIZE) -> Optional[int]:
+    """Score pending labels
+
+    Scores batches of the survey's pending labels until there are none left, each
+    batch in its own transaction. Returns the number of labels scored, or None if
+    another worker was already scoring the survey
+    """
+    scored = 0
+    while True:
+        # Set before trying, so the holder sees it once it releases the lock
+        cache.set(waiting_key(survey.id), True, SCHEDULE_TTL)
+        with transaction.atomic():
+            if not try_lock_survey(survey.id):
+                return scored or None
+            scoring_locked(survey.id)
+            batch = score_batch(survey, batch_size)
+        scoring_unlocked(survey.id)
+        if not batch:
+            return scored
+        scored += batch
@@ -0,0 +1,44 @@
+from apps.crowd_bt.offline import RefitResult, refit
+from apps.crowd_bt.types import AnnotatorConfidence
+from apps.surveys.models import Survey
+from .history import (
+    CHUNK_SIZE,
+    history_labels,
+    labeled_annotators,
+    load_labels,
+    survey_index,
+)
+from .snapshot import label_mark, save_snapshot
+
+
+def refit_survey(survey: Survey, chunk_size: int = CHUNK_SIZE) -> RefitResult:
+    """Refit survey
+
+    Re-estimates every item's score and every annotator's confidence of the survey
+    from its whole label history and saves them, along with the labels recorded
+    meanwhile, see `snapshot`. Annotators without labels keep their confidence.
+    The labels pending to be scored are included and marked as processed
+    """
+    mark = label_mark(survey)
+    item_ids, annotator_ids = survey_index(survey)
+    history = load_labels(
+        history_labels(survey, mark), item_ids, annotator_ids, chunk_size
+    )
+    result = refit(
+        *history,
+        n_items=len(item_ids),
+        n_annotators=len(annotator_ids),
+        prior_confidence=AnnotatorConfidence(*survey.get_default_annotator_quality()),
+    )
+    save_snapshot(
+        survey,
+        mark,
+        item_ids,
+        result.scores,
+        annotator_ids,
+        result.confidences,
+        labeled_annotators(history.annotators, len(annotator_ids)),
+        len(history.winners),
+        chunk_size,
+    )
+    return result
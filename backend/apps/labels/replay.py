@@ -0,0 +1,63 @@
+import numpy as np
+from apps.crowd_bt.constants import MU, SIGMA_SQUARED
+from apps.crowd_bt.replay import replay
+from apps.crowd_bt.types import (
+    AnnotatorConfidence,
+    AnnotatorConfidences,
+    RelevanceScores,
+)
+from apps.surveys.models import Survey
+from .history import (
+    CHUNK_SIZE,
+    history_labels,
+    iter_label_chunks,
+    labeled_annotators,
+    survey_index,
+)
+from .snapshot import label_mark, save_snapshot
+
+
+def replay_survey(survey: Survey, chunk_size: int = CHUNK_SIZE) -> int:
+    """Replay survey
+
+    Rebuilds every item's score and every annotator's confidence of the survey by
+    replaying all of its labels, in the order they were created, from the initial
+    scores and the survey's default annotator quality, and saves them along with
+    the labels recorded meanwhile, see `snapshot`. Annotators without labels keep
+    their confidence. The labels pending to be scored are marked as processed.
+    Returns the number of labels replayed
+    """
+    mark = label_mark(survey)
+    item_ids, annotator_ids = survey_index(survey)
+    default_confidence = AnnotatorConfidence(*survey.get_default_annotator_quality())
+    scores = RelevanceScores(
+        np.full(len(item_ids), MU), np.full(len(item_ids), SIGMA_SQUARED)
+    )
+    confidences = AnnotatorConfidences(
+        np.full(len(annotator_ids), default_confidence.alpha, dtype=np.float64),
+        np.full(len(annotator_ids), default_confidence.beta, dtype=np.float64),
+    )
+    labeled = np.zeros(len(annotator_ids), dtype=bool)
+
+    replayed = 0
+    for chunk in iter_label_chunks(
+        history_labels(survey, mark).order_by("datetime", "id"),
+        item_ids,
+        annotator_ids,
+        chunk_size,
+    ):
+        replay(scores, confidences, *chunk, default_confidence=default_confidence)
+        labeled |= labeled_annotators(chunk.annotators, len(annotator_ids))
+        replayed += len(chunk.winners)
+
+    return replayed + save_snapshot(
+        survey,
+        mark,
+        item_ids,
+        scores,
+        annotator_ids,
+        confidences,
+        labeled,
+        replayed,
+        chunk_size,
+    )
@@ -0,0 +1,46 @@
+from rest_framework import serializers
+from backend.mixins.prefetch import PrefetchMixin
+from backend.mixins.queryfields import QueryFieldsMixin
+from backend.fields import NestedURLField
+from apps.surveys.fields import SurveyURL, SurveyHyperlinkedRelatedField
+from .models import Label
+
+
+class LabelSerializer(
+    PrefetchMixin, QueryFieldsMixin, serializers.HyperlinkedModelSerializer
+):
+
+    id = serializers.IntegerField(read_only=True, label="This resource's ID")
+    url = NestedURLField(view_name="api:label-detail", lookup_field="id")
+
+    survey = SurveyURL()
+
+    annotator = SurveyHyperlinkedRelatedField(
+        label="Annotator's URL", view_name="api:annotator-detail",
+    )
+    winner = SurveyHyperlinkedRelatedField(
+        label="Winner item's URL", view_name="api:item-detail",
+    )
+    loser = SurveyHyperlinkedRelatedField(
+        label="Loser item's URL", view_name="api:item-detail",
+    )
+
+    class Meta:
+        model = Label
+        fields = [
+            "id",
+            "url",
+            "survey",
+            "datetime",
+            "annotator",
+            "winner",
+            "loser",
+            "processed",
+        ]
+        read_only_fields = fields
+        select_related_fields = [
+            "survey",
+            "annotator__survey",
+            "winner__survey",
+            "loser__survey",
+        ]
@@ -0,0 +1,113 @@
+"""Label snapshots
+
+Refits and replays compute the scores of a survey from a snapshot of its labels,
+every label up to a mark, without holding any lock. The labels recorded since
+are then replayed on top of the result, which is saved while votes wait for the
+survey's labels lock (see `locks`), so votes are only blocked for that last step
+and none of their labels or scores is lost.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from apps.crowd_bt.constants import MU, SIGMA_SQUARED
+from apps.crowd_bt.replay import replay
+from apps.crowd_bt.types import (
+    AnnotatorConfidence,
+    AnnotatorConfidences,
+    RelevanceScores,
+)
+from apps.surveys.models import Survey
+from apps.surveys.versions import bump_score_version
+from .history import (
+    CHUNK_SIZE,
+    iter_label_chunks,
+    labeled_annotators,
+    reindex,
+    save_state,
+    survey_index,
+)
+from .locks import lock_labels, lock_survey
+from .pending import scoring_locked, scoring_unlocked
+
+
+def label_mark(survey: Survey) -> int:
+    """Label mark
+
+    Id of the survey's last label, read while no vote is recording labels: every
+    label up to it is committed, and every later one is recorded afterwards
+    """
+    with transaction.atomic():
+        lock_labels(survey.id)
+        last_id = survey.labels.aggregate(last_id=Max("id"))["last_id"]
+    return last_id or 0
+
+
+def save_snapshot(
+    survey: Survey,
+    mark: int,
+    item_ids: np.ndarray,
+    scores: RelevanceScores,
+    annotator_ids: np.ndarray,
+    confidences: AnnotatorConfidences,
+    labeled: np.ndarray,
+    applied: int,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Save snapshot
+
+    Replays the labels recorded after `mark` on top of the scores and confidences
+    computed from the ones up to it, and saves them. Items and annotators created
+    meanwhile start from the prior, and only the annotators with labels are
+    saved, the `labeled` ones so far. Holds the survey's scoring and labels locks,
+    marks every pending label as processed and bumps the score version by the
+    labels of the snapshot (`applied`) and the ones replayed. Returns the number
+    of labels replayed
+    """
+    default_confidence = AnnotatorConfidence(*survey.get_default_annotator_quality())
+    with transaction.atomic():
+        lock_survey(survey.id)
+        lock_labels(survey.id)
+        scoring_locked(survey.id)
+        new_item_ids, new_annotator_ids = survey_index(survey)
+        scores = RelevanceScores(
+            reindex(item_ids, scores.mu, new_item_ids, MU),
+            reindex(item_ids, scores.sigma_squared, new_item_ids, SIGMA_SQUARED),
+        )
+        confidences = AnnotatorConfidences(
+            reindex(
+                annotator_ids,
+                confidences.alpha,
+                new_annotator_ids,
+                default_confidence.alpha,
+            ),
+            reindex(
+                annotator_ids,
+                confidences.beta,
+                new_annotator_ids,
+                default_confidence.beta,
+            ),
+        )
+        labeled = reindex(annotator_ids, labeled, new_annotator_ids, False)
+
+        replayed = 0
+        for chunk in iter_label_chunks(
+            survey.labels.filter(id__gt=mark).order_by("datetime", "id"),
+            new_item_ids,
+            new_annotator_ids,
+            chunk_size,
+        ):
+            replay(scores, confidences, *chunk, default_confidence=default_confidence)
+            labeled |= labeled_annotators(chunk.annotators, len(labeled))
+            replayed += len(chunk.winners)
+
+        save_state(
+            survey.id,
+            new_item_ids,
+            scores,
+            new_annotator_ids[labeled],
+            AnnotatorConfidences(confidences.alpha[labeled], confidences.beta[labeled]),
+        )
+        survey.labels.filter(processed=False).update(processed=True)
+        bump_score_version(survey.id, applied + replayed)
+    scoring_unlocked(survey.id)
+    return replayed
@@ -0,0 +1,47 @@
+from celery import shared_task
+
+
+@shared_task
+def refit_survey_scores(survey_id: int) -> None:
+    from apps.surveys.models import Survey
+    from .refit import refit_survey
+
+    try:
+        survey: Survey = Survey.objects.get(id=survey_id)
+        refit_survey(survey)
+    except Survey.DoesNotExist:
+        pass
+
+
+@shared_task
+def refit_all_surveys() -> None:
+    from apps.surveys.models import Survey
+
+    for survey_id in Survey.objects.filter(active=True).values_list("id", flat=True):
+        refit_survey_scores.delay(survey_id)
+
+
+@shared_task
+def replay_survey_labels(survey_id: int) -> None:
+    from apps.surveys.models import Survey
+    from .replay import replay_survey
+
+    try:
+        survey: Survey = Survey.objects.get(id=survey_id)
+        replay_survey(survey)
+    except Survey.DoesNotExist:
+        pass
+
+
+@shared_task
+def score_survey_labels(survey_id: int) -> None:
+    from apps.surveys.models import Survey
+    from .pending import score_pending_labels, start_scoring
+
+    start_scoring(survey_id)
+    try:
+        survey: Survey = Survey.objects.get(id=survey_id)
+    except Survey.DoesNotExist:
+        return
+    # If another worker holds the survey, it schedules another run once done
+    score_pending_labels(survey)
@@ -1,3 +1,247 @@
+import csv
+from io import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from apps.annotators.models import Annotator
+from apps.items.models import Item
+from apps.surveys.models import Survey
+from .models import Label
+from .pending import (
+    schedule_scoring,
+    score_pending_labels,
+    scoring_unlocked,
+    start_scoring,
+    waiting_key,
+)
+from . import refit as refit_module
+from .refit import refit_survey
+from . import replay as replay_module
+from .replay import replay_survey
 
-# Create your tests here.
+
+class RefitTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner)
+        self.items = [
+            Item.objects.create(name=f"item {i}", survey=self.survey) for i in range(4)
+        ]
+        self.annotator = Annotator.objects.create(survey=self.survey, name="annotator")
+        # Every item beats the ones after it
+        for _ in range(3):
+            for i, winner in enumerate(self.items):
+                for loser in self.items[i + 1 :]:
+                    Label.create_label(self.annotator, winner, loser)
+
+    def test_refit_survey(self):
+        result = refit_survey(self.survey, chunk_size=4)
+        self.assertTrue(result.converged)
+        ranking = list(self.survey.items.order_by("-mu"))
+        self.assertEqual(ranking, self.items)
+        self.assertTrue(all(item.sigma_squared < 1 for item in ranking))
+        self.annotator.refresh_from_db()
+        self.assertGreater(self.annotator.alpha, 10)
+
+    def test_refit_keeps_votes_recorded_meanwhile(self):
+        idle = Annotator.objects.create(
+            survey=self.survey, name="idle", alpha=3, beta=2
+        )
+        refit = refit_module.refit
+
+        def vote_and_refit(*args, **kwargs):
+            # A vote recorded while the scores are refitted
+            annotator = Annotator.objects.get(id=self.annotator.id)
+            annotator.previous, annotator.current = self.items[3], self.items[0]
+            annotator.vote(current_wins=False)
+            return refit(*args, **kwargs)
+
+        with patch.object(refit_module, "refit", side_effect=vote_and_refit):
+            result = refit_survey(self.survey, chunk_size=4)
+
+        # The refit of the labels before the vote, with the vote on top
+        self.assertEqual(self.survey.labels.count(), 19)
+        for position, item in enumerate(self.items):
+            item.refresh_from_db()
+            changed = (item.mu, item.sigma_squared) != (
+                result.scores.mu[position],
+                result.scores.sigma_squared[position],
+            )
+            self.assertEqual(changed, position in (0, 3))
+        idle.refresh_from_db()
+        self.assertEqual((idle.alpha, idle.beta), (3, 2))
+
+    def test_refit_command(self):
+        out = StringIO()
+        call_command("refit_scores", self.survey.uuid, stdout=out)
+        self.assertIn("converged", out.getvalue())
+        self.assertEqual(list(self.survey.items.order_by("-mu")), self.items)
+
+
+class ReplayTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner, min_views=0)
+        for i in range(5):
+            Item.objects.create(name=f"item {i}", survey=self.survey)
+        annotators = [
+            Annotator.create_annotator(survey=self.survey, name=f"annotator {i}")
+            for i in range(2)
+        ]
+        # Annotators are reloaded before each vote, like every vote request does
+        for i in range(8):
+            for annotator in annotators:
+                Annotator.objects.get(id=annotator.id).vote(current_wins=i % 3 != 0)
+
+    def state(self):
+        items = list(
+            self.survey.items.order_by("id").values_list("mu", "sigma_squared")
+        )
+        annotators = list(
+            self.survey.annotators.order_by("id").values_list("alpha", "beta")
+        )
+        return items + annotators
+
+    def test_replay_rebuilds_state(self):
+        expected = self.state()
+        self.survey.items.update(mu=5, sigma_squared=3)
+        self.survey.annotators.update(alpha=1, beta=1)
+
+        replayed = replay_survey(self.survey, chunk_size=3)
+
+        self.assertEqual(replayed, self.survey.labels.count())
+        for values, expected_values in zip(self.state(), expected):
+            for value, expected_value in zip(values, expected_values):
+                self.assertAlmostEqual(value, expected_value)
+
+    def test_replay_keeps_votes_recorded_meanwhile(self):
+        annotator = self.survey.annotators.first()
+        replay = replay_module.replay
+        calls = []
+
+        def vote_and_replay(*args, **kwargs):
+            # A vote recorded while the labels are replayed
+            if not calls:
+                Annotator.objects.get(id=annotator.id).vote(current_wins=True)
+            calls.append(True)
+            return replay(*args, **kwargs)
+
+        with patch.object(replay_module, "replay", side_effect=vote_and_replay):
+            replayed = replay_survey(self.survey, chunk_size=3)
+        expected = self.state()
+
+        self.assertEqual(replayed, self.survey.labels.count())
+        replay_survey(self.survey)
+        for values, expected_values in zip(self.state(), expected):
+            for value, expected_value in zip(values, expected_values):
+                self.assertAlmostEqual(value, expected_value)
+
+
+class AsyncScoringTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey", owner=owner, min_views=0, async_scoring=True
+        )
+        for i in range(5):
+            Item.objects.create(name=f"item {i}", survey=self.survey)
+        self.annotators = [
+            Annotator.create_annotator(survey=self.survey, name=f"annotator {i}")
+            for i in range(2)
+        ]
+
+    def vote(self, votes):
+        for i in range(votes):
+            for annotator in self.annotators:
+                Annotator.objects.get(id=annotator.id).vote(current_wins=i % 3 != 0)
+
+    def state(self):
+        return ReplayTestCase.state(self)
+
+    def test_vote_only_records_label(self):
+        expected = self.state()
+        self.vote(4)
+        self.assertEqual(self.state(), expected)
+        self.assertEqual(self.survey.labels.filter(processed=False).count(), 6)
+
+    def test_score_pending_labels_matches_replay(self):
+        self.vote(6)
+        pending = self.survey.labels.filter(processed=False).count()
+
+        self.assertEqual(score_pending_labels(self.survey, batch_size=3), pending)
+        self.assertFalse(self.survey.labels.filter(processed=False).exists())
+        self.assertEqual(score_pending_labels(self.survey), 0)
+
+        expected = self.state()
+        replay_survey(self.survey)
+        for values, expected_values in zip(self.state(), expected):
+            for value, expected_value in zip(values, expected_values):
+                self.assertAlmostEqual(value, expected_value)
+
+    @patch("apps.labels.tasks.score_survey_labels.delay")
+    def test_one_scoring_task_per_survey(self, delay):
+        cache.clear()
+        schedule_scoring(self.survey.id)
+        schedule_scoring(self.survey.id)
+        self.assertEqual(delay.call_count, 1)
+        start_scoring(self.survey.id)
+        schedule_scoring(self.survey.id)
+        self.assertEqual(delay.call_count, 2)
+
+        # A worker that found the survey locked is run again once it is released
+        start_scoring(self.survey.id)
+        scoring_unlocked(self.survey.id)
+        self.assertEqual(delay.call_count, 2)
+        cache.set(waiting_key(self.survey.id), True)
+        scoring_unlocked(self.survey.id)
+        self.assertEqual(delay.call_count, 3)
+
+    def test_replay_processes_pending_labels(self):
+        self.vote(3)
+        replay_survey(self.survey)
+        self.assertFalse(self.survey.labels.filter(processed=False).exists())
+
+
+class LabelViewsetTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner, min_views=0)
+        for i in range(4):
+            Item.objects.create(name=f"item {i}", survey=self.survey)
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        for i in range(3):
+            Annotator.objects.get(id=annotator.id).vote(current_wins=i % 2 == 0)
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+
+    def test_list(self):
+        response = self.client.get(
+            reverse("api:label-list", kwargs={"survey_id": self.survey.uuid})
+        )
+        # The first vote has no previous item to compare to
+        self.assertEqual(response.data["count"], 2)
+        label = response.data["results"][0]
+        self.assertEqual(self.client.get(label["url"]).data, label)
+
+        other = get_user_model().objects.create_user("other", "other@votai.io")
+        self.client.force_authenticate(other)
+        response = self.client.get(
+            reverse("api:label-list", kwargs={"survey_id": self.survey.uuid})
+        )
+        self.assertEqual(response.data["count"], 0)
+
+    def test_export(self):
+        response = self.client.get(
+            reverse("api:label-export", kwargs={"survey_id": self.survey.uuid})
+        )
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(content)))
+        labels = self.survey.labels.order_by("datetime", "id")
+        self.assertEqual(
+            [(row["winner"], row["loser"]) for row in rows],
+            [(label.winner.uuid, label.loser.uuid) for label in labels],
+        )
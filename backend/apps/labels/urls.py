@@ -0,0 +1,9 @@
+from backend.router import base_router
+from backend.routers.nested import SingleInstanceNestedRouter
+from backend.router import routers
+from .viewsets import SurveyLabelViewset
+
+labels_router = SingleInstanceNestedRouter(base_router, "surveys", lookup="survey")
+labels_router.register("labels", SurveyLabelViewset)
+
+routers.append(labels_router)
@@ -0,0 +1,77 @@
+from typing import Any
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.generics import get_object_or_404
+from rest_framework.request import Request
+from rest_condition import And, Or
+from drf_yasg.utils import swagger_auto_schema
+from backend.permissions.ownership import OwnsObject
+from backend.mixins.prefetch import PrefetchQuerysetModelMixin
+from backend.mixins.queryfields import QueryFieldsMixin
+from backend.custom_types.models import QueryType
+from backend.exports import ExportQuerySerializer, export_response
+from apps.surveys.ids import get_survey_id
+from apps.surveys.models import Survey
+from .exports import LABEL_FIELDS, label_rows
+from .models import Label
+from .serializers import LabelSerializer
+
+
+class SurveyLabelViewset(
+    PrefetchQuerysetModelMixin, QueryFieldsMixin, viewsets.ReadOnlyModelViewSet,
+):
+    swagger_tags = ["Labels"]
+
+    lookup_field = "id"
+    lookup_url_kwarg = "id"
+
+    permission_classes = [
+        And(permissions.IsAuthenticated, Or(OwnsObject, permissions.IsAdminUser))
+    ]
+    ownership_field = "survey.owner"
+
+    serializer_class = LabelSerializer
+    queryset = Label.objects.all()
+
+    def get_queryset(self) -> QueryType[Label]:
+        survey_id = get_survey_id(self.kwargs.get("survey_id"))
+        qs: QueryType[Label] = (
+            super()
+            .get_queryset()
+            .filter(survey_id=survey_id)
+            .order_by("datetime", "id")
+        )
+        if not self.request.user.is_staff:
+            # Votes are only for the survey's owner, lists included
+            qs = qs.filter(survey__owner_id=self.request.user.id)
+        return qs
+
+    @swagger_auto_schema(
+        query_serializer=ExportQuerySerializer,
+        responses={
+            200: "CSV or NDJSON file",
+            403: "You don't have access to the survey",
+            404: "Survey does not exist",
+        },
+    )
+    @action(detail=False, methods=["get"])
+    def export(
+        self, request: Request, *args: Any, **kwargs: Any
+    ) -> StreamingHttpResponse:
+        """Export labels
+
+        Streams every label of the survey, from oldest to newest, as a CSV or NDJSON file, optionally gzipped. Annotators and items are identified by their IDs.
+        """
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        survey: Survey = get_object_or_404(Survey, uuid=kwargs.get("survey_id"))
+        if not request.user.is_staff and survey.owner_id != request.user.id:
+            raise PermissionDenied()
+        return export_response(
+            LABEL_FIELDS,
+            label_rows(survey.labels.all()),
+            "labels",
+            **query.validated_data
+        )
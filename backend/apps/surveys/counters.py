@@ -0,0 +1,41 @@
+"""Counters
+
+`Survey.annotator_count`, `item_count` and `label_count` are updated in the same
+transactions that create and delete annotators, items and labels, so the budget
+and gamma are computed without counting them. Writes that bypass the models,
+like queryset deletes, make them drift until they are recounted here.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from apps.annotators.models import Annotator
+from apps.items.models import Item
+from apps.labels.models import Label
+from backend.custom_types.models import QueryType
+from .models import Survey
+
+
+def repair_counts(surveys: QueryType[Survey]) -> int:
+    """Repair counts
+
+    Sets the counters of the given surveys to their number of annotators, items
+    and labels, in a single query. Returns how many surveys were wrong
+    """
+    counts = {}
+    for field, model in (
+        ("annotator_count", Annotator),
+        ("item_count", Item),
+        ("label_count", Label),
+    ):
+        count = (
+            model.objects.filter(survey_id=OuterRef("id"))
+            .order_by()
+            .values("survey_id")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        counts[field] = Coalesce(Subquery(count, output_field=IntegerField()), Value(0))
+    wrong = Q()
+    for field, count in counts.items():
+        wrong |= ~Q(**{field: count})
+    repaired: int = surveys.filter(wrong).update(**counts)
+    return repaired
@@ -0,0 +1,65 @@
+"""Survey ids
+
+Nested routes name their survey by uuid, while the tables of its annotators,
+items and labels refer to it by id. A survey's uuid and id never change, so every
+process keeps the id of the surveys it has seen instead of joining the surveys
+table on every request. Ids of deleted surveys match no rows, so entries only
+expire to bound the memory they take: expired entries, and the oldest ones beyond
+SURVEY_ID_CACHE_SIZE, are evicted whenever an id is added.
+"""
+from collections import OrderedDict
+import threading
+import time
+from typing import Optional, Tuple
+from prometheus_client import Counter
+from .models import Survey
+
+# Seconds an id is kept, at most
+SURVEY_ID_TTL = 60 * 60
+# Ids kept, at most
+SURVEY_ID_CACHE_SIZE = 10000
+
+LOOKUPS = Counter(
+    "votai_survey_id_cache_lookups", "Survey id lookups by uuid", ["result"]
+)
+
+# Ids by survey uuid, along with when they expire. Every entry has the same ttl,
+# so they are in the order they expire
+survey_ids: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+survey_ids_lock = threading.Lock()
+
+
+def get_survey_id(uuid: Optional[str]) -> Optional[int]:
+    """Get survey id
+
+    Id of the survey with the given uuid, None if there is none
+    """
+    now = time.monotonic()
+    entry = survey_ids.get(uuid) if uuid is not None else None
+    if entry is not None and entry[0] > now:
+        LOOKUPS.labels("hit").inc()
+        return entry[1]
+
+    LOOKUPS.labels("miss").inc()
+    survey_id: Optional[int] = (
+        Survey.objects.filter(uuid=uuid).values_list("id", flat=True).first()
+    )
+    if survey_id is not None:
+        with survey_ids_lock:
+            survey_ids.pop(str(uuid), None)
+            survey_ids[str(uuid)] = (now + SURVEY_ID_TTL, survey_id)
+            evict(now)
+    return survey_id
+
+
+def evict(now: float) -> None:
+    """Evict
+
+    Removes the expired ids, and the oldest ones beyond SURVEY_ID_CACHE_SIZE. Must
+    be called with survey_ids_lock held
+    """
+    while survey_ids:
+        expires, _ = next(iter(survey_ids.values()))
+        if expires > now and len(survey_ids) <= SURVEY_ID_CACHE_SIZE:
+            break
+        survey_ids.popitem(last=False)
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='max_candidates',
+            field=models.PositiveIntegerField(default=300),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0002_survey_max_candidates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='interpolate_gain',
+            field=models.BooleanField(default=False),
+        ),
+    ]
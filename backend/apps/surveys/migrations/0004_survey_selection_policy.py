@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0003_survey_interpolate_gain'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='selection_policy',
+            field=models.CharField(choices=[('eig', 'eig'), ('thompson', 'thompson'), ('uncertainty', 'uncertainty')], default='eig', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0004_survey_selection_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='async_scoring',
+            field=models.BooleanField(default=False),
+        ),
+    ]
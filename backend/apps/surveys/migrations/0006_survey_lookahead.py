@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0005_async_scoring'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='lookahead',
+            field=models.BooleanField(default=False),
+        ),
+    ]
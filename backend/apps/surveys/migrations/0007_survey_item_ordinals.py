@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0006_survey_lookahead'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='item_ordinals',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.0.5 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0007_survey_item_ordinals'),
+        ('annotators', '0003_annotator_bitmaps'),
+        ('labels', '0003_async_scoring'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='annotator_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='label_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE surveys_survey SET
+                annotator_count = (
+                    SELECT COUNT(*) FROM annotators_annotator
+                    WHERE annotators_annotator.survey_id = surveys_survey.id
+                ),
+                item_count = (
+                    SELECT COUNT(*) FROM items_item
+                    WHERE items_item.survey_id = surveys_survey.id
+                ),
+                label_count = (
+                    SELECT COUNT(*) FROM labels_label
+                    WHERE labels_label.survey_id = surveys_survey.id
+                )
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
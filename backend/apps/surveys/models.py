@@ -1,9 +1,8 @@
 from datetime import datetime
 from typing import Tuple
-from django.db import models
-from django.db.models import Count, When, Case, F, FloatField, Value
-from django.db.models.functions import Greatest, Least, Cast
-from django.db.models.functions.math import Power
+from django.db import connection, models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import JSONField
@@ -17,6 +16,7 @@ from apps.crowd_bt.constants import (
     BETA,
     TAU,
 )
+from apps.crowd_bt.policies import DEFAULT_POLICY, policy_choices
 
 
 user_model = get_user_model()
@@ -49,69 +49,86 @@ class Survey(models.Model):
     trust_annotators: bool = models.BooleanField(default=True)
     dynamic_gamma: bool = models.BooleanField(default=True)
 
+    # How many items are scored when choosing an annotator's next item. 0 scores all
+    max_candidates: int = models.PositiveIntegerField(default=300)
+    # Score candidates with interpolated lookup tables instead of the exact gain
+    interpolate_gain: bool = models.BooleanField(default=False)
+    # Votes only record labels, scores are updated by the score_survey_labels task
+    async_scoring: bool = models.BooleanField(default=False)
+    # Precompute annotators' next items for both outcomes of their next vote
+    lookahead: bool = models.BooleanField(default=False)
+    # How annotators' next items are chosen, one of crowd_bt.policies
+    selection_policy: str = models.CharField(
+        max_length=20, choices=policy_choices(), default=DEFAULT_POLICY
+    )
+    # Next Item.ordinal to give out, see `reserve_item_ordinals`
+    item_ordinals: int = models.PositiveIntegerField(default=0, editable=False)
+    # Kept up to date as annotators, items and labels are created and deleted, and
+    # recounted periodically by `repair_survey_counts`
+    annotator_count: int = models.PositiveIntegerField(default=0, editable=False)
+    item_count: int = models.PositiveIntegerField(default=0, editable=False)
+    label_count: int = models.PositiveIntegerField(default=0, editable=False)
+
     @property
     def budget(self) -> int:
         """Survey's budget
 
         Returns how many labels can be created by the annotators
         """
-        comps = self.get_self_with_computation("sql_budget")
-        budget: int = comps.sql_budget
-        return budget
+        return max(
+            self.min_budget,
+            min(self.max_budget, self.annotator_count * (self.item_count - 1)),
+        )
 
     @property
     def consumed_budget(self) -> float:
         """Consumed budget (%)
         What percentage of the budget has already been consumed?
         """
-        comps = self.get_self_with_computation("sql_budget")
-        consumed_budget: float = comps.sql_consumed_budget
-        return consumed_budget
+        budget = self.budget
+        if budget <= 0:
+            return 1.0
+        return self.label_count / budget
 
     @property
     def gamma(self) -> float:
-        comps = self.get_self_with_computation("sql_gamma")
-        gamma: float = comps.sql_gamma
-        return gamma
+        if not self.dynamic_gamma:
+            return self.base_gamma
+        return self.base_gamma / 2 ** (self.consumed_budget / self.tau)
 
     def get_default_annotator_quality(self) -> Tuple[float, float]:
         if self.trust_annotators:
             return (ALPHA, BETA)
         return (ALPHA_MALICIOUS, BETA_MALICIOUS)
 
-    def get_self_with_computation(self, field: str) -> "Survey":
-        if not getattr(self, field, False):
-            return Survey.with_sql_computations().get(id=self.id)
-        return self
-
     @classmethod
-    def with_sql_computations(cls, queryset=None):
-        if queryset is None:
-            queryset = cls.objects.all()
-        return (
-            queryset.annotate(
-                sql_budget=Greatest(
-                    "min_budget",
-                    Least(
-                        "max_budget",
-                        Count("annotators", distinct=True)
-                        * (Count("items", distinct=True) - 1),
-                    ),
-                )
-            )
-            .annotate(
-                sql_consumed_budget=(
-                    Cast(Count("labels", distinct=True), FloatField())
-                    / Cast(F("sql_budget"), FloatField())
-                )
-            )
-            .annotate(
-                sql_gamma=Case(
-                    When(dynamic_gamma=False, then=F("base_gamma")),
-                    default=(
-                        F("base_gamma")
-                        / Power(Value("2"), F("sql_consumed_budget") / F("tau"))
-                    ),
-                )
+    def reserve_item_ordinals(cls, survey_id: int, count: int = 1) -> int:
+        """Reserve item ordinals
+
+        Reserves `count` consecutive item ordinals of the survey in a single
+        update, so concurrent reservations never overlap, and counts the new items.
+        Returns the first one
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {cls._meta.db_table} SET item_ordinals = item_ordinals + %s, "
+                "item_count = item_count + %s WHERE id = %s RETURNING item_ordinals",
+                [count, count, survey_id],
             )
+            end: int = cursor.fetchone()[0]
+        return end - count
+
+    @classmethod
+    def update_counts(cls, survey_id: int, **deltas: int) -> None:
+        """Update counts
+
+        Adds the deltas to the survey's counters (annotator_count, item_count or
+        label_count) in a single update. They never go below 0, as they may have
+        drifted until the next recount
+        """
+        cls.objects.filter(id=survey_id).update(
+            **{
+                field: Greatest(F(field) + delta, Value(0))
+                for field, delta in deltas.items()
+            }
         )
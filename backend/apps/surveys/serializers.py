@@ -75,6 +75,9 @@ class SurveySerializer(
             "max_items",
             "max_budget",
             "min_budget",
+            "annotator_count",
+            "item_count",
+            "label_count",
             "budget",
             "consumed_budget",
             "base_gamma",
@@ -83,6 +86,11 @@ class SurveySerializer(
             "tau",
             "trust_annotators",
             "dynamic_gamma",
+            "max_candidates",
+            "interpolate_gain",
+            "selection_policy",
+            "async_scoring",
+            "lookahead",
         ]
         read_only_fields = [
             "created",
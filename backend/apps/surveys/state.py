@@ -0,0 +1,293 @@
+"""Survey state
+
+In-memory state of a survey's items as contiguous NumPy arrays, one entry per item
+at its dense index (the position of its id in the sorted array of ids). Scoring
+code can run against it without going through one model instance per item.
+"""
+from typing import Iterable, Optional
+import numpy as np
+from django.db import transaction
+from apps.crowd_bt import online, replay, vectorized
+from apps.crowd_bt.policies import SelectionContext, get_policy
+from apps.crowd_bt.types import (
+    AnnotatorConfidence,
+    AnnotatorConfidences,
+    RelevanceScore,
+    RelevanceScores,
+)
+from apps.annotators.bitmaps import Bits, contains
+from apps.items import leaderboard
+from apps.items.models import Item
+from backend.custom_types.models import QueryType
+from .models import Survey
+from .versions import bump_score_version
+
+UPDATE_BATCH_SIZE = 1000
+
+
+def smallest(values: np.ndarray, size: int) -> np.ndarray:
+    """Smallest
+
+    Positions of the `size` smallest values, in no particular order
+    """
+    if size <= 0:
+        return np.empty(0, dtype=np.int64)
+    if size >= len(values):
+        return np.arange(len(values))
+    return np.argpartition(values, size - 1)[:size]
+
+
+class SurveyState:
+    """Survey State
+
+    Item arrays of a survey: ids, mu, sigma_squared, active, prioritized,
+    view_count and ordinals. Votes update mu and sigma_squared in place, `save` writes them back
+    """
+
+    def __init__(
+        self,
+        survey: Survey,
+        ids: np.ndarray,
+        mu: np.ndarray,
+        sigma_squared: np.ndarray,
+        active: np.ndarray,
+        prioritized: np.ndarray,
+        view_count: np.ndarray,
+        ordinals: np.ndarray,
+    ) -> None:
+        self.survey = survey
+        self.ids = ids
+        self.mu = mu
+        self.sigma_squared = sigma_squared
+        self.active = active
+        self.prioritized = prioritized
+        self.view_count = view_count
+        self.ordinals = ordinals
+        # Labels applied since the last `save`, for the survey's score version
+        self.updates = 0
+
+    @classmethod
+    def load(
+        cls, survey: Survey, items: Optional[QueryType[Item]] = None
+    ) -> "SurveyState":
+        """Load
+
+        Reads the state of every item of the survey, or only of `items`, in a
+        single query
+        """
+        if items is None:
+            items = survey.items.all()
+        rows = list(
+            items.order_by("id").values_list(
+                "id",
+                "mu",
+                "sigma_squared",
+                "active",
+                "prioritized",
+                "view_count",
+                "ordinal",
+            )
+        )
+        ids, mu, sigma_squared, active, prioritized, view_count, ordinals = (
+            zip(*rows) if rows else ((),) * 7
+        )
+        return cls(
+            survey,
+            np.array(ids, dtype=np.int64),
+            np.array(mu, dtype=np.float64),
+            np.array(sigma_squared, dtype=np.float64),
+            np.array(active, dtype=bool),
+            np.array(prioritized, dtype=bool),
+            np.array(view_count, dtype=np.int64),
+            np.array(ordinals, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def scores(self) -> RelevanceScores:
+        """Scores
+
+        Scores of every item. The arrays are not copied, so they can be updated in place
+        """
+        return RelevanceScores(self.mu, self.sigma_squared)
+
+    def score(self, index: int) -> RelevanceScore:
+        return RelevanceScore(float(self.mu[index]), float(self.sigma_squared[index]))
+
+    def index(self, item_ids: Iterable[int]) -> np.ndarray:
+        """Index
+
+        Dense index of each item id. Ids of other surveys' items are mapped to -1
+        """
+        item_ids = np.fromiter(item_ids, dtype=np.int64)
+        if not len(self.ids):  # pylint: disable=len-as-condition
+            return np.full(len(item_ids), -1)
+        positions = np.minimum(np.searchsorted(self.ids, item_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == item_ids, positions, -1)
+
+    def mask(self, item_ids: Iterable[int]) -> np.ndarray:
+        """Mask
+
+        Boolean array that is only True at the given items
+        """
+        indexes = self.index(item_ids)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[indexes[indexes >= 0]] = True
+        return mask
+
+    def bitmap_mask(self, bits: Bits) -> np.ndarray:
+        """Bitmap mask
+
+        Boolean array that is only True at the items set in the bitmap
+        """
+        return contains(bits, self.ordinals)
+
+    def options(self, excluded: Optional[np.ndarray] = None) -> np.ndarray:
+        """Options
+
+        Boolean mask of the items an annotator can be shown, following the same
+        rules as `Annotator.choose_next`: inactive items that are not `excluded`,
+        narrowed down to the prioritized ones and then to those with less than
+        `min_views` views, whenever there are any
+        """
+        options = ~self.active
+        if excluded is not None:
+            options &= ~excluded
+        for narrowed in (
+            options & self.prioritized,
+            options & (self.view_count < self.survey.min_views),
+        ):
+            if narrowed.any():
+                options = narrowed
+        return options
+
+    def shortlist(self, options: np.ndarray, current: int, size: int) -> np.ndarray:
+        """Shortlist
+
+        At most `size` of the `options` dense indexes, split like
+        `candidates.shortlist` between the closest to the current item's μ, the most
+        uncertain and random ones. A size of 0 returns every option
+        """
+        if size <= 0 or len(options) <= size:
+            return options
+        share = size // 3
+        near = share // 2
+        mu = self.mu[options]
+        above = np.flatnonzero(mu >= self.mu[current])
+        below = np.flatnonzero(mu < self.mu[current])
+        parts = [
+            above[smallest(mu[above], share - near)],
+            below[smallest(-mu[below], near)],
+            smallest(-self.sigma_squared[options], share),
+            np.random.choice(len(options), size - 2 * share, replace=False),
+        ]
+        return options[np.unique(np.concatenate(parts))]
+
+    def choose_next(
+        self,
+        current: Optional[int],
+        confidence: AnnotatorConfidence,
+        excluded: Optional[np.ndarray] = None,
+    ) -> Optional[int]:
+        """Choose next
+
+        Dense index of the next item for an annotator whose current item is at
+        `current`, picking the shortlisted option that is best for the survey's
+        selection policy (or a random one with probability epsilon). Returns None if
+        there are no options
+        """
+        options = np.flatnonzero(self.options(excluded))
+        if not len(options):  # pylint: disable=len-as-condition
+            return None
+        if current is None or np.random.random() < self.survey.epsilon:
+            return int(options[np.random.randint(len(options))])
+
+        options = self.shortlist(options, current, self.survey.max_candidates)
+        policy = get_policy(self.survey.selection_policy)
+        scores = policy(
+            RelevanceScores(self.mu[options], self.sigma_squared[options]),
+            SelectionContext(
+                self.score(current),
+                confidence,
+                gamma=self.survey.gamma,
+                interpolate=self.survey.interpolate_gain,
+            ),
+        )
+        return int(options[vectorized.random_argmax(scores)])
+
+    def vote(
+        self, winner: int, loser: int, confidence: AnnotatorConfidence
+    ) -> AnnotatorConfidence:
+        """Vote
+
+        Applies a label in place, just like `Annotator.bt_update`, and returns the
+        annotator's updated confidence
+        """
+        new_confidence, _ = online.update_annotator(
+            self.score(winner), self.score(loser), confidence
+        )
+        new_winner, new_loser = online.update_scores(
+            self.score(winner), self.score(loser), new_confidence
+        )
+        self.mu[[winner, loser]] = new_winner.mu, new_loser.mu
+        self.sigma_squared[[winner, loser]] = (
+            new_winner.sigma_squared,
+            new_loser.sigma_squared,
+        )
+        self.updates += 1
+        return new_confidence
+
+    def view(self, index: int) -> None:
+        """View
+
+        Records that an item was shown to an annotator, like `Annotator.update_items`
+        """
+        self.view_count[index] += 1
+        self.prioritized[index] = False
+
+    def replay(
+        self,
+        confidences: AnnotatorConfidences,
+        winners: np.ndarray,
+        losers: np.ndarray,
+        annotators: np.ndarray,
+        default_confidence: AnnotatorConfidence,
+    ) -> None:
+        """Replay
+
+        Applies a batch of labels in place with `crowd_bt.replay.replay`
+        """
+        replay.replay(
+            self.scores, confidences, winners, losers, annotators, default_confidence
+        )
+        self.updates += len(winners)
+
+    def ranking(self) -> np.ndarray:
+        """Ranking
+
+        Dense indexes of the items sorted by decreasing μ
+        """
+        return np.argsort(-self.mu, kind="stable")
+
+    def save(self) -> None:
+        """Save
+
+        Writes every item's score back to the database with bulk updates, and to
+        the leaderboard, and bumps the survey's score version by the labels applied
+        since the last save (at least one)
+        """
+        items = [
+            Item(id=item_id, mu=mu, sigma_squared=sigma_squared)
+            for item_id, mu, sigma_squared in zip(
+                self.ids.tolist(), self.mu.tolist(), self.sigma_squared.tolist()
+            )
+        ]
+        with transaction.atomic():
+            Item.objects.bulk_update(
+                items, ["mu", "sigma_squared"], batch_size=UPDATE_BATCH_SIZE
+            )
+            leaderboard.update(self.survey.id, zip(self.ids.tolist(), self.mu.tolist()))
+            bump_score_version(self.survey.id, max(self.updates, 1))
+        self.updates = 0
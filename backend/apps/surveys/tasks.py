@@ -0,0 +1,10 @@
+from celery import shared_task
+
+
+@shared_task
+def repair_survey_counts() -> int:
+    from .counters import repair_counts
+    from .models import Survey
+
+    repaired: int = repair_counts(Survey.objects.all())
+    return repaired
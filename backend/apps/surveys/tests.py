@@ -1,3 +1,157 @@
+import time
+from unittest.mock import patch
+import numpy as np
+from django.contrib.auth import get_user_model
+from prometheus_client import REGISTRY
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from apps.annotators.models import Annotator
+from apps.items.models import Item
+from apps.labels.models import Label
+from . import ids
+from .counters import repair_counts
+from .models import Survey
+from .state import SurveyState
+from .versions import get_score_version
 
-# Create your tests here.
+
+class SurveyStateTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey", owner=owner, epsilon=0, min_views=0
+        )
+        self.items = [
+            Item.objects.create(
+                name=f"item {i}", survey=self.survey, mu=i / 4, sigma_squared=1 + i / 3
+            )
+            for i in range(8)
+        ]
+
+    def test_load(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        with self.assertNumQueries(1):
+            state = SurveyState.load(self.survey)
+        self.assertEqual(state.ids.tolist(), [item.id for item in self.items])
+        np.testing.assert_allclose(state.mu, [item.mu for item in self.items])
+        current = state.index([annotator.current.id])[0]
+        self.assertEqual(state.view_count[current], 1)
+        self.assertEqual(state.view_count.sum(), 1)
+        self.assertEqual(state.index([-1]).tolist(), [-1])
+
+    def test_choose_next_matches_annotator(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        annotator.refresh_from_db()
+        state = SurveyState.load(self.survey)
+        excluded = state.bitmap_mask(annotator.viewed_bits)
+        current = state.index([annotator.current.id])[0]
+        chosen = state.choose_next(current, annotator.confidence, excluded)
+        self.assertEqual(state.ids[chosen], annotator.choose_next().id)
+
+    def test_options(self):
+        state = SurveyState.load(self.survey)
+        state.active[0] = True
+        state.prioritized[[1, 2]] = True
+        self.assertEqual(np.flatnonzero(state.options()).tolist(), [1, 2])
+        excluded = state.mask([self.items[1].id, self.items[2].id])
+        self.assertEqual(
+            np.flatnonzero(state.options(excluded)).tolist(), [3, 4, 5, 6, 7]
+        )
+
+    def test_vote_matches_bt_update(self):
+        annotator = Annotator.create_annotator(survey=self.survey, name="annotator")
+        state = SurveyState.load(self.survey)
+        confidence = state.vote(3, 5, annotator.confidence)
+        annotator.bt_update(self.items[3], self.items[5])
+        self.assertAlmostEqual(confidence.alpha, annotator.alpha)
+        self.assertAlmostEqual(confidence.beta, annotator.beta)
+
+        version = get_score_version(self.survey.id)
+        state.save()
+        self.assertEqual(get_score_version(self.survey.id), version + 1)
+        for index in (3, 5):
+            item = Item.objects.get(id=self.items[index].id)
+            self.assertAlmostEqual(item.mu, self.items[index].mu)
+            self.assertAlmostEqual(item.sigma_squared, self.items[index].sigma_squared)
+
+
+class SurveyCountsTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(
+            name="survey", owner=owner, min_budget=0, max_budget=100, tau=0.5
+        )
+        self.items = [
+            Item.objects.create(name=f"item {i}", survey=self.survey) for i in range(5)
+        ]
+        self.annotator = Annotator.create_annotator(
+            survey=self.survey, name="annotator"
+        )
+        for _ in range(3):
+            self.annotator.vote(current_wins=True)
+
+    def counts(self):
+        survey = Survey.objects.get(id=self.survey.id)
+        return survey.annotator_count, survey.item_count, survey.label_count
+
+    def test_counts(self):
+        self.assertEqual(self.counts(), (1, 5, 2))
+        survey = Survey.objects.get(id=self.survey.id)
+        self.assertEqual(survey.budget, 4)
+        self.assertEqual(survey.consumed_budget, 0.5)
+        self.assertAlmostEqual(survey.gamma, survey.base_gamma / 2)
+
+        Label.objects.first().winner.delete()
+        self.annotator.delete()
+        self.assertEqual(self.counts(), (0, 4, Label.objects.count()))
+
+    def test_retrieve_loads_survey_once(self):
+        client = APIClient()
+        client.force_authenticate(self.survey.owner)
+        url = reverse("api:survey-detail", kwargs={"id": self.survey.uuid})
+        with self.assertNumQueries(1):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["label_count"], 2)
+        self.assertEqual(response.data["consumed_budget"], 0.5)
+
+    def test_repair_counts(self):
+        Survey.objects.update(annotator_count=7, item_count=0, label_count=0)
+        self.assertEqual(repair_counts(Survey.objects.all()), 1)
+        self.assertEqual(self.counts(), (1, 5, 2))
+        self.assertEqual(repair_counts(Survey.objects.all()), 0)
+
+
+class SurveyIdsTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user("owner", "owner@votai.io")
+        self.survey = Survey.objects.create(name="survey", owner=owner)
+
+    def lookups(self, result):
+        return REGISTRY.get_sample_value(
+            "votai_survey_id_cache_lookups_total", {"result": result}
+        )
+
+    def test_get_survey_id(self):
+        hits, misses = self.lookups("hit") or 0, self.lookups("miss") or 0
+        self.assertEqual(ids.get_survey_id(self.survey.uuid), self.survey.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(ids.get_survey_id(self.survey.uuid), self.survey.id)
+        self.assertEqual(self.lookups("hit"), hits + 1)
+        self.assertEqual(self.lookups("miss"), misses + 1)
+        self.assertIsNone(ids.get_survey_id("missing"))
+
+    def test_survey_ids_are_evicted(self):
+        ids.survey_ids.clear()
+        ids.survey_ids["expired"] = (time.monotonic() - 1, 0)
+        surveys = [self.survey] + [
+            Survey.objects.create(name=f"survey {i}", owner=self.survey.owner)
+            for i in range(2)
+        ]
+        with patch.object(ids, "SURVEY_ID_CACHE_SIZE", 2):
+            for survey in surveys:
+                ids.get_survey_id(survey.uuid)
+        self.assertEqual(
+            list(ids.survey_ids), [str(survey.uuid) for survey in surveys[1:]]
+        )
@@ -0,0 +1,43 @@
+"""Score versions
+
+Every survey has a score version, a counter of how many score updates its items
+went through (adding, editing or deleting items counts as one too). Anything derived from the scores can be cached along with the
+version it was computed at, and the difference with the current version tells
+how far the scores moved since then.
+
+The counter lives in the cache rather than in the survey row, so votes do not
+contend for the survey's row lock to bump it. If the cache is flushed it restarts
+from 0, which makes every stamped value look as if it came from the future: those
+must be treated as stale.
+"""
+from django.core.cache import cache
+
+
+def score_version_key(survey_id: int) -> str:
+    return f"surveys:{survey_id}:score_version"
+
+
+def get_score_version(survey_id: int) -> int:
+    version: int = cache.get(score_version_key(survey_id), 0)
+    return version
+
+
+def bump_score_version(survey_id: int, updates: int = 1) -> int:
+    """Bump score version
+
+    Records that `updates` labels were applied to the survey's scores. Returns the
+    new version
+    """
+    key = score_version_key(survey_id)
+    cache.add(key, 0, timeout=None)
+    version: int = cache.incr(key, updates)
+    return version
+
+
+def is_fresh(survey_id: int, version: int, tolerance: int) -> bool:
+    """Is fresh
+
+    Whether at most `tolerance` score updates happened since `version`. Versions
+    ahead of the current one (stamped before the counter was reset) are not fresh
+    """
+    return 0 <= get_score_version(survey_id) - version <= tolerance
@@ -8,12 +8,15 @@ from drf_yasg import openapi
 from rest_condition import Or, And
 from backend.permissions.ownership import OwnsObject
 from backend.mixins.prefetch import PrefetchQuerysetModelMixin
+from backend.mixins.shared_object import SharedObjectMixin
 from backend.custom_types.models import QueryType
 from .serializers import SurveySerializer
 from .models import Survey
 
 
-class SurveyViewset(PrefetchQuerysetModelMixin, viewsets.ModelViewSet):
+class SurveyViewset(
+    SharedObjectMixin, PrefetchQuerysetModelMixin, viewsets.ModelViewSet
+):
     """Survey Endpoint
 
     Allows creating, listing and editing surveys
@@ -30,7 +33,7 @@ class SurveyViewset(PrefetchQuerysetModelMixin, viewsets.ModelViewSet):
     ownership_field = "owner"
 
     serializer_class = SurveySerializer
-    queryset = Survey.with_sql_computations()
+    queryset = Survey.objects.all()
 
     def get_queryset(self) -> QueryType[Survey]:
         qs: QueryType[Survey] = super().get_queryset()
@@ -3,6 +3,7 @@ from .router import routers
 import apps.surveys.urls  # pylint: disable=unused-import, wrong-import-order
 import apps.items.urls  # pylint: disable=unused-import, wrong-import-order
 import apps.annotators.urls  # pylint: disable=unused-import, wrong-import-order
+import apps.labels.urls  # pylint: disable=unused-import, wrong-import-order
 
 
 app_name = "api"
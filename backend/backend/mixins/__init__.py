@@ -1,2 +1,3 @@
 from .prefetch import PrefetchMixin, PrefetchQuerysetModelMixin
 from .queryfields import QueryFieldsMixin, QueryFieldsPermissionMixin
+from .shared_object import SharedObjectMixin
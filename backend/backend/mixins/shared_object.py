@@ -0,0 +1,26 @@
+from typing import Any
+
+
+class SharedObjectMixin:
+    """Loads a detail view's object once per request
+
+    Permissions that have to fetch the object before the view runs, like
+    OwnsObject, hand it over with `share_object`, and `get_object` returns that
+    same instance instead of querying it again. The action, the model methods and
+    the serializers then all work on a single copy of the object and of the rows
+    loaded along with it, e.g. an annotator's survey and its counters.
+
+    Should be used on viewsets and views, before the generic view classes
+    """
+
+    shared_object: Any = None
+
+    def share_object(self, obj: Any) -> None:
+        self.shared_object = obj
+
+    def get_object(self) -> Any:
+        if self.shared_object is None:
+            self.shared_object = super().get_object()  # type: ignore
+        else:
+            self.check_object_permissions(self.request, self.shared_object)  # type: ignore
+        return self.shared_object
@@ -26,10 +26,14 @@ class OwnsObject(permissions.BasePermission):
         except ValueError:
             return False
         user_relation = getattr(view, "user_relation", "user")
-        obj_field = obj_qs.first()
+        obj = obj_field = obj_qs.first()
         for field in ownership_field.split("."):
             obj_field = getattr(obj_field, field, None)
         u_rel = request
         for field in user_relation.split("."):
             u_rel = getattr(u_rel, field, None)
-        return obj_field == u_rel and obj_field is not None
+        owns = obj_field == u_rel and obj_field is not None
+        if owns and hasattr(view, "share_object"):
+            # So the view does not fetch the object again, see SharedObjectMixin
+            view.share_object(obj)
+        return owns
@@ -190,6 +190,26 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 # Celery
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
+# Seconds between sweeps of the active items whose time ran out
+ITEM_SWEEP_INTERVAL = 10
+# Seconds between recounts of the surveys' annotators, items and labels
+SURVEY_RECOUNT_INTERVAL = 60 * 60
+# Seconds between checks of the surveys' leaderboards against the database
+LEADERBOARD_CHECK_INTERVAL = 60 * 60
+CELERY_BEAT_SCHEDULE = {
+    "deactivate-expired-items": {
+        "task": "apps.items.tasks.deactivate_expired_items",
+        "schedule": ITEM_SWEEP_INTERVAL,
+    },
+    "repair-survey-counts": {
+        "task": "apps.surveys.tasks.repair_survey_counts",
+        "schedule": SURVEY_RECOUNT_INTERVAL,
+    },
+    "check-leaderboards": {
+        "task": "apps.items.tasks.check_leaderboards",
+        "schedule": LEADERBOARD_CHECK_INTERVAL,
+    },
+}
 
 # Django Prometheus
 PROMETHEUS_EXPORT_MIGRATIONS = False